@@ -0,0 +1,189 @@
+import marshal
+from typing import Any, Callable, Dict, List, Tuple, Type
+
+from common.data.representable import _DATA_TYPES, RepresentableData
+
+# data encoded by another codec version is not decoded; bump when the format changes.
+CODEC_VERSION = 1
+
+# marshal format of dumps(); object references (version 3+) keep shared data shared.
+_MARSHAL_VERSION = 4
+
+_PLAIN_TYPES = frozenset({str, int, float, bool, type(None), bytes})
+
+# tags of encoded tuples and sets; data is tagged with the qualified name of its class.
+_TUPLE = "tuple"
+_SET = "set"
+_FROZENSET = "frozenset"
+
+Encoder = Callable[[Any, Dict[int, Any]], Any]
+Decoder = Callable[[tuple, Dict[int, Any]], Any]
+
+# by type, and by tag; data classes are added as they are first encoded or decoded.
+_ENCODERS:Dict[type, Encoder] = dict()
+_DECODERS:Dict[str, Decoder] = dict()
+
+def get_tag(data_class:Type[RepresentableData]) -> str:
+    return f"{data_class.__module__}.{data_class.__qualname__}"
+
+# generated code for a field value: plain values and lists of them are passed as they are, and shared data that
+# is already encoded (or decoded) is taken from the memo, without a call.
+_PASSED_VALUE = (
+    "{value} if type({value}) in plain_types or type({value}) is list and plain_types.issuperset(map(type, {value})) "
+    "else memo.get(id({value})) or {function}({value}, memo)"
+)
+
+def _generate(name:str, lines:List[str], namespace:Dict[str, Any]) -> Callable:
+    # compiles a function from its source lines.
+    exec("\n".join(lines), namespace)
+    return namespace[name]
+
+def _get_frozen_state(data:RepresentableData):
+    # False, or for frozen data its (trusted) fingerprint if it is known, else True.
+    if not data._frozen:
+        return False
+    return data._fingerprint[2] if data._fingerprint is not None else True
+
+def _set_frozen_state(data:RepresentableData, frozen_state):
+    data._fingerprint = (None, None, frozen_state) if type(frozen_state) is str else None
+    data._frozen = bool(frozen_state)
+
+def _make_encoder(data_class:Type[RepresentableData]) -> Encoder:
+    # data is encoded as (tag, frozen state, *field values) in the order of its field table; data without one
+    # (no __slots__) as (tag, frozen state, {attribute:value}). data shared by several objects is encoded once, as
+    # the same tuple, which stays shared when it is decoded.
+    # for slotted data, the encoder is generated from the field table, reading each field directly.
+    namespace = {'tag':get_tag(data_class), 'plain_types':_PLAIN_TYPES, 'encode':_encode, 'frozen_state':_get_frozen_state}
+    if data_class._fields is None:
+        return _generate('encode_data', [
+            "def encode_data(data, memo):",
+            "    encoded = memo.get(id(data))",
+            "    if encoded is None:",
+            "        attributes = {attribute:encode(value, memo) for attribute, value in data.get_data().items()}",
+            "        encoded = memo[id(data)] = (tag, frozen_state(data), attributes)",
+            "    return encoded",
+        ], namespace)
+    values = [f"v{i}" for i in range(len(data_class._fields))]
+    return _generate('encode_data', [
+        "def encode_data(data, memo):",
+        "    encoded = memo.get(id(data))",
+        "    if encoded is not None:",
+        "        return encoded",
+        *[f"    {value} = data.{field}" for value, field in zip(values, data_class._fields)],
+        "    frozen_state = data._frozen and (data._fingerprint is None or data._fingerprint[2])",
+        "    encoded = memo[id(data)] = (tag, frozen_state, " + "".join(
+            _PASSED_VALUE.format(value=value, function="encode") + ", " for value in values
+        ) + ")",
+        "    return encoded",
+    ], namespace)
+
+def _make_decoder(data_class:Type[RepresentableData]) -> Decoder:
+    # slotted data is made without calling __init__, by setting each field (generated like the encoder);
+    # other data by calling its class with its fields.
+    namespace = {
+        'data_class':data_class, 'new':object.__new__, 'plain_types':_PLAIN_TYPES, 'decode':_decode,
+        'set_frozen_state':_set_frozen_state,
+    }
+    if data_class._fields is None:
+        return _generate('decode_data', [
+            "def decode_data(encoded, memo):",
+            "    data = memo.get(id(encoded))",
+            "    if data is None:",
+            "        data = data_class(**{attribute:decode(value, memo) for attribute, value in encoded[2].items()})",
+            "        set_frozen_state(data, encoded[1])",
+            "        memo[id(encoded)] = data",
+            "    return data",
+        ], namespace)
+    values = [f"v{i}" for i in range(len(data_class._fields))]
+    return _generate('decode_data', [
+        "def decode_data(encoded, memo):",
+        "    data = memo.get(id(encoded))",
+        "    if data is not None:",
+        "        return data",
+        f"    if len(encoded) != {len(values) + 2}:",
+        f"        raise ValueError(f'Expected {len(values)} field(s) of {{encoded[0]}}, got {{len(encoded) - 2}}.')",
+        "    _, frozen_state, " + "".join(f"{value}, " for value in values) + "= encoded",
+        "    data = memo[id(encoded)] = new(data_class)",
+        *[
+            f"    data.{field} = " + _PASSED_VALUE.format(value=value, function="decode")
+            for value, field in zip(values, data_class._fields)
+        ],
+        "    if frozen_state is False:",
+        "        data._fingerprint = None",
+        "        data._frozen = False",
+        "    else:",
+        "        set_frozen_state(data, frozen_state)",
+        "    return data",
+    ], namespace)
+
+def _get_encoder(value_type:type) -> Encoder:
+    if value_type not in _DATA_TYPES:
+        raise TypeError(f"Cannot encode values of type {value_type.__name__}.")
+    encoder = _ENCODERS[value_type] = _make_encoder(value_type)
+    return encoder
+
+def _get_decoder(tag:str) -> Decoder:
+    data_class = next((data_class for data_class in _DATA_TYPES if get_tag(data_class) == tag), None)
+    if data_class is None:
+        raise ValueError(f"Unknown data class {tag}.")
+    decoder = _DECODERS[tag] = _make_decoder(data_class)
+    return decoder
+
+def _encode(value, memo:Dict[int, Any]):
+    # lists of plain values (most lists, e.g. lines of content) are not copied.
+    value_type = type(value)
+    if value_type in _PLAIN_TYPES:
+        return value
+    encoder = _ENCODERS.get(value_type)
+    if encoder is not None:
+        return encoder(value, memo)
+    if value_type is list:
+        if _PLAIN_TYPES.issuperset(map(type, value)):
+            return value
+        return [_encode(item, memo) for item in value]
+    if value_type is dict:
+        return {key:_encode(item, memo) for key, item in value.items()}
+    if value_type is tuple:
+        return (_TUPLE, *[_encode(item, memo) for item in value])
+    if value_type is set or value_type is frozenset:
+        return (_SET if value_type is set else _FROZENSET, *[_encode(item, memo) for item in value])
+    return _get_encoder(value_type)(value, memo)
+
+def _decode(encoded, memo:Dict[int, Any]):
+    encoded_type = type(encoded)
+    if encoded_type in _PLAIN_TYPES:
+        return encoded
+    if encoded_type is list:
+        if _PLAIN_TYPES.issuperset(map(type, encoded)):
+            return encoded
+        return [_decode(item, memo) for item in encoded]
+    if encoded_type is dict:
+        return {key:_decode(item, memo) for key, item in encoded.items()}
+    tag = encoded[0]
+    decoder = _DECODERS.get(tag)
+    if decoder is None:
+        decoder = _get_decoder(tag)
+    return decoder(encoded, memo)
+
+_DECODERS[_TUPLE] = lambda encoded, memo: tuple(_decode(item, memo) for item in encoded[1:])
+_DECODERS[_SET] = lambda encoded, memo: set(_decode(item, memo) for item in encoded[1:])
+_DECODERS[_FROZENSET] = lambda encoded, memo: frozenset(_decode(item, memo) for item in encoded[1:])
+
+def encode(value) -> Tuple[int, Any]:
+    # a version-tagged encoding of data (and of lists, tuples, dicts and sets of it) made of plain values, tuples,
+    # lists and dicts only. unlike serialize(), it keeps the classes of data, tuples and sets, and shared data.
+    # lists of plain values are shared with the data, so the encoding must not be changed.
+    return CODEC_VERSION, _encode(value, dict())
+
+def decode(encoded:Tuple[int, Any]):
+    # the decoded data takes over lists of plain values from the encoding.
+    version, value = encoded
+    if version != CODEC_VERSION:
+        raise ValueError(f"Cannot decode data encoded by codec version {version} (expected {CODEC_VERSION}).")
+    return _decode(value, dict())
+
+def dumps(value) -> bytes:
+    return marshal.dumps(encode(value), _MARSHAL_VERSION)
+
+def loads(data:bytes):
+    return decode(marshal.loads(data))
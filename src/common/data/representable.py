@@ -1,16 +1,174 @@
 from abc import ABC, abstractmethod
-from typing import Dict
+import hashlib
+from operator import attrgetter
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# subclasses of RepresentableData; checked by type, since isinstance checks against an ABC are slow.
+_DATA_TYPES:Set[type] = set()
+
+_CONTAINER_TYPES = (list, tuple, set, frozenset, dict)
+
+# types of values that may hold data: data types (added as they are defined) and containers.
+_FREEZABLE_TYPES:Set[type] = set(_CONTAINER_TYPES)
+
+def _encode(value) -> str:
+    # canonical text of a value, the same in every process and run (unlike hash()).
+    # nested data is fingerprinted (and its fingerprint cached) just before, so the cached fingerprint is used.
+    value_type = type(value)
+    if value_type in _DATA_TYPES:
+        cached = value._fingerprint
+        return cached[2] if cached is not None else value.fingerprint()
+    if value_type is list or value_type is tuple:
+        return value_type.__name__ + "(" + ",".join(map(_encode, value)) + ")"
+    if value_type is dict:
+        return "dict(" + ",".join(f"{key!r}:{_encode(value[key])}" for key in sorted(value, key=repr)) + ")"
+    if value_type is set or value_type is frozenset:
+        return "set(" + ",".join(sorted(map(_encode, value))) + ")"
+    return repr(value)
+
+def _collect_nested_fingerprints(value, nested_fingerprints:List[str]):
+    value_type = type(value)
+    if value_type in _DATA_TYPES:
+        nested_fingerprints.append(value.fingerprint())
+    elif value_type is dict:
+        for item in value.values():
+            _collect_nested_fingerprints(item, nested_fingerprints)
+    elif value_type in _CONTAINER_TYPES:
+        for item in value:
+            _collect_nested_fingerprints(item, nested_fingerprints)
+
+def _freeze_nested(value):
+    value_type = type(value)
+    if value_type in _DATA_TYPES:
+        value.freeze()
+    elif value_type is dict:
+        for item in value.values():
+            _freeze_nested(item)
+    elif value_type in _CONTAINER_TYPES:
+        for item in value:
+            _freeze_nested(item)
+
+def _get_field_getter(fields:Tuple[str, ...]) -> Callable[["RepresentableData"], tuple]:
+    # a getter of the values of the fields as a tuple (attrgetter only returns a tuple for several fields).
+    if len(fields) == 1:
+        getter = attrgetter(fields[0])
+        return lambda data: (getter(data),)
+    if not fields:
+        return lambda data: ()
+    return attrgetter(*fields)
 
 class RepresentableData(ABC):
+    # attributes starting with an underscore are private: they are not part of the data,
+    # so they are left out of equality, fingerprints, serialization and repr.
+
+    # data classes that declare __slots__ (as do all their bases) have no __dict__; their public slots, in order,
+    # are the table of their fields. other data classes keep their attributes in __dict__.
+    # `_fingerprint` caches the fingerprint (see fingerprint()). data is frozen (`_frozen`) once it is shared
+    # (e.g. between styles and the subtitles using them), and must not be changed after that. changes go to
+    # mutable(), a shallow copy whose nested data stays shared until it is changed in turn (copy on write).
+    __slots__ = ('_fingerprint', '_frozen')
+
+    # names of the fields of slotted data classes, and a getter of their values; None for other data classes.
+    _fields:Optional[Tuple[str, ...]] = None
+    _field_values:Callable[["RepresentableData"], tuple] = None
+    # attributes of the pickled state of slotted data.
+    _state_attributes:Tuple[str, ...] = None
+
+    def __new__(cls, *args, **kwargs):
+        data = super().__new__(cls)
+        data._fingerprint = None
+        data._frozen = False
+        return data
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _DATA_TYPES.add(cls)
+        _FREEZABLE_TYPES.add(cls)
+        if all('__slots__' in base.__dict__ for base in cls.__mro__[:-1]):
+            cls._fields = tuple(
+                name for base in reversed(cls.__mro__[:-1]) for name in base.__dict__['__slots__'] if not name.startswith('_')
+            )
+            cls._field_values = staticmethod(_get_field_getter(cls._fields))
+            cls._state_attributes = RepresentableData.__slots__ + cls._fields
+        else:
+            cls._fields = None
+            cls._field_values = None
+            cls._state_attributes = None
+
+    def _get_fields(self) -> Tuple[Tuple[str, ...], tuple]:
+        # names and values of the data attributes.
+        if self._fields is not None:
+            return self._fields, self._field_values(self)
+        data = self.get_data()
+        return tuple(data), tuple(data.values())
+
+    def get_data(self) -> Dict:
+        if self._fields is not None:
+            return dict(zip(self._fields, self._field_values(self)))
+        return {attribute:value for attribute, value in self.__dict__.items() if not attribute.startswith('_')}
+
+    def fingerprint(self) -> str:
+        # stable content hash of the data, built from the fingerprints of nested data.
+        # it is computed once and kept while the attribute values are the same objects (or equal) and nested
+        # fingerprints are unchanged, so comparing and hashing unchanged data does not encode or hash it again.
+        # lists must be replaced rather than changed in place. frozen data does not change, so it is not checked.
+        cached = self._fingerprint
+        if cached is not None and self._frozen:
+            return cached[2]
+        fields, values = self._get_fields()
+        nested_fingerprints = list()
+        for value in values:
+            _collect_nested_fingerprints(value, nested_fingerprints)
+        if cached is not None and cached[1] == nested_fingerprints and cached[0] == values:
+            return cached[2]
+        text = type(self).__name__ + "(" + ",".join(f"{attribute}={_encode(value)}" for attribute, value in zip(fields, values)) + ")"
+        fingerprint = hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+        self._fingerprint = (values, nested_fingerprints, fingerprint)
+        return fingerprint
+
+    def freeze(self) -> "RepresentableData":
+        # freezes this data and the data nested in it; returns this data.
+        if self._frozen:
+            return self
+        for value in self._get_fields()[1]:
+            if type(value) in _FREEZABLE_TYPES:
+                _freeze_nested(value)
+        if self._fingerprint is not None:
+            # checked once more, then trusted while frozen.
+            self.fingerprint()
+        self._frozen = True
+        return self
+
+    def mutable(self) -> "RepresentableData":
+        # this data if it is not frozen, otherwise a copy of it that can be changed.
+        if not self._frozen:
+            return self
+        data_class = type(self)
+        data = data_class.__new__(data_class)
+        if self._fields is not None:
+            for attribute, value in zip(self._fields, self._field_values(self)):
+                setattr(data, attribute, value)
+        else:
+            data.__dict__.update(self.__dict__)
+        data._fingerprint = self._fingerprint
+        return data
+
+    def copy_on_write(self) -> "RepresentableData":
+        # a copy that can be changed without affecting this data; it shares all nested data until that changes.
+        return self.freeze().mutable()
 
     def __repr__(self) -> str:
-        return str(self.__dict__)
+        return str(self.get_data())
 
     def __eq__(self, __value: object) -> bool:
-        if __value is None:
+        # fingerprints include the name of the data class, so data of different classes is not equal.
+        if type(__value) is not type(self):
             return False
-        return self.__dict__ == __value.__dict__
-    
+        return self is __value or self.fingerprint() == __value.fingerprint()
+
+    def __hash__(self) -> int:
+        return int(self.fingerprint()[:16], 16)
+
     @classmethod
     @abstractmethod
     def deserialize(cls, data) -> "RepresentableData":
@@ -18,9 +176,37 @@ class RepresentableData(ABC):
 
     def serialize(self) -> Dict:
         attributes = {}
-        for attribute, value in self.__dict__.items():
-            if isinstance(value, RepresentableData):
+        for attribute, value in zip(*self._get_fields()):
+            if type(value) in _DATA_TYPES:
                 attributes[attribute] = value.serialize()
             else:
                 attributes[attribute] = value
-        return attributes
\ No newline at end of file
+        return attributes
+
+    def __getstate__(self):
+        # slotted data is pickled as a tuple of its values. the cached fingerprint is kept, so unpickled data
+        # compares without encoding it again; frozen data only needs the fingerprint itself, since it is trusted.
+        if self._fields is None:
+            return self.__dict__, {'_fingerprint':self._fingerprint, '_frozen':self._frozen}
+        cached = self._fingerprint
+        if cached is not None and self._frozen:
+            cached = (None, None, cached[2])
+        return (cached, self._frozen) + self._field_values(self)
+
+    def __setstate__(self, state):
+        if self._fields is not None:
+            # fields added since the data was pickled are None.
+            for attribute in self._fields:
+                setattr(self, attribute, None)
+            if type(state) is tuple and not (len(state) == 2 and isinstance(state[0], dict)):
+                for attribute, value in zip(self._state_attributes, state):
+                    setattr(self, attribute, value)
+                if len(state) != len(self._state_attributes):
+                    # pickled by a version with fewer fields (added last), so its fingerprint is outdated.
+                    self._fingerprint = None
+                return
+        # attributes of data pickled with a __dict__ (possibly with slots, as (__dict__, slots)).
+        attributes, slot_attributes = state if type(state) is tuple else (state, None)
+        for attributes in (attributes, slot_attributes):
+            for attribute, value in (attributes or dict()).items():
+                setattr(self, attribute, value)
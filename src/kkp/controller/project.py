@@ -8,8 +8,9 @@ import subprocess
 from packaging import version
 
 from common.import_utils import get_kksubs_version
-from kkp.data.config import KKPSettings
+from kkp.data.config import ComposeSettings, KKPSettings
 from kksubs.service.file import FileService
+from kksubs.service.scheduler import ComposeScheduler
 from kkp.service.studio_project import StudioProjectService
 
 from kksubs.service.sub_project import SubtitleProjectService
@@ -41,6 +42,14 @@ VERSION_KEY = 'version'
 
 logger = logging.getLogger(__name__)
 
+def get_scheduler(compose_settings:ComposeSettings) -> ComposeScheduler:
+    # the scheduler validates the executor, start method and limits of the settings.
+    return ComposeScheduler(
+        jobs=compose_settings.jobs, max_memory=compose_settings.get_max_memory(), executor=compose_settings.executor,
+        retries=compose_settings.retries, task_timeout=compose_settings.task_timeout,
+        start_method=compose_settings.start_method,
+    )
+
 def format_project_name(project_name:str):
     if project_name is None:
         return project_name
@@ -326,7 +335,9 @@ class ProjectController:
         self.list_project_history = data_info.get(LIST_PROJECT_HISTORY_KEY)
         self.recent_projects = data_info.get(RECENT_PROJECTS_KEY)
 
-        self.subtitle_project_service = SubtitleProjectService(workspace_directory=self.workspace)
+        self.subtitle_project_service = SubtitleProjectService(
+            workspace_directory=self.workspace, project_id=self.current_project, state_max_size=self.settings.compose.get_state_max_size(),
+        )
         self.studio_project_service = StudioProjectService(self.library, self.game_directory, self.workspace)
         self.project_view = ProjectView()
 
@@ -336,6 +347,8 @@ class ProjectController:
         self.project_watcher.load_watch_arguments(
             allow_incremental_updating=True,
             allow_multiprocessing=True,
+            scheduler=get_scheduler(self.settings.compose),
+            change_detection=self.settings.compose.change_detection,
         )
 
     @deprecated
@@ -432,7 +445,9 @@ class ProjectController:
         self.list_project_history = data_info.get(LIST_PROJECT_HISTORY_KEY)
         self.recent_projects = data_info.get(RECENT_PROJECTS_KEY)
 
-        self.subtitle_project_service = SubtitleProjectService(workspace_directory=self.workspace)
+        self.subtitle_project_service = SubtitleProjectService(
+            workspace_directory=self.workspace, project_id=self.current_project, state_max_size=self.settings.compose.get_state_max_size(),
+        )
         self.studio_project_service = StudioProjectService(self.library, self.game_directory, self.workspace)
         self.project_view = ProjectView()
 
@@ -442,6 +457,8 @@ class ProjectController:
         self.project_watcher.load_watch_arguments(
             allow_incremental_updating=True,
             allow_multiprocessing=True,
+            scheduler=get_scheduler(self.settings.compose),
+            change_detection=self.settings.compose.change_detection,
         )
 
     @spacing
@@ -450,6 +467,8 @@ class ProjectController:
         print(f'Game:                {self.game_directory}')
         print(f'Library:             {self.library}')
         print(f'Workspace:           {self.workspace}')
+        if self.subtitle_project_service is not None and os.path.exists(self.subtitle_project_service.state_store_path):
+            print(f'State:               {self.subtitle_project_service.state_store_path} ({self.subtitle_project_service.get_state_store().summary()})')
 
         projects = self.list_projects(pattern='*', limit=self.list_project_limit, update_quick_access=False)
         if show_recent_projects:
@@ -472,7 +491,12 @@ class ProjectController:
         if self.subtitle_project_service is None:
             raise ValueError("Subtitle project service is None")
         self.subtitle_project_service.validate()
-        self.subtitle_project_service.add_subtitles(allow_incremental_updating=incremental_update, update_drafts=True)
+        scheduler = get_scheduler(self.settings.compose) if self.settings is not None else None
+        change_detection = self.settings.compose.change_detection if self.settings is not None else None
+        self.subtitle_project_service.add_subtitles(
+            allow_incremental_updating=incremental_update, update_drafts=True,
+            scheduler=scheduler, change_detection=change_detection,
+        )
 
     def activate(self):
         # continuously compose
@@ -491,6 +515,8 @@ class ProjectController:
 
     def _unassign(self, delete_project:bool=True):
         self.current_project = None
+        if self.subtitle_project_service is not None:
+            self.subtitle_project_service.project_id = None
         if delete_project:
             if self.subtitle_project_service is None:
                 raise ValueError("Subtitle project service is None")
@@ -560,6 +586,9 @@ class ProjectController:
 
     def _assign(self, project_name:str):
         self.current_project = project_name
+        if self.subtitle_project_service is not None:
+            # incremental state is kept per project, since every project is checked out into the same workspace.
+            self.subtitle_project_service.project_id = project_name
         self._update_recent_projects(project_name)
 
     def _get_project_from_quick_access(self, project_name:str):
@@ -798,6 +827,8 @@ class ProjectController:
         is_renamed = self.studio_project_service.rename_project(self.current_project, new_project_id)
         if is_renamed:
             self.current_project = new_project_id
+            if self.subtitle_project_service is not None:
+                self.subtitle_project_service.project_id = new_project_id
             print(f"Successfully renamed project {self.current_project} to {new_project_id}.")
             return
         else:
@@ -4,6 +4,7 @@ from pathlib import Path
 from typing import Dict
 
 from common.data.representable import RepresentableData
+from kksubs.utils.sanitizers import to_memory_size
 
 class Settings(RepresentableData, ABC):
     name:str
@@ -72,6 +73,43 @@ class OpenGameDirectorySettings(Settings):
             )
         return OpenGameDirectorySettings(**open_game_dir_settings_data)
 
+class ComposeSettings(Settings):
+    name = 'compose'
+
+    def __init__(
+            self,
+            jobs:int=None,
+            max_memory:str=None,
+            executor:str=None,
+            retries:int=None,
+            task_timeout:float=None,
+            start_method:str=None,
+            change_detection:str=None,
+            state_max_size:str=None,
+    ):
+        self.jobs = jobs
+        self.max_memory = max_memory
+        self.executor = executor
+        self.retries = retries
+        self.task_timeout = task_timeout
+        self.start_method = start_method
+        self.change_detection = change_detection
+        self.state_max_size = state_max_size
+
+    @classmethod
+    def deserialize(self, compose_settings_data):
+        if compose_settings_data is None:
+            return ComposeSettings()
+        return ComposeSettings(**compose_settings_data)
+
+    def get_max_memory(self) -> int:
+        # a size like '4G', in bytes.
+        return to_memory_size(self.max_memory)
+
+    def get_state_max_size(self) -> int:
+        # size cap of the state store, like max_memory.
+        return to_memory_size(self.state_max_size)
+
 class KKPSettings(RepresentableData):
     name = 'settings'
     
@@ -80,10 +118,14 @@ class KKPSettings(RepresentableData):
             export_settings:ExportSettings=None,
             log_settings:LogSettings=None,
             open_game_directory_settings:OpenGameDirectorySettings=None,
+            compose_settings:ComposeSettings=None,
     ):
+        if compose_settings is None:
+            compose_settings = ComposeSettings()
         self.export = export_settings
         self.log = log_settings
         self.open_game_directory = open_game_directory_settings
+        self.compose = compose_settings
 
     @classmethod
     def deserialize(self, settings_data:Dict):
@@ -92,10 +134,12 @@ class KKPSettings(RepresentableData):
                 export_settings=ExportSettings.deserialize(None),
                 log_settings=LogSettings.deserialize(None),
                 open_game_directory_settings=OpenGameDirectorySettings.deserialize(None),
+                compose_settings=ComposeSettings.deserialize(None),
             )
         
         return KKPSettings(
             export_settings=ExportSettings.deserialize(settings_data.get(ExportSettings.name)),
             log_settings=LogSettings.deserialize(settings_data.get(LogSettings.name)),
             open_game_directory_settings=OpenGameDirectorySettings.deserialize(settings_data.get(OpenGameDirectorySettings.name)),
+            compose_settings=ComposeSettings.deserialize(settings_data.get(ComposeSettings.name)),
         )
\ No newline at end of file
@@ -1,6 +1,7 @@
 from typing import Dict, List
 
 from kksubs.controller.subtitle import SubtitleController
+from kksubs.service.scheduler import ComposeScheduler
 
 # basic functions
 def create_project(workspace_directory:str=None):
@@ -14,13 +15,25 @@ def add_subtitles(
         allow_multiprocessing:bool=None,
         allow_incremental_updating:bool=None,
         watch:bool=None,
+        jobs:int=None,
+        max_memory:int=None,
+        executor:str=None,
+        retries:int=None,
+        task_timeout:float=None,
+        start_method:str=None,
+        change_detection:str=None,
 ):
     if workspace_directory is None:
         workspace_directory = '.'
     return SubtitleController(workspace_directory=workspace_directory).add_subtitles(
         allow_multiprocessing=allow_multiprocessing,
         allow_incremental_updating=allow_incremental_updating, 
-        watch=watch
+        watch=watch,
+        scheduler=ComposeScheduler(
+            jobs=jobs, max_memory=max_memory, executor=executor,
+            retries=retries, task_timeout=task_timeout, start_method=start_method,
+        ),
+        change_detection=change_detection,
     )
 
 def clear_subtitles(workspace_directory:str=None):
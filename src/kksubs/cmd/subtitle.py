@@ -2,6 +2,10 @@ import argparse
 import logging
 
 from kksubs.controller.subtitle import SubtitleController
+from kksubs.service.executor import EXECUTORS, get_start_methods
+from kksubs.service.fingerprint import CHANGE_DETECTION_MODES
+from kksubs.service.scheduler import ComposeScheduler
+from kksubs.utils.sanitizers import to_memory_size
 
 log_levels = {
     "debug": logging.DEBUG,
@@ -38,7 +42,14 @@ def command_line():
     for subparser in [activate_parser, compose_parser]:
         subparser.add_argument('-d', '--draft', default=None)
         subparser.add_argument('--disable-multiprocessing', action='store_true')
+        subparser.add_argument('-j', '--jobs', type=int, default=None, help='Number of worker processes (defaults to number of cores).')
+        subparser.add_argument('--max-memory', type=to_memory_size, default=None, help='Memory budget for concurrent tasks, e.g. 4G or 512M (bare numbers are megabytes).')
+        subparser.add_argument('--executor', choices=list(EXECUTORS), default=None, help='Run tasks in worker processes (default), threads, or inline.')
+        subparser.add_argument('--start-method', choices=get_start_methods(), default=None, help='How worker processes start; forkserver preloads imports and fonts once per session.')
+        subparser.add_argument('--retries', type=int, default=None, help='Times to retry a failing image (default 0).')
+        subparser.add_argument('--task-timeout', type=float, default=None, help='Seconds after which a stuck image is abandoned (or retried).')
         subparser.add_argument('--incremental-update', action='store_true')
+        subparser.add_argument('--change-detection', choices=CHANGE_DETECTION_MODES, default=None, help='Detect changed images by modification time (default) or by content hash.')
         subparser.add_argument('--prefix', default='')
         subparser.add_argument('--start', type=int, default=0)
         subparser.add_argument('--cap', type=int, default=200)
@@ -75,6 +86,10 @@ def command_line():
         disable_multiprocessing = args.disable_multiprocessing
         incremental_update = args.incremental_update
         draft = args.draft
+        scheduler = ComposeScheduler(
+            jobs=args.jobs, max_memory=args.max_memory, executor=args.executor,
+            retries=args.retries, task_timeout=args.task_timeout, start_method=args.start_method,
+        )
 
         if draft is not None:
             draft = {draft:list(range(args.start, args.start+args.cap))}
@@ -84,14 +99,18 @@ def command_line():
                 drafts=draft, prefix=args.prefix, 
                 allow_multiprocessing=True,
                 allow_incremental_updating=True,
-                watch=True
+                watch=True,
+                scheduler=scheduler,
+                change_detection=args.change_detection,
             )
         
         controller.add_subtitles(
             drafts=draft, prefix=args.prefix, 
             allow_multiprocessing=not disable_multiprocessing,
             allow_incremental_updating=incremental_update,
-            watch=False
+            watch=False,
+            scheduler=scheduler,
+            change_detection=args.change_detection,
         )
 
         if args.show:
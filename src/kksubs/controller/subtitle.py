@@ -1,4 +1,5 @@
 import os
+from kksubs.service.scheduler import ComposeScheduler
 from kksubs.service.sub_project import SubtitleProjectService
 from typing import Dict, List
 import logging
@@ -51,6 +52,8 @@ class SubtitleController:
         allow_multiprocessing:bool=None,
         allow_incremental_updating:bool=None,
         watch:bool=None,
+        scheduler:ComposeScheduler=None,
+        change_detection:str=None,
     ):
         if watch is None:
             watch = False
@@ -58,14 +61,16 @@ class SubtitleController:
         if watch:
             self.watcher.load_watch_arguments(
                 drafts=drafts, prefix=prefix,
-                allow_multiprocessing=allow_multiprocessing, allow_incremental_updating=allow_incremental_updating
+                allow_multiprocessing=allow_multiprocessing, allow_incremental_updating=allow_incremental_updating,
+                scheduler=scheduler, change_detection=change_detection,
             )
             return self.watcher.watch()
 
         return self.service.add_subtitles(
             drafts=drafts, prefix=prefix, 
             allow_multiprocessing=allow_multiprocessing, 
-            allow_incremental_updating=allow_incremental_updating
+            allow_incremental_updating=allow_incremental_updating,
+            scheduler=scheduler, change_detection=change_detection,
         )
     
     def open_output_folders(self, drafts:str=None):
@@ -3,6 +3,8 @@ from abc import abstractclassmethod, abstractmethod
 from common.data.representable import RepresentableData
 
 class BaseData(RepresentableData):
+    # data classes declare their fields in __slots__ (see RepresentableData).
+    __slots__ = ()
     field_name:str
 
     @abstractclassmethod
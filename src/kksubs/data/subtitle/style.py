@@ -1,11 +1,12 @@
 from abc import ABC
-from copy import deepcopy
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 from kksubs.data.subtitle.style_attributes import *
 
 class Style(BaseData):
     field_name = "style"
+    # resolved styles are interned in weak tables, so they can be referenced weakly.
+    __slots__ = ('style_id', 'text_data', 'outline_data', 'outline_data_1', 'box_data', 'asset_data', 'brightness', 'gaussian', 'motion', 'background', 'mask', 'styles', '__weakref__')
 
     def __init__(
             self, 
@@ -72,53 +73,35 @@ class Style(BaseData):
             styles=styles,
         )
     
+    def _coalesce_data(self, field:str, other_data:BaseData):
+        # takes the other style's data if this style has none (sharing it), or fills in its own copy.
+        data:BaseData = getattr(self, field)
+        if other_data is None or other_data is data:
+            return
+        if data is None:
+            setattr(self, field, other_data.freeze())
+        else:
+            data = data.mutable()
+            data.coalesce(other_data)
+            setattr(self, field, data)
+
     def coalesce(self, other:"Style", essential=False):
         if other is None:
             return
         self.style_id = coalesce(self.style_id, other.style_id)
-        if self.text_data is None:
-            self.text_data = other.text_data
-        else:
-            self.text_data.coalesce(other.text_data)
-        if self.outline_data is None:
-            self.outline_data = other.outline_data
-        else:
-            self.outline_data.coalesce(other.outline_data)
-        if self.outline_data_1 is None:
-            self.outline_data_1 = other.outline_data_1
-        else:
-            self.outline_data_1.coalesce(other.outline_data_1)
-        if self.box_data is None:
-            self.box_data = other.box_data
-        else:
-            self.box_data.coalesce(other.box_data)
+        self._coalesce_data("text_data", other.text_data)
+        self._coalesce_data("outline_data", other.outline_data)
+        self._coalesce_data("outline_data_1", other.outline_data_1)
+        self._coalesce_data("box_data", other.box_data)
         if essential:
             return
         
-        if self.asset_data is None:
-            self.asset_data = other.asset_data
-        else:
-            self.asset_data.coalesce(other.asset_data)
-        if self.brightness is None:
-            self.brightness = other.brightness
-        else:
-            self.brightness.coalesce(other.brightness)
-        if self.gaussian is None:
-            self.gaussian = other.gaussian
-        else:
-            self.gaussian.coalesce(other.gaussian)
-        if self.motion is None:
-            self.motion = other.motion
-        else:
-            self.motion.coalesce(other.motion)
-        if self.background is None:
-            self.background = other.background
-        else:
-            self.background.coalesce(other.background)
-        if self.mask is None:
-            self.mask = other.mask
-        else:
-            self.mask.coalesce(other.mask)
+        self._coalesce_data("asset_data", other.asset_data)
+        self._coalesce_data("brightness", other.brightness)
+        self._coalesce_data("gaussian", other.gaussian)
+        self._coalesce_data("motion", other.motion)
+        self._coalesce_data("background", other.background)
+        self._coalesce_data("mask", other.mask)
         if not self.styles:
             self.styles = other.styles
 
@@ -126,34 +109,28 @@ class Style(BaseData):
         # inherit from other styles.
         self.coalesce(style)
 
+    def _correct_data(self, field:str, default:BaseData=None):
+        data:BaseData = getattr(self, field)
+        if data is None:
+            return
+        data = data.mutable()
+        data.coalesce(default)
+        data.correct_values()
+        setattr(self, field, data)
+
     def correct_values(self):
-        self.text_data.correct_values()
-        if self.outline_data is not None:
-            self.outline_data.coalesce(OutlineData.get_default())
-            self.outline_data.correct_values()
-        if self.outline_data_1 is not None:
-            self.outline_data_1.coalesce(OutlineData1.get_default())
-            self.outline_data_1.correct_values()
-        self.box_data.correct_values()
-        if self.asset_data is not None:
-            self.asset_data.coalesce(Asset.get_default())
-            self.asset_data.correct_values()
-        if self.brightness is not None:
-            self.brightness.coalesce(Brightness.get_default())
-            self.brightness.correct_values()
-        if self.gaussian is not None:
-            self.gaussian.coalesce(Gaussian.get_default())
-            self.gaussian.correct_values()
-        if self.motion is not None:
-            self.motion.coalesce(Motion.get_default())
-            self.motion.correct_values()
-        if self.background is not None:
-            self.background.coalesce(Background.get_default())
-            self.background.correct_values()
-        if self.mask is not None:
-            self.mask.coalesce(Mask.get_default())
-            self.mask.correct_values()
+        self._correct_data("text_data")
+        self._correct_data("outline_data", OutlineData.get_default())
+        self._correct_data("outline_data_1", OutlineData1.get_default())
+        self._correct_data("box_data")
+        self._correct_data("asset_data", Asset.get_default())
+        self._correct_data("brightness", Brightness.get_default())
+        self._correct_data("gaussian", Gaussian.get_default())
+        self._correct_data("motion", Motion.get_default())
+        self._correct_data("background", Background.get_default())
+        self._correct_data("mask", Mask.get_default())
         if self.styles is not None:
+            self.styles = [style.mutable() for style in self.styles]
             for style in self.styles:
                 style.correct_values()
                 style.coalesce(self, essential=True)
@@ -179,7 +156,7 @@ class ContextLayer(Layer):
         return ContextLayer(**context_dict)
 
     def project(self, projector:Style, style:Style):
-        projected_style = deepcopy(style)
+        projected_style:Style = style.copy_on_write()
         projected_style_id = projected_style.style_id
         projected_style.inherit(projector)
         projected_style.style_id = f'{projected_style_id}{self.delimiter}{projector.style_id}'
@@ -226,13 +203,71 @@ class StyleMatrix(RepresentableData):
         if rows is None:
             rows = list()
         self.rows = rows
+        # styles of the products of the first rows, by number of rows and style ID (None if there is none).
+        self._resolved:Dict[Tuple[int, str], Optional[Style]] = dict()
 
     def add_row(self, row:StyleRow):
         self.rows.append(row)
+        self._resolved.clear()
 
     def add_context(self, context:ContextLayer):
-        if self.rows:
-            self.rows[-1].add_context(context)
+        if self.rows and isinstance(self.rows[-1], StyleRow):
+            # rows may be shared (e.g. built-in rows), so the row is replaced rather than changed.
+            self.rows[-1] = StyleRow(styles=self.rows[-1].styles, context=context)
+            self._resolved.clear()
+
+    def _get_style_rows(self) -> List[StyleRow]:
+        return [row for row in self.rows if isinstance(row, StyleRow)]
+
+    def get_style_ids(self) -> List[str]:
+        # IDs of the styles of out(), in the same order, without building the styles.
+        style_ids:List[str] = list()
+        rows = self._get_style_rows()
+        for i, row in enumerate(rows):
+            row_style_ids = [style.style_id for style in row.styles]
+            if i == 0:
+                style_ids = row_style_ids
+                continue
+            delimiter = rows[i-1].context.delimiter
+            style_ids = style_ids + row_style_ids + [
+                f'{row_style_id}{delimiter}{style_id}' for row_style_id in row_style_ids for style_id in style_ids
+            ]
+        return style_ids
+
+    def get_style(self, style_id:str) -> Optional[Style]:
+        # the style of out() with the given ID (the last one, if several have it), built on demand.
+        rows = self._get_style_rows()
+        return self._get_style(rows, len(rows), style_id)
+
+    def _get_style(self, rows:List[StyleRow], count:int, style_id:str) -> Optional[Style]:
+        # the product of the first count rows lists the styles of the product of the rows before,
+        # then the styles of the last row, then each style of the last row projected on each style before.
+        # later styles take precedence, so they are looked up first.
+        if count == 0:
+            return None
+        key = (count, style_id)
+        if key in self._resolved:
+            return self._resolved[key]
+
+        style:Style = None
+        row = rows[count-1]
+        if count > 1:
+            context = rows[count-2].context
+            for row_style in reversed(row.styles):
+                prefix = f'{row_style.style_id}{context.delimiter}'
+                if not style_id.startswith(prefix):
+                    continue
+                projector = self._get_style(rows, count-1, style_id[len(prefix):])
+                if projector is not None:
+                    style = context.project(projector, row_style)
+                    break
+        if style is None:
+            style = next((row_style for row_style in reversed(row.styles) if row_style.style_id == style_id), None)
+        if style is None:
+            style = self._get_style(rows, count-1, style_id)
+
+        self._resolved[key] = style
+        return style
 
     def out(self, delimiter=None) -> List[Style]:
         if delimiter is None:
@@ -4,6 +4,7 @@ from kksubs.utils.sanitizers import *
 
 class TextData(BaseData):
     field_name = "text_data"
+    __slots__ = ('font', 'size', 'color', 'stroke_size', 'stroke_color', 'text', 'alpha')
 
     def __init__(
             self, 
@@ -64,6 +65,7 @@ class TextData(BaseData):
 
 class OutlineData(BaseData):
     field_name = "outline_data"
+    __slots__ = ('color', 'size', 'blur', 'alpha')
 
     def __init__(
             self,
@@ -106,9 +108,11 @@ class OutlineData(BaseData):
 
 class OutlineData1(OutlineData):
     field_name = "outline_data_1"
+    __slots__ = ()
 
 class BoxData(BaseData):
     field_name = "box_data"
+    __slots__ = ('align_h', 'align_v', 'box_width', 'anchor', 'grid4', 'grid10', 'nudge', 'rotate')
 
     def __init__(
             self, 
@@ -171,6 +175,7 @@ class BoxData(BaseData):
 
 class Asset(BaseData):
     field_name = 'asset'
+    __slots__ = ('path', 'rotate', 'scale', 'alpha')
 
     def __init__(
             self,
@@ -210,6 +215,7 @@ class Asset(BaseData):
 
 class Brightness(BaseData):
     field_name = "brightness"
+    __slots__ = ('value',)
 
     def __init__(
             self,
@@ -242,6 +248,7 @@ class Brightness(BaseData):
 
 class Gaussian(BaseData):
     field_name = "gaussian"
+    __slots__ = ('value',)
 
     def __init__(
             self,
@@ -274,6 +281,7 @@ class Gaussian(BaseData):
 
 class Motion(BaseData):
     field_name = "motion"
+    __slots__ = ('value', 'angle')
 
     def __init__(
             self,
@@ -311,6 +319,7 @@ class Motion(BaseData):
 
 class Mask(BaseData):
     field_name = "mask"
+    __slots__ = ('path',)
 
     def __init__(
             self,
@@ -342,6 +351,7 @@ class Mask(BaseData):
 
 class Background(BaseData):
     field_name = "background"
+    __slots__ = ('path',)
 
     def __init__(
             self,
@@ -10,13 +10,16 @@ from kksubs.data.subtitle.style import Style
 logger = logging.getLogger(__name__)
 
 class Subtitle(RepresentableData):
+    __slots__ = ('content', 'style', 'style_ids')
 
-    def __init__(self, content:List[str]=None, style:Style=None):
+    def __init__(self, content:List[str]=None, style:Style=None, style_ids:List[str]=None):
         if style is None:
             style = Style()
 
         self.content = content
         self.style = style
+        # IDs of the styles from styles.yml that were applied to this subtitle.
+        self.style_ids = style_ids
         pass
 
     @classmethod
@@ -24,17 +27,20 @@ class Subtitle(RepresentableData):
         if subtitle_data is None:
             return None
         
-        return Subtitle(content=subtitle_data.get('content'), style=Style.deserialize(subtitle_data.get('style')))
+        return Subtitle(content=subtitle_data.get('content'), style=Style.deserialize(subtitle_data.get('style')), style_ids=subtitle_data.get('style_ids'))
 
 class SubtitleGroup(RepresentableData):
+    __slots__ = ('image_id', 'input_image_path', 'image_modified_time', 'output_image_path', 'subtitles', 'image_fingerprint')
 
-    def __init__(self, image_id:str=None, input_image_path:str=None, image_modified_time=None, output_image_path:str=None, subtitles:List[Subtitle]=None):
+    def __init__(self, image_id:str=None, input_image_path:str=None, image_modified_time=None, output_image_path:str=None, subtitles:List[Subtitle]=None, image_fingerprint:str=None):
 
         self.image_id = image_id
         self.input_image_path = input_image_path
         self.image_modified_time = image_modified_time
         self.output_image_path = output_image_path
         self.subtitles = subtitles
+        # content hash of the input image; only set when changes are detected by fingerprint.
+        self.image_fingerprint = image_fingerprint
 
     @classmethod
     def deserialize(self, data:Dict) -> "SubtitleGroup":
@@ -47,7 +53,8 @@ class SubtitleGroup(RepresentableData):
             input_image_path=data.get('input_image_path'),
             image_modified_time=data.get('image_modified_time'),
             output_image_path=data.get('output_image_path'),
-            subtitles=subtitles
+            subtitles=subtitles,
+            image_fingerprint=data.get('image_fingerprint'),
         )
 
     def complete_path_info(self, draft_id:str, image_id:str, image_dir:str, output_dir:str, prefix:str=None, suffix:str=None):
@@ -0,0 +1,181 @@
+from abc import ABC, abstractmethod
+from contextlib import ExitStack
+import logging
+import multiprocessing
+import multiprocessing.pool
+import os
+import threading
+from typing import Callable, Dict, List, Type
+
+from kksubs.service.thread_budget import ThreadBudget, apply_thread_limit
+
+logger = logging.getLogger(__name__)
+
+# imported by the forkserver before it forks any worker.
+PRELOAD_MODULES = ['kksubs.service.preload']
+
+def get_start_methods() -> List[str]:
+    return multiprocessing.get_all_start_methods()
+
+def get_process_context(start_method:str=None):
+    # None is the platform default (fork on Linux, spawn on Windows and macOS).
+    context = multiprocessing.get_context(start_method)
+    if context.get_start_method() == 'forkserver':
+        # the server is started by the first pool and reused by every later pool in this session,
+        # so imports and font parsing are paid once rather than per pool (or per worker, as with spawn).
+        context.set_forkserver_preload(PRELOAD_MODULES)
+    return context
+
+def run_with_deadline(fn:Callable, args:tuple, timeout:float):
+    # runs in a worker process, which exits if the task overruns its deadline;
+    # the pool replaces the worker, so one stuck task does not hold a worker for the rest of the run.
+    timer = threading.Timer(timeout, os._exit, args=(1,))
+    timer.daemon = True
+    timer.start()
+    try:
+        return fn(*args)
+    finally:
+        timer.cancel()
+
+def run_started(fn:Callable, args:tuple, on_start:Callable):
+    # runs in a worker thread.
+    on_start()
+    return fn(*args)
+
+class ComposeExecutor(ABC):
+    # runs compose tasks; results are reported through callbacks so the scheduler can admit more work.
+    name:str
+
+    def __init__(self, num_workers:int, thread_budget:ThreadBudget=None, start_method:str=None):
+        if thread_budget is None:
+            thread_budget = ThreadBudget(num_workers)
+        self.num_workers = num_workers
+        self.thread_budget = thread_budget
+        # ignored by executors that do not start processes.
+        self.start_method = start_method
+
+    @abstractmethod
+    def submit(
+            self, fn:Callable, args:tuple, callback:Callable, error_callback:Callable, timeout:float=None,
+            on_start:Callable=None,
+    ):
+        # timeout (seconds) is a hint; the scheduler enforces deadlines on its side, from when on_start is called.
+        # on_start is called once the task starts running, or on submit by executors that cannot tell.
+        ...
+
+    def close(self):
+        # no more tasks will be submitted; wait for submitted tasks to finish.
+        return
+
+    def terminate(self):
+        # stop immediately, abandoning submitted tasks.
+        return
+
+class InlineExecutor(ComposeExecutor):
+    # runs each task in the calling thread as it is submitted.
+    name = 'inline'
+
+    def submit(
+            self, fn:Callable, args:tuple, callback:Callable, error_callback:Callable, timeout:float=None,
+            on_start:Callable=None,
+    ):
+        if on_start is not None:
+            on_start()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            error_callback(e)
+            return
+        callback(result)
+
+class PoolExecutor(ComposeExecutor):
+    # runs tasks on a multiprocessing pool (or a pool with the same interface).
+
+    def __init__(self, num_workers:int, thread_budget:ThreadBudget=None, start_method:str=None):
+        super().__init__(num_workers, thread_budget=thread_budget, start_method=start_method)
+        # undone when the executor is closed or terminated.
+        self._exit_stack = ExitStack()
+        self.pool = self.create_pool()
+
+    @abstractmethod
+    def create_pool(self) -> multiprocessing.pool.Pool:
+        ...
+
+    def submit(
+            self, fn:Callable, args:tuple, callback:Callable, error_callback:Callable, timeout:float=None,
+            on_start:Callable=None,
+    ):
+        if on_start is not None:
+            on_start()
+        self.pool.apply_async(fn, args, callback=callback, error_callback=error_callback)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self._exit_stack.close()
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+        self._exit_stack.close()
+
+class ProcessExecutor(PoolExecutor):
+    # worker processes; task arguments and results are pickled.
+    name = 'process'
+
+    def submit(
+            self, fn:Callable, args:tuple, callback:Callable, error_callback:Callable, timeout:float=None,
+            on_start:Callable=None,
+    ):
+        # a worker that overruns exits and is replaced, so tasks rarely wait for a worker once submitted, and the
+        # deadline starts on submit.
+        if timeout is not None:
+            fn, args = run_with_deadline, (fn, args, timeout)
+        super().submit(fn, args, callback, error_callback, on_start=on_start)
+
+    def create_pool(self):
+        # workers inherit the BLAS variables at startup and limit OpenCV in the initializer.
+        # forkserver workers inherit the variables of the server instead, and rely on the initializer.
+        with self.thread_budget.environment():
+            return get_process_context(self.start_method).Pool(
+                self.num_workers,
+                initializer=apply_thread_limit, initargs=(self.thread_budget.threads_per_worker,),
+            )
+
+class ThreadExecutor(PoolExecutor):
+    # worker threads in this process; no pickling or process startup, and caches are shared.
+    # effective when the work is dominated by operations that release the GIL (filters, PNG encoding).
+    name = 'thread'
+
+    def submit(
+            self, fn:Callable, args:tuple, callback:Callable, error_callback:Callable, timeout:float=None,
+            on_start:Callable=None,
+    ):
+        # an abandoned task keeps its thread until it finishes, so later tasks may wait for a thread; their
+        # deadlines start when they get one.
+        if on_start is not None:
+            fn, args = run_started, (fn, args, on_start)
+        super().submit(fn, args, callback, error_callback)
+
+    def create_pool(self):
+        # OpenCV's thread count is process-wide, so it is limited while the pool is alive.
+        self._exit_stack.enter_context(self.thread_budget.in_process())
+        return multiprocessing.pool.ThreadPool(self.num_workers)
+
+    def terminate(self):
+        # threads cannot be killed; an abandoned task finishes in the background, so it is not joined.
+        self.pool.terminate()
+        self._exit_stack.close()
+
+EXECUTORS:Dict[str, Type[ComposeExecutor]] = {
+    executor.name:executor for executor in [
+        ProcessExecutor,
+        ThreadExecutor,
+        InlineExecutor,
+    ]
+}
+
+def get_executor_class(name:str) -> Type[ComposeExecutor]:
+    if name not in EXECUTORS:
+        raise ValueError(f"Unknown executor {name}, expected one of {list(EXECUTORS)}.")
+    return EXECUTORS[name]
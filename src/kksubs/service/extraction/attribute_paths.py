@@ -0,0 +1,76 @@
+import inspect
+import logging
+import typing
+from typing import Dict, Optional, Tuple, Type
+
+from kksubs.data.abstract import BaseData
+from kksubs.data.subtitle.style import Style
+
+logger = logging.getLogger(__name__)
+
+class AttributeNode:
+    # a node of the trie of dotted attribute paths accepted in drafts (e.g. text_data.color).
+    # the path from the root is kept as (attribute, data class) steps, so setting a value walks it directly,
+    # creating missing nested data and copying shared (frozen) nested data on the way.
+
+    def __init__(self, steps:Tuple[Tuple[str, Type[BaseData]], ...]=None, attribute:str=None):
+        self.steps = steps or tuple()
+        # set on nodes that end a valid path.
+        self.attribute = attribute
+        self.children:Dict[str, AttributeNode] = dict()
+
+    def get(self, key:str) -> Optional["AttributeNode"]:
+        node = self
+        for name in key.split("."):
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node if node.attribute is not None else None
+
+    def set_value(self, style:BaseData, value):
+        data = style
+        for attribute, data_class in self.steps:
+            nested_data = getattr(data, attribute)
+            if nested_data is None:
+                nested_data = data_class()
+            else:
+                nested_data = nested_data.mutable()
+            setattr(data, attribute, nested_data)
+            data = nested_data
+        setattr(data, self.attribute, value)
+
+def _get_data_class(hint) -> Optional[Type[BaseData]]:
+    # the data class of an annotation, if it is one. python 3.10 reports arguments defaulting to None as
+    # Optional[...], so a union of a data class with None is unwrapped.
+    if typing.get_origin(hint) is typing.Union:
+        arguments = [argument for argument in typing.get_args(hint) if argument is not type(None)]
+        if len(arguments) != 1:
+            return None
+        hint = arguments[0]
+    if inspect.isclass(hint) and issubclass(hint, BaseData):
+        return hint
+    return None
+
+def build_attribute_trie(data_class:Type[BaseData], steps:Tuple[Tuple[str, Type[BaseData]], ...]=None) -> AttributeNode:
+    # built from the constructor of each data class: arguments annotated with a data class are nested under its
+    # field name (so "asset" sets asset_data, as in styles.yml) and under the argument name; all other arguments
+    # are values.
+    root = AttributeNode(steps)
+    type_hints = typing.get_type_hints(data_class.__init__)
+    for name in inspect.signature(data_class.__init__).parameters:
+        if name == "self":
+            continue
+        data_class_hint = _get_data_class(type_hints.get(name))
+        if data_class_hint is not None:
+            node = build_attribute_trie(data_class_hint, root.steps + ((name, data_class_hint),))
+            root.children[data_class_hint.field_name] = node
+            root.children[name] = node
+        else:
+            root.children[name] = AttributeNode(root.steps, attribute=name)
+    return root
+
+STYLE_ATTRIBUTES = build_attribute_trie(Style)
+
+def get_style_attribute(key:str) -> Optional[AttributeNode]:
+    # the node of a draft line key that sets a style attribute, or None if the key is not one.
+    return STYLE_ATTRIBUTES.get(key)
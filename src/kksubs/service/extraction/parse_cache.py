@@ -0,0 +1,89 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+from common.data import codec
+
+logger = logging.getLogger(__name__)
+
+# part of every block key; bump when parsing changes so cached blocks are parsed again.
+PARSER_VERSION = 7
+
+# parsed blocks kept in memory; older blocks are read from the state store again.
+DEFAULT_MAX_ENTRIES = 4096
+
+def get_block_key(draft_id:str, image_block:str, image_dir:str, output_dir:str, prefix:str=None) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for part in [str(PARSER_VERSION), draft_id, image_dir, output_dir, prefix or "", image_block]:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class ParseCache:
+    # parsed image blocks by block key, kept in memory and (given a state store) on disk.
+    # an entry is valid while the styles the block may reference have the same fingerprints.
+    # results are stored encoded (see common.data.codec), so callers always get their own copy to modify.
+
+    def __init__(self, state_store:"StateStore"=None, max_entries:int=None):
+        if max_entries is None:
+            max_entries = DEFAULT_MAX_ENTRIES
+        self.state_store = state_store
+        self.max_entries = max_entries
+        # least recently used first.
+        self._entries:Dict[str, tuple] = OrderedDict()
+        self._unsaved:Dict[str, tuple] = dict()
+        # keys of blocks reused since the last flush, so the store keeps them over older blocks.
+        self._used:Set[str] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, block_key:str, entry:tuple):
+        self._entries[block_key] = entry
+        self._entries.move_to_end(block_key)
+        while len(self._entries) > self.max_entries:
+            # unsaved entries are kept in _unsaved until the next flush.
+            self._entries.popitem(last=False)
+
+    def _load(self, block_key:str) -> Optional[tuple]:
+        entry = self._entries.get(block_key)
+        if entry is not None:
+            self._entries.move_to_end(block_key)
+        else:
+            entry = self._unsaved.get(block_key)
+            if entry is None and self.state_store is not None:
+                entry = self.state_store.get_parsed_block(block_key)
+            if entry is not None:
+                self._remember(block_key, entry)
+        return entry
+
+    def get(self, block_key:str, style_fingerprints:Dict[str, str]) -> Any:
+        entry = self._load(block_key)
+        if entry is not None:
+            referenced_style_fingerprints, result = entry
+            if all(style_fingerprints.get(style_id) == fingerprint for style_id, fingerprint in referenced_style_fingerprints.items()):
+                try:
+                    result = codec.loads(result)
+                except Exception as e:
+                    # written by another version of the data classes.
+                    logger.debug(f"Discarding cached block {block_key}: {e}")
+                else:
+                    self.hits += 1
+                    self._used.add(block_key)
+                    return result
+        self.misses += 1
+        return None
+
+    def put(self, block_key:str, referenced_style_fingerprints:Dict[str, Optional[str]], result:Any):
+        entry = (referenced_style_fingerprints, codec.dumps(result))
+        self._remember(block_key, entry)
+        self._unsaved[block_key] = entry
+
+    def flush(self):
+        if self.state_store is not None:
+            if self._unsaved:
+                self.state_store.put_parsed_blocks(self._unsaved)
+            if self._used:
+                self.state_store.touch_parsed_blocks(self._used.difference(self._unsaved))
+        self._unsaved = dict()
+        self._used = set()
@@ -1,12 +1,154 @@
 import logging
 import re
-from typing import List, Dict, Union
+from collections.abc import Mapping
+from typing import Iterator, List, Dict, Optional, Set, Tuple, Union
 
 from kksubs.data.subtitle.style import *
 from kksubs.data.subtitle.style_row_enum import STYLE_ROW_ENUM
 
 logger = logging.getLogger(__name__)
 
+class StyleRegistry(Mapping):
+    # the styles of styles.yml by style ID. matrix styles are only built when they are looked up,
+    # since a matrix can describe thousands of styles of which drafts use a few.
+    # as when filling a dict in file order, a matrix overrides earlier styles with the same IDs.
+    # single styles inherit their parents when they are resolved, so parents may be defined anywhere in the file;
+    # each style is resolved once, after its parents, and shared by all its descendants. styles are frozen when resolved.
+
+    def __init__(self):
+        # single styles (runs of them in dicts, with their parent style IDs) and matrices, in file order.
+        self._sources:List[Union[Dict[str, Tuple[Style, List[str]]], StyleMatrix]] = list()
+        self._resolved:Dict[str, Optional[Style]] = dict()
+        # inheritance edges (child, parent) that close cycles, which are ignored.
+        self._cyclic:Set[Tuple[str, str]] = set()
+
+    def add_style(self, style:Style, parent_style_ids:List[str]=None):
+        if not self._sources or not isinstance(self._sources[-1], dict):
+            self._sources.append(dict())
+        self._sources[-1][style.style_id] = (style, parent_style_ids or list())
+        self._resolved.clear()
+        self._cyclic.clear()
+
+    def add_matrix(self, matrix:StyleMatrix):
+        self._sources.append(matrix)
+        self._resolved.clear()
+        self._cyclic.clear()
+
+    def has_style(self, style_id:str) -> bool:
+        # whether a style has the ID, without resolving it.
+        for source in self._sources:
+            if isinstance(source, dict):
+                if style_id in source:
+                    return True
+            elif source.get_style(style_id) is not None:
+                return True
+        return False
+
+    def _get_single_style(self, style_id:str) -> Optional[Tuple[Style, List[str]]]:
+        # the single style with the ID and its parent style IDs, unless a later matrix overrides it.
+        for source in reversed(self._sources):
+            if isinstance(source, dict):
+                if style_id in source:
+                    return source[style_id]
+            elif source.get_style(style_id) is not None:
+                return None
+        return None
+
+    def _inherit(self, style_id:str, style:Style, parent_style_ids:List[str]) -> Style:
+        # called once the single styles among the parents are resolved.
+        if not parent_style_ids:
+            return style.freeze()
+        style = style.copy_on_write()
+        for parent_style_id in parent_style_ids:
+            if (style_id, parent_style_id) in self._cyclic:
+                continue
+            parent_style = self._resolve(parent_style_id)
+            if parent_style is None:
+                logger.error(f"Style ID {parent_style_id} not found.")
+                continue
+            style.inherit(parent_style)
+        return style.freeze()
+
+    def _resolve_single_styles(self, style_id:str, entry:Tuple[Style, List[str]]):
+        # resolves a single style after the single styles it inherits from (a depth first search in topological
+        # order, with its own stack since inheritance chains may be deeper than the recursion limit).
+        # an inheritance edge that closes a cycle is reported and ignored.
+        stack = [(style_id, entry, iter(entry[1]))]
+        visiting = [style_id]
+        while stack:
+            current_style_id, current_entry, parent_style_ids = stack[-1]
+            for parent_style_id in parent_style_ids:
+                if parent_style_id in self._resolved:
+                    continue
+                if parent_style_id in visiting:
+                    cycle = visiting[visiting.index(parent_style_id):] + [parent_style_id]
+                    logger.error(f"Style inheritance cycle {' -> '.join(cycle)}: {current_style_id} does not inherit {parent_style_id}.")
+                    self._cyclic.add((current_style_id, parent_style_id))
+                    continue
+                parent_entry = self._get_single_style(parent_style_id)
+                if parent_entry is not None:
+                    stack.append((parent_style_id, parent_entry, iter(parent_entry[1])))
+                    visiting.append(parent_style_id)
+                    break
+            else:
+                stack.pop()
+                visiting.pop()
+                self._resolved[current_style_id] = self._inherit(current_style_id, *current_entry)
+
+    def _resolve(self, style_id:str) -> Optional[Style]:
+        if style_id in self._resolved:
+            return self._resolved[style_id]
+        style:Style = None
+        for source in reversed(self._sources):
+            if isinstance(source, dict):
+                if style_id in source:
+                    self._resolve_single_styles(style_id, source[style_id])
+                    return self._resolved[style_id]
+            else:
+                style = source.get_style(style_id)
+                if style is not None:
+                    style.freeze()
+                    break
+        self._resolved[style_id] = style
+        return style
+
+    def resolve_styles(self):
+        # resolves every single style now, so missing parents and cycles are reported when styles.yml is read.
+        for source in self._sources:
+            if isinstance(source, dict):
+                for style_id in source:
+                    self._resolve(style_id)
+
+    def get(self, style_id:str, default=None) -> Optional[Style]:
+        style = self._resolve(style_id)
+        return default if style is None else style
+
+    def __getitem__(self, style_id:str) -> Style:
+        style = self._resolve(style_id)
+        if style is None:
+            raise KeyError(style_id)
+        return style
+
+    def __contains__(self, style_id:object) -> bool:
+        return self._resolve(style_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        # lists every style ID, including those of matrices (without building their styles).
+        style_ids = set()
+        for source in self._sources:
+            for style_id in (source.keys() if isinstance(source, dict) else source.get_style_ids()):
+                if style_id not in style_ids:
+                    style_ids.add(style_id)
+                    yield style_id
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        style_count = sum(len(source) for source in self._sources if isinstance(source, dict))
+        matrix_count = len(self._sources) - sum(1 for source in self._sources if isinstance(source, dict))
+        return f"StyleRegistry({style_count} style(s), {matrix_count} matrix source(s), {len(self._resolved)} looked up)"
+
 def _get_inherited_style_ids(input_style_id) -> List[str]:
     # returns parent profile ID or None.
     match = re.search(r'\((.*?)\)', input_style_id)
@@ -14,24 +156,17 @@ def _get_inherited_style_ids(input_style_id) -> List[str]:
         return list(map(lambda grp: grp.strip(), match.group(1).split(",")))
     return []
 
-def _process_single_style(style_data:Dict, styles:Dict[str, Style]):
+def _process_single_style(style_data:Dict, styles:StyleRegistry):
     style = Style.deserialize(style_data)
 
-    # style inheritance logic.
+    # style inheritance logic: parents are inherited when the style is resolved.
     parent_style_ids = _get_inherited_style_ids(style.style_id)
-    for parent_style_id in parent_style_ids:
-        if parent_style_id not in styles.keys():
-            logger.error(f"Style ID {parent_style_id} not found.")
-            continue
-        parent_style = styles.get(parent_style_id)
-        # style.coalesce(parent_style)
-        style.inherit(parent_style)
     style.style_id = style.style_id.split("(")[0]
 
-    if style.style_id in styles.keys():
+    if styles.has_style(style.style_id):
         logger.warning(f"Style ID conflict: {style.style_id} already in styles; skipping.")
         return
-    styles[style.style_id] = style
+    styles.add_style(style, parent_style_ids)
     return
 
 def _process_layer_data(layer_data, matrix:StyleMatrix) -> Layer:
@@ -60,7 +195,7 @@ def _process_layer_data(layer_data, matrix:StyleMatrix) -> Layer:
     else:
         raise TypeError(layer_data, type(layer_data))
 
-def _process_matrix(style_data:Dict, styles:Dict[str, Style]):
+def _process_matrix(style_data:Dict, styles:StyleRegistry):
 
     matrix = StyleMatrix()
     layer_data_list:List[Union[str, List[Dict]]] = style_data.get('matrix')
@@ -68,12 +203,12 @@ def _process_matrix(style_data:Dict, styles:Dict[str, Style]):
     for layer_data in layer_data_list:
         _process_layer_data(layer_data, matrix)
         
-    for style in matrix.out():
-        styles[style.style_id] = style
+    # its styles are built when drafts use them.
+    styles.add_matrix(matrix)
 
     return
 
-def _process_entity(style_data:Dict, styles:Dict[str, Style]):
+def _process_entity(style_data:Dict, styles:StyleRegistry):
     # check if entity is a style or style matrix.
 
     if 'style_id' in style_data:
@@ -83,15 +218,52 @@ def _process_entity(style_data:Dict, styles:Dict[str, Style]):
     
     return
 
-def extract_styles(styles_contents:List[dict]) -> Dict[str, Style]:
+def fingerprint_style(style:Style) -> str:
+    # styles are stored resolved (parents inherited, matrix rows projected), so a change anywhere
+    # in the inheritance chain or matrix changes the fingerprints of the styles built from it.
+    return style.fingerprint()
+
+class StyleFingerprints(Mapping):
+    # fingerprints of styles by style ID, computed when first looked up (so matrix styles are not all built).
+
+    def __init__(self, styles:Mapping):
+        self.styles = styles
+        self._fingerprints:Dict[str, str] = dict()
+
+    def get(self, style_id:str, default=None) -> Optional[str]:
+        fingerprint = self._fingerprints.get(style_id)
+        if fingerprint is None:
+            style = self.styles.get(style_id)
+            if style is None:
+                return default
+            fingerprint = self._fingerprints[style_id] = fingerprint_style(style)
+        return fingerprint
+
+    def __getitem__(self, style_id:str) -> str:
+        fingerprint = self.get(style_id)
+        if fingerprint is None:
+            raise KeyError(style_id)
+        return fingerprint
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.styles)
+
+    def __len__(self) -> int:
+        return len(self.styles)
+
+def get_style_fingerprints(styles:Mapping) -> StyleFingerprints:
+    return StyleFingerprints(styles)
+
+def extract_styles(styles_contents:List[dict]) -> StyleRegistry:
 
-    styles:Dict[str, Style] = dict()
+    styles = StyleRegistry()
     logger.debug(f"Extracting styles from {styles_contents}.")
     if not styles_contents:
         return styles
     
     for style_data in styles_contents:
         _process_entity(style_data, styles)
+    styles.resolve_styles()
     
-    logger.debug(f'Obtained styles {styles.keys()}.')
-    return styles
\ No newline at end of file
+    logger.debug(f'Obtained styles {styles}.')
+    return styles
@@ -0,0 +1,87 @@
+import hashlib
+import logging
+import os
+import pickle
+from typing import Optional
+
+import yaml
+
+from kksubs.service.extraction.style import StyleRegistry, extract_styles
+
+logger = logging.getLogger(__name__)
+
+# part of every cache key; bump when styles are resolved differently or the style classes change.
+STYLE_CACHE_VERSION = 3
+
+# compiled styles of other styles.yml contents (e.g. other projects, or before an undo) that are kept.
+MAX_CACHED_STYLES = 16
+
+def get_styles_key(styles_contents:bytes) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(STYLE_CACHE_VERSION).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(styles_contents)
+    return digest.hexdigest()
+
+class StyleCache:
+    # resolved styles by the content hash of styles.yml, pickled into `directory` so they are loaded in one read,
+    # and kept in memory across watch cycles. styles.yml is only parsed and resolved again when it changes.
+
+    def __init__(self, directory:str=None):
+        self.directory = directory
+        self._key:str = None
+        self._styles:StyleRegistry = None
+        self.hits = 0
+        self.misses = 0
+
+    def get_path(self, key:str) -> str:
+        return os.path.join(self.directory, key + '.pickle')
+
+    def _load(self, key:str) -> Optional[StyleRegistry]:
+        if self.directory is None or not os.path.isfile(self.get_path(key)):
+            return None
+        try:
+            with open(self.get_path(key), 'rb') as reader:
+                styles = pickle.load(reader)
+            if not isinstance(styles, StyleRegistry):
+                raise TypeError(type(styles))
+            return styles
+        except Exception as e:
+            # e.g. written by a version with other style classes; it is compiled again.
+            logger.warning(f"Discarding unreadable compiled styles {self.get_path(key)}: {e}")
+            return None
+
+    def _save(self, key:str, styles:StyleRegistry):
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.get_path(key) + '.tmp'
+        with open(temp_path, 'wb') as writer:
+            pickle.dump(styles, writer, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.get_path(key))
+        self._prune()
+
+    def _prune(self):
+        paths = [os.path.join(self.directory, filename) for filename in os.listdir(self.directory) if filename.endswith('.pickle')]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[MAX_CACHED_STYLES:]:
+            os.remove(path)
+
+    def get(self, styles_contents:bytes) -> StyleRegistry:
+        # the resolved styles of the contents of a styles.yml.
+        key = get_styles_key(styles_contents)
+        if key == self._key:
+            self.hits += 1
+            return self._styles
+
+        styles = self._load(key)
+        if styles is not None:
+            self.hits += 1
+            # most recently used entries are kept.
+            os.utime(self.get_path(key))
+        else:
+            self.misses += 1
+            styles = extract_styles(yaml.safe_load(styles_contents.decode('utf-8')))
+            self._save(key, styles)
+        self._key, self._styles = key, styles
+        return styles
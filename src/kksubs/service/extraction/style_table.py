@@ -0,0 +1,49 @@
+import logging
+import weakref
+from typing import Iterable
+
+from kksubs.data.subtitle.style import Style
+from kksubs.data.subtitle.subtitle import SubtitleGroup
+
+logger = logging.getLogger(__name__)
+
+class StyleTable:
+    # canonical instances of fully resolved styles by fingerprint, so subtitles with identical styles share one
+    # frozen style: in memory, in pickles of their subtitles, and as keys of caches by style.
+    # instances are held weakly, so styles that no subtitle uses any more are dropped.
+
+    def __init__(self):
+        self._styles:"weakref.WeakValueDictionary[str, Style]" = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    def intern(self, style:Style) -> Style:
+        # the canonical instance of the style; the style is frozen, and must not be changed after it is resolved.
+        if style is None:
+            return None
+        fingerprint = style.freeze().fingerprint()
+        interned = self._styles.get(fingerprint)
+        if interned is None:
+            self.misses += 1
+            self._styles[fingerprint] = style
+            return style
+        self.hits += 1
+        return interned
+
+    def intern_subtitle_groups(self, subtitle_groups:Iterable[SubtitleGroup]):
+        # e.g. for groups read from a cache, whose styles are copies.
+        for subtitle_group in subtitle_groups:
+            for subtitle in subtitle_group.subtitles or []:
+                subtitle.style = self.intern(subtitle.style)
+
+    def __len__(self) -> int:
+        return len(self._styles)
+
+    def __repr__(self) -> str:
+        return f"StyleTable({len(self)} style(s), {self.hits} hit(s), {self.misses} miss(es))"
+
+# shared by every draft of the process.
+STYLE_TABLE = StyleTable()
+
+def intern_style(style:Style) -> Style:
+    return STYLE_TABLE.intern(style)
@@ -1,95 +1,57 @@
 import logging
-from typing import Dict, List, Set
-from copy import deepcopy
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from kksubs.data.subtitle.style_attributes import *
 from kksubs.data.subtitle.style import Style
 from kksubs.data.subtitle.subtitle import Subtitle, SubtitleGroup
+from kksubs.service.extraction.attribute_paths import AttributeNode, get_style_attribute
+from kksubs.service.extraction.parse_cache import ParseCache, get_block_key
+from kksubs.service.extraction.style import get_style_fingerprints
+from kksubs.service.extraction.style_table import STYLE_TABLE, intern_style
+from kksubs.service.extraction.tokenizer import DraftToken, ImageBlock, read_image_blocks, tokenize_draft
 # from kksubs.data.subtitle.subtitle import Background, BaseData, BoxData, Brightness, Gaussian, Mask, Motion, OutlineData, OutlineData1, Style, Subtitle, SubtitleGroup, TextData
 
 # parsing/extraction, filtering, standardization
 logger = logging.getLogger(__name__)
 
-default_style_by_field_name:Dict[str, BaseData] = {
-    base_data.field_name:base_data for base_data in [
-        TextData, 
-        OutlineData, 
-        OutlineData1, 
-        BoxData, 
-        Asset,
-        Brightness, 
-        Gaussian, 
-        Motion, 
-        Background, 
-        Mask,
-        Style
-    ]
-}
-
-def _is_valid_nested_attribute(style:BaseData, nested_attribute:str) -> bool:
-    attributes = nested_attribute.split(".")
-    if len(attributes) == 1:
-        return hasattr(style, attributes[0])
-    
-    # check if attribute corresponds to a style.
-    if attributes[0] in default_style_by_field_name.keys():
-        return _is_valid_nested_attribute(default_style_by_field_name[attributes[0]](), ".".join(attributes[1:]))
-    
-    raise KeyError(style.field_name, nested_attribute)
-
-def _give_attributes_to_style(base_style:Style, attributes:List[str], value):
-    # print(attributes, type(base_style))
-    
-    if len(attributes) == 1:
-        return setattr(base_style, attributes[0], value)
-    
-    if getattr(base_style, attributes[0]) is None:
-        setattr(base_style, attributes[0], default_style_by_field_name[attributes[0]]())
-    return _give_attributes_to_style(getattr(base_style, attributes[0]), attributes[1:], value)
+# shared by every subtitle, like the styles in styles.yml; styles are composed copy-on-write, so it is never changed.
+_DEFAULT_STYLE = Style.get_default().freeze()
 
-def _add_data_to_style(line:str, subtitle:Subtitle, styles:Dict[str, Style]):
+def _add_data_to_style(token:DraftToken, attribute:AttributeNode, subtitle:Subtitle, styles:Dict[str, Style]):
     # adds data to style.
 
-    key, value = line.split(":", 1)
-    value = value.strip()
+    key, value = token.key, token.value.strip()
     
     if key == "style_id":
-        # replace style with style ID.
-        subtitle.style = styles.get(value)
+        # replace style with style ID; later lines change a copy.
+        style = styles.get(value)
+        subtitle.style = style.copy_on_write() if style is not None else None
+        subtitle.style_ids.append(value)
     
     else:
-        attributes = key.split(".")
-        _give_attributes_to_style(subtitle.style, attributes, value)
+        attribute.set_value(subtitle.style, value)
 
     pass
 
-def _extract_subtitles_from_image_block(textstring:str, content_keys:Set[str], styles:Dict[str, Style]) -> List[Subtitle]:
+def _extract_subtitles_from_image_block(tokens:List[DraftToken], styles:Dict[str, Style]) -> List[Subtitle]:
+    # state machine over the lines of one copy of an image; each line is classified by lookups of its key
+    # in the styles (content aliases) and in the trie of style attributes.
     
     subtitles:List[Subtitle] = []
-    lines = textstring.strip().split("\n")
     in_content_environment = False
     in_style_environment = False
     is_start_of_subtitle = True
-
-    def get_has_content_key(line:str):
-        return any(line.startswith(key+":") for key in content_keys)
-    
-    def get_has_attr_key(line:str):
-        # print(line, line.split(":", 1))
-        if len(line.split(":", 1)) == 2:
-            # print("ping")
-            return _is_valid_nested_attribute(default_style_by_field_name["style"](), line.split(":")[0])
-        return False
-        # return any(line.startswith(key+":") for key in style_keys)
     
     empty_lines:List[str]
     content:List[str]
-    for i, line in enumerate(lines):
+    for i, token in enumerate(tokens):
         # identify the start of a subtitle.
 
-        has_content_key = get_has_content_key(line)
-        has_style_key = get_has_attr_key(line)
-        # has_next_line = i+1 <= len(lines)-1
+        key = token.key
+        has_content_key = key is not None and (key == "content" or key in styles)
+        attribute = get_style_attribute(key) if key is not None else None
+        has_style_key = attribute is not None
 
         # state check.
         if not in_style_environment and has_style_key:
@@ -109,26 +71,20 @@ def _extract_subtitles_from_image_block(textstring:str, content_keys:Set[str], s
             style = Style()
             content = []
             empty_lines = []
-            subtitle = Subtitle(content=content, style=style)
+            subtitle = Subtitle(content=content, style=style, style_ids=[])
             subtitles.append(subtitle)
 
         # content environment logic
         if in_content_environment:
             if has_content_key:
-                lsplit = line.split(":", 1)
-                if len(lsplit) == 2:
-                    key, line_content = lsplit
-                    if key == "content":
-                        pass
-                    else: # apply alias as style.
-                        # deep copy to enforce independence between subtitle objects, esp. for child styles.
-                        style.coalesce(deepcopy(styles.get(key)))
-                else:
-                    line_content = ""
-
-                line_content = lsplit[1].lstrip() if len(lsplit) == 2 else ""
+                if key != "content":
+                    # apply alias as style.
+                    # the alias' data is shared, not copied; it is frozen, so subtitles copy it before changing it.
+                    style.coalesce(styles.get(key))
+                    subtitle.style_ids.append(key)
+                line_content = token.value.lstrip()
             else:
-                line_content = line
+                line_content = token.text
             if not line_content:
                 empty_lines.append(line_content)
             else:
@@ -139,79 +95,122 @@ def _extract_subtitles_from_image_block(textstring:str, content_keys:Set[str], s
         # style logic
         if in_style_environment:
             if has_style_key:
-                _add_data_to_style(line, subtitle, styles)
+                _add_data_to_style(token, attribute, subtitle, styles)
             pass
 
-        # print(
-        #     int(is_start_of_subtitle), 
-        #     int(in_content_environment),
-        #     int(in_attr_environment),
-        #     "line: ", line
-        # )
-
-    # correct subtitle styling data.
+    # correct subtitle styling data; the resolved styles of most subtitles are the same, and are shared.
     for subtitle in subtitles:
+        if "default" in styles:
+            subtitle.style_ids.append("default")
         subtitle.style.coalesce(styles.get("default"))
-        subtitle.style.coalesce(Style.get_default())
+        subtitle.style.coalesce(_DEFAULT_STYLE)
         subtitle.style.correct_values()
+        subtitle.style = intern_style(subtitle.style)
 
-    # print(lines)
-    # print(subtitles)
     return subtitles
 
+def split_image_blocks(draft_body:str) -> List[ImageBlock]:
+    # tokenizes the draft in one pass.
+    return list(read_image_blocks(tokenize_draft(draft_body)))
+
+def get_referenced_style_ids(image_block:ImageBlock) -> Set[str]:
+    # every style ID that could affect how the block is parsed: line keys (which are content aliases
+    # if such a style exists), style_id values and the default style.
+    style_ids = {"default"}
+    for token in image_block.get_keyed_tokens():
+        style_ids.add(token.key)
+        if token.key == "style_id":
+            style_ids.add(token.value.strip())
+    return style_ids
+
+def extract_image_block(
+        draft_id:str, image_block:ImageBlock, styles:Dict[str, Style], image_dir:str, output_dir:str, prefix:str=None
+) -> Tuple[str, Optional[List[SubtitleGroup]]]:
+    # returns the image ID and its subtitle groups, or None if the image is hidden.
+    subtitle_groups:List[SubtitleGroup] = list()
+    image_id = image_block.image_id
+
+    if not image_block.has_body:
+        subtitle_group = SubtitleGroup(subtitles=list())
+        subtitle_group.complete_path_info(draft_id, image_id, image_dir, output_dir, prefix=prefix)
+        subtitle_group.subtitles.append(Subtitle([], style=intern_style(Style.get_default().corrected())))
+        subtitle_groups = [subtitle_group]
+
+    else:
+        
+        # hide implementation
+        if image_block.hidden:
+            return image_id, None
+
+        # sep implementation
+        segments = image_block.get_segments()
+        if len(segments) <= 1:
+            subtitle_group = SubtitleGroup(subtitles=list())
+            subtitle_group.complete_path_info(draft_id, image_id, image_dir, output_dir)
+            subtitle_group.subtitles = _extract_subtitles_from_image_block(segments[0], styles)
+            subtitle_groups.append(subtitle_group)
+        else:
+            for i, segment in enumerate(segments):
+                subtitle_group = SubtitleGroup(subtitles=list())
+                subtitle_group.complete_path_info(draft_id, image_id, image_dir, output_dir, prefix=prefix, suffix=f'_{i}')
+                subtitle_group.subtitles = _extract_subtitles_from_image_block(segment, styles)
+                subtitle_groups.append(subtitle_group)
+
+    for subtitle_group in subtitle_groups or []:
+        # fingerprints are computed once at parse time, and kept with the groups (also in the parse cache).
+        subtitle_group.fingerprint()
+    return image_id, subtitle_groups
+
+def iter_subtitle_groups(
+        draft_id:str, image_blocks:Iterable[ImageBlock], styles:Dict[str, Style], image_dir:str, output_dir:str,
+        prefix:str=None, parse_cache:"ParseCache"=None, style_fingerprints:Dict[str, str]=None,
+) -> Iterator[Tuple[str, Optional[List[SubtitleGroup]]]]:
+    # the image ID and subtitle groups (None if hidden) of each block, parsed as the blocks are read.
+    # with a parse cache, only blocks whose text or referenced styles changed are parsed again.
+    if parse_cache is not None and style_fingerprints is None:
+        style_fingerprints = get_style_fingerprints(styles)
+    if parse_cache is not None:
+        hits, misses = parse_cache.hits, parse_cache.misses
+
+    for image_block in image_blocks:
+        if parse_cache is None:
+            image_id, subtitle_groups = extract_image_block(draft_id, image_block, styles, image_dir, output_dir, prefix=prefix)
+        else:
+            block_key = get_block_key(draft_id, image_block.text, image_dir, output_dir, prefix)
+            cached = parse_cache.get(block_key, style_fingerprints)
+            if cached is not None:
+                image_id, subtitle_groups = cached
+                for subtitle_group in subtitle_groups or []:
+                    # not part of the block text.
+                    subtitle_group.image_modified_time = os.path.getmtime(subtitle_group.input_image_path)
+                STYLE_TABLE.intern_subtitle_groups(subtitle_groups or [])
+            else:
+                image_id, subtitle_groups = extract_image_block(draft_id, image_block, styles, image_dir, output_dir, prefix=prefix)
+                referenced_style_fingerprints = {
+                    style_id:style_fingerprints.get(style_id) for style_id in get_referenced_style_ids(image_block)
+                }
+                parse_cache.put(block_key, referenced_style_fingerprints, (image_id, subtitle_groups))
+        yield image_id, subtitle_groups
+
+    if parse_cache is not None:
+        parse_cache.flush()
+        logger.info(f"Parsed {parse_cache.misses - misses} block(s) of draft {draft_id}, {parse_cache.hits - hits} cached.")
+
 def extract_subtitle_groups(
-        draft_id:str, draft_body:str, styles:Dict[str, Style], image_dir:str, output_dir:str, prefix:str=None
+        draft_id:str, draft_body:str, styles:Dict[str, Style], image_dir:str, output_dir:str, prefix:str=None,
+        parse_cache:"ParseCache"=None, style_fingerprints:Dict[str, str]=None,
 ) -> Dict[str, List[SubtitleGroup]]:
     # extract subtitle groups from draft
     logger.info(f"Extracting subtitle groups.")
 
     # subtitles = dict()
     subtitle_groups_by_image_id:Dict[str, List[SubtitleGroup]] = dict()
-    content_keys = {"content"}.union(styles.keys())
-    # remove comments
-    draft_body = "\n".join(list(filter(lambda line:not line.startswith("#"), draft_body.split("\n"))))
-
-    # split lines for draft
-    image_blocks = draft_body.split("image_id:")
-
-    for image_block in image_blocks:
-        subtitle_groups:List[SubtitleGroup] = list()
-
-        image_block = image_block.strip()
-        if not image_block:
+    for image_id, subtitle_groups in iter_subtitle_groups(
+        draft_id, split_image_blocks(draft_body), styles, image_dir, output_dir, prefix=prefix,
+        parse_cache=parse_cache, style_fingerprints=style_fingerprints,
+    ):
+        if subtitle_groups is None:
             continue
-
-        # add subtitles.
-        image_block_split = image_block.split("\n", 1)
-        image_id = image_block_split[0].strip()
-
-        if len(image_block_split) == 1:
-            subtitle_group = SubtitleGroup(subtitles=list())
-            subtitle_group.complete_path_info(draft_id, image_id, image_dir, output_dir, prefix=prefix)
-            subtitle_group.subtitles.append(Subtitle([], style=Style.get_default().corrected()))
-            subtitle_groups = [subtitle_group]
-
-        else:
-            
-            # hide implementation
-            lines = image_block_split[1].split('\n')
-            if any(map(lambda i:'hide:' in lines, lines)):
-                continue
-
-            # sep implementation
-            image_block_seps = image_block_split[1].split('sep:')
-            if len(image_block_seps) <= 1:
-                subtitle_group = SubtitleGroup(subtitles=list())
-                subtitle_group.complete_path_info(draft_id, image_id, image_dir, output_dir)
-                subtitle_group.subtitles = _extract_subtitles_from_image_block(image_block_seps[0], content_keys, styles)
-                subtitle_groups.append(subtitle_group)
-            else:
-                for i, sep in enumerate(image_block_seps):
-                    subtitle_group = SubtitleGroup(subtitles=list())
-                    subtitle_group.complete_path_info(draft_id, image_id, image_dir, output_dir, prefix=prefix, suffix=f'_{i}')
-                    subtitle_group.subtitles = _extract_subtitles_from_image_block(sep, content_keys, styles)
-                    subtitle_groups.append(subtitle_group)
-
         subtitle_groups_by_image_id[image_id] = subtitle_groups
 
     return subtitle_groups_by_image_id
\ No newline at end of file
@@ -0,0 +1,138 @@
+import logging
+from typing import Dict, Iterable, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+# token kinds.
+IMAGE_ID = "image_id"
+SEP = "sep"
+HIDE = "hide"
+LINE = "line"
+
+class DraftToken:
+    # a line of a draft, with its key and value split at the first colon (both None for lines without one).
+
+    def __init__(self, kind:str, line_number:int, text:str):
+        self.kind = kind
+        self.line_number = line_number
+        self.text = text
+        key, colon, value = text.partition(":")
+        self.key = key if colon else None
+        self.value = value if colon else None
+
+    def __repr__(self):
+        return f"DraftToken({self.kind}, line {self.line_number}, {self.text!r})"
+
+def read_draft_lines(draft_path:str) -> Iterator[str]:
+    # the lines of a draft file as they are read, split like draft_body.split("\n") (so a draft that ends with a
+    # newline ends with an empty line), without reading the whole file.
+    with open(draft_path, "r", encoding="utf-8") as reader:
+        line = ""
+        for line in reader:
+            yield line[:-1] if line.endswith("\n") else line
+        if not line or line.endswith("\n"):
+            yield ""
+
+def tokenize_lines(lines:Iterable[str]) -> Iterator[DraftToken]:
+    # one pass over the lines of a draft; comments are dropped.
+    for line_number, line in enumerate(lines, start=1):
+        if line.startswith("#"):
+            continue
+        stripped_line = line.lstrip()
+        if stripped_line.startswith("image_id:"):
+            yield DraftToken(IMAGE_ID, line_number, stripped_line)
+        elif stripped_line.startswith("sep:"):
+            yield DraftToken(SEP, line_number, stripped_line)
+        elif line.rstrip() == "hide:":
+            yield DraftToken(HIDE, line_number, line)
+        else:
+            yield DraftToken(LINE, line_number, line)
+
+def tokenize_draft(draft_body:str) -> Iterator[DraftToken]:
+    return tokenize_lines(draft_body.split("\n"))
+
+def _strip_tokens(tokens:List[DraftToken]) -> List[DraftToken]:
+    # drops blank lines around the tokens and strips the outer lines, like str.strip on their text.
+    start, end = 0, len(tokens)
+    while start < end and not tokens[start].text.strip():
+        start += 1
+    while end > start and not tokens[end-1].text.strip():
+        end -= 1
+    tokens = tokens[start:end]
+    if not tokens:
+        return tokens
+    tokens[0] = DraftToken(tokens[0].kind, tokens[0].line_number, tokens[0].text.lstrip())
+    tokens[-1] = DraftToken(tokens[-1].kind, tokens[-1].line_number, tokens[-1].text.rstrip())
+    return tokens
+
+class ImageBlock:
+    # the lines of a draft from an image_id line up to the next one.
+
+    def __init__(self, image_id_token:DraftToken):
+        self.image_id = image_id_token.value.strip()
+        self.line_number = image_id_token.line_number
+        self.tokens:List[DraftToken] = [image_id_token]
+        self.hidden = False
+        # whether any line after the image_id line has text.
+        self.has_body = False
+
+    def add(self, token:DraftToken):
+        self.tokens.append(token)
+        if token.kind == HIDE:
+            self.hidden = True
+        if token.kind != LINE or token.text.strip():
+            self.has_body = True
+
+    @property
+    def text(self) -> str:
+        # the source of the block without comments.
+        return "\n".join(token.text for token in self.tokens)
+
+    def get_keyed_tokens(self) -> Iterator[DraftToken]:
+        return (token for token in self.tokens if token.key is not None)
+
+    def get_segments(self) -> List[List[DraftToken]]:
+        # lines of each copy of the image, split at sep lines; text after sep: starts the next copy.
+        segments:List[List[DraftToken]] = [list()]
+        for token in self.tokens[1:]:
+            if token.kind == SEP:
+                segments.append(list())
+                if token.value.strip():
+                    segments[-1].append(DraftToken(LINE, token.line_number, token.value))
+                continue
+            segments[-1].append(token)
+        return list(map(_strip_tokens, segments))
+
+def read_image_blocks(tokens:Iterable[DraftToken]) -> Iterator[ImageBlock]:
+    block:ImageBlock = None
+    for token in tokens:
+        if token.kind == IMAGE_ID:
+            if block is not None:
+                yield block
+            block = ImageBlock(token)
+            if not block.image_id:
+                logger.warning(f"Ignoring image_id without an image on line {token.line_number}.")
+                block = None
+        elif block is not None:
+            block.add(token)
+        elif token.text.strip():
+            logger.warning(f"Ignoring line {token.line_number} outside of an image block: {token.text!r}")
+    if block is not None:
+        yield block
+
+def get_shown_block_lines(tokens:Iterable[DraftToken]) -> Dict[str, int]:
+    # the line of the block that gives the subtitles of each image: its last block that is not hidden, as later
+    # blocks replace earlier ones (see extract_subtitle_groups). found in a quick pass ahead of streaming a draft,
+    # so that replaced blocks are never rendered.
+    shown_block_lines:Dict[str, int] = dict()
+    image_id, line_number, hidden = None, None, False
+    for token in tokens:
+        if token.kind == IMAGE_ID:
+            if image_id and not hidden:
+                shown_block_lines[image_id] = line_number
+            image_id, line_number, hidden = token.value.strip(), token.line_number, False
+        elif token.kind == HIDE:
+            hidden = True
+    if image_id and not hidden:
+        shown_block_lines[image_id] = line_number
+    return shown_block_lines
@@ -0,0 +1,92 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# how incremental updating decides that an image must be subtitled again:
+# mtime compares modification times, fingerprint compares content hashes.
+CHANGE_DETECTION_MODES = ['mtime', 'fingerprint']
+
+CHUNK_SIZE = 1024**2
+
+def validate_change_detection(change_detection:str):
+    if change_detection not in CHANGE_DETECTION_MODES:
+        raise ValueError(f"Unknown change detection {change_detection}, expected one of {CHANGE_DETECTION_MODES}.")
+
+def hash_file(path:str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as reader:
+        while chunk := reader.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_file_key(path:str) -> Tuple[int, int, int]:
+    # changes whenever the file may have changed; a copy gets a new key but the same hash.
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+class FingerprintCache:
+    # content hashes of files, reused while (size, mtime_ns, inode) is unchanged,
+    # so unchanged files are not read again. persisted to `path` when saved, without files that no longer exist;
+    # the file is shared by every project, so it would otherwise keep every file ever hashed.
+
+    def __init__(self, path:str=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries:Dict[str, Tuple[Tuple[int, int, int], str]] = dict()
+        self._changed = False
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as reader:
+                self._entries = pickle.load(reader)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError) as e:
+            logger.warning(f"Discarding unreadable fingerprint cache {self.path}: {e}")
+            self._entries = dict()
+
+    def prune(self) -> int:
+        # drops the hashes of files that no longer exist, e.g. of deleted projects or renamed captures.
+        with self._lock:
+            removed_paths = [path for path in self._entries if not os.path.exists(path)]
+            for path in removed_paths:
+                del self._entries[path]
+            if removed_paths:
+                self._changed = True
+        return len(removed_paths)
+
+    def save(self):
+        if self.path is None:
+            return
+        self.prune()
+        if not self._changed:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with self._lock:
+            with open(temp_path, "wb") as writer:
+                pickle.dump(self._entries, writer)
+            os.replace(temp_path, self.path)
+            self._changed = False
+
+    def get(self, path:str) -> str:
+        path = os.path.realpath(path)
+        key = get_file_key(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry[1]
+        fingerprint = hash_file(path)
+        with self._lock:
+            self.misses += 1
+            self._entries[path] = (key, fingerprint)
+            self._changed = True
+        return fingerprint
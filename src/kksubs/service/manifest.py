@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+from typing import Dict
+
+from kksubs.service.state_store import Dependency, OutputRecord
+
+logger = logging.getLogger(__name__)
+
+# written into each draft's output directory, so it is synced and checked out with the outputs.
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+class ManifestEntry:
+    # what an output in the manifest was rendered from: its record without timestamps,
+    # and the content hash of its capture, since modification times do not survive a sync.
+
+    def __init__(self, record:OutputRecord, image_fingerprint:str=None):
+        self.record = record
+        self.image_fingerprint = image_fingerprint
+
+    def matches(self, record:OutputRecord, image_fingerprint:str) -> bool:
+        if image_fingerprint is None or image_fingerprint != self.image_fingerprint:
+            return False
+        return record.fingerprint == self.record.fingerprint and not record.get_changed_dependencies(self.record)
+
+    def serialize(self) -> Dict:
+        return {
+            'fingerprint': self.record.fingerprint,
+            'image_fingerprint': self.image_fingerprint,
+            'dependencies': [dependency.__dict__ for dependency in self.record.dependencies],
+        }
+
+    @classmethod
+    def deserialize(cls, image_id:str, data:Dict) -> "ManifestEntry":
+        dependencies = [Dependency(**dependency) for dependency in data.get('dependencies', [])]
+        return ManifestEntry(OutputRecord(image_id, data['fingerprint'], dependencies=dependencies), data.get('image_fingerprint'))
+
+    def __eq__(self, other:object) -> bool:
+        if not isinstance(other, ManifestEntry):
+            return False
+        return self.__dict__ == other.__dict__
+
+    def __repr__(self) -> str:
+        return str(self.__dict__)
+
+class OutputManifest:
+    # portable record of the outputs of a draft. paths in it are relative to the project,
+    # so the incremental planner can trust it on another machine or after a checkout, when there is no local state.
+
+    def __init__(self, draft_output_dir:str):
+        self.path = os.path.join(draft_output_dir, MANIFEST_FILENAME)
+
+    def read(self) -> Dict[str, ManifestEntry]:
+        if not os.path.isfile(self.path):
+            return dict()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as reader:
+                data = json.load(reader)
+            if data.get('version') != MANIFEST_VERSION:
+                logger.warning(f"Ignoring manifest {self.path} with unsupported version {data.get('version')}.")
+                return dict()
+            return {image_id:ManifestEntry.deserialize(image_id, entry) for image_id, entry in data['outputs'].items()}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # an unreadable manifest only costs a full render.
+            logger.warning(f"Ignoring unreadable manifest {self.path}: {e}")
+            return dict()
+
+    def write(self, entries:Dict[str, ManifestEntry]):
+        # call only with entries whose output images are saved.
+        data = {
+            'version': MANIFEST_VERSION,
+            'outputs': {image_id:entries[image_id].serialize() for image_id in sorted(entries)},
+        }
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as writer:
+            json.dump(data, writer, indent=2)
+        os.replace(temp_path, self.path)
+
+    def remove(self):
+        if os.path.isfile(self.path):
+            os.remove(self.path)
@@ -0,0 +1,13 @@
+# imported once by the forkserver, so that compose workers forked from it start with
+# the heavy modules imported and the bundled font parsed.
+import cv2
+import numpy
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter, ImageFont
+
+from kksubs.data.subtitle.style_attributes import TextData
+from kksubs.service.subtitle import _get_default_font, get_font
+import kksubs.service.sub_project
+
+default_font = _get_default_font()
+if default_font is not None:
+    get_font(default_font, TextData.get_default().size)
@@ -0,0 +1,338 @@
+from collections import deque
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Set
+
+from PIL import Image
+
+from kksubs.data.subtitle.style import Style
+from kksubs.data.subtitle.subtitle import SubtitleGroup
+from kksubs.service.executor import ComposeExecutor, InlineExecutor, get_executor_class, get_start_methods
+from kksubs.service.thread_budget import ThreadBudget
+
+logger = logging.getLogger(__name__)
+
+# working images are RGBA.
+BYTES_PER_PIXEL = 4
+
+# full-size buffers alive for the whole task: decoded capture, working image and encoder buffer.
+BASE_BUFFERS = 3
+
+def count_style_layers(style:Style) -> int:
+    # number of full-size buffers alive at the peak of rendering one subtitle with this style.
+    if style is None:
+        return 0
+    layers = 1 # text layer
+    for outline_data in [style.outline_data, style.outline_data_1]:
+        if outline_data is not None:
+            # outline layer, plus a blurred copy of the image when blurred.
+            layers += 2 if outline_data.blur else 1
+    for effect in [style.brightness, style.gaussian]:
+        if effect is not None and effect.value is not None:
+            layers += 1
+    if style.motion is not None and style.motion.value:
+        # cv2 conversions and the filtered output.
+        layers += 3
+    if style.mask is not None and style.mask.path is not None:
+        layers += 1
+    if style.background is not None and style.background.path is not None:
+        layers += 1
+    if style.asset_data is not None and style.asset_data.path is not None:
+        layers += 1
+    if style.styles:
+        layers += max(map(count_style_layers, style.styles))
+    return layers
+
+def get_image_size(image_path:str) -> tuple:
+    # reads the image header only.
+    with Image.open(image_path) as image:
+        return image.size
+
+def estimate_task_memory(subtitle_group:SubtitleGroup) -> int:
+    # estimated peak memory (bytes) for subtitling one image.
+    try:
+        width, height = get_image_size(subtitle_group.input_image_path)
+    except (OSError, ValueError) as e:
+        # unreadable captures fail (and are reported) in their own task.
+        logger.warning(f"Cannot read size of {subtitle_group.input_image_path}: {e}")
+        return 0
+    subtitles = subtitle_group.subtitles or []
+    # layers are released after each subtitle, so the peak is the heaviest subtitle.
+    layers = max((count_style_layers(subtitle.style) for subtitle in subtitles), default=0)
+    return width * height * BYTES_PER_PIXEL * (BASE_BUFFERS + layers)
+
+def format_memory_size(size:int) -> str:
+    return f"{size / 1024**2:.0f}MB"
+
+class ComposeTask:
+    # a unit of work submitted to the scheduler.
+
+    def __init__(self, args:tuple, memory:int=None, on_complete:Callable=None, name:str=None):
+        if memory is None:
+            memory = 0
+        self.args = args
+        self.memory = memory
+        # called in the scheduling process after the task succeeds.
+        self.on_complete = on_complete
+        self.name = name
+
+        self.attempts = 0
+        # when the running attempt started; its deadline runs from then.
+        self.started_at:Optional[float] = None
+        # identifies the running attempt, so late results of abandoned attempts are ignored.
+        self.attempt_id:Optional[object] = None
+
+class ComposeFailure:
+    # a task that failed on every attempt.
+
+    def __init__(self, task:ComposeTask, error:BaseException):
+        self.task = task
+        self.error = error
+
+    def __str__(self) -> str:
+        return f"{self.task.name}: {type(self.error).__name__}: {self.error} (attempts: {self.task.attempts})"
+
+class ComposeScheduler:
+    # runs compose tasks with at most `jobs` workers of the given executor, and admits tasks 
+    # only while their estimated peak memory fits within `max_memory` (bytes).
+    # a failing task is retried up to `retries` times, and a task running longer than 
+    # `task_timeout` seconds is abandoned; failures are returned rather than raised.
+    # `start_method` selects how worker processes start (fork, spawn or forkserver).
+    # tasks may also be a stream (any iterable but a list), which is read while earlier tasks run.
+
+    def __init__(
+            self, jobs:int=None, max_memory:int=None, executor:str=None, retries:int=None, task_timeout:float=None,
+            start_method:str=None,
+    ):
+        if executor is None:
+            executor = 'process'
+        get_executor_class(executor) # validate
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        if retries is None:
+            retries = 0
+        if jobs < 1:
+            raise ValueError(f"Number of jobs must be positive, got {jobs}.")
+        if max_memory is not None and max_memory <= 0:
+            raise ValueError(f"Memory limit must be positive, got {max_memory}.")
+        if retries < 0:
+            raise ValueError(f"Number of retries cannot be negative, got {retries}.")
+        if task_timeout is not None and task_timeout <= 0:
+            raise ValueError(f"Task timeout must be positive, got {task_timeout}.")
+        if start_method is not None and start_method not in get_start_methods():
+            raise ValueError(f"Unknown start method {start_method}, expected one of {get_start_methods()}.")
+
+        self.jobs = jobs
+        self.max_memory = max_memory
+        self.executor = executor
+        self.retries = retries
+        self.task_timeout = task_timeout
+        self.start_method = start_method
+
+        self._condition = threading.Condition()
+        self._num_workers = jobs
+        self._running:Set[ComposeTask] = set()
+        self._running_memory = 0
+        self._retry:Deque[ComposeTask] = deque()
+        self._failures:List[ComposeFailure] = list()
+        self._timed_out = False
+        self._stream:Optional[Iterator[ComposeTask]] = None
+        self._num_read = 0
+
+    def get_num_workers(self, tasks:List[ComposeTask]=None) -> int:
+        # without tasks (e.g. before a stream is read), the most workers that may be started.
+        if self.executor == InlineExecutor.name:
+            return 1
+        if tasks is None:
+            return self.jobs
+        num_workers = min(self.jobs, len(tasks))
+        if self.max_memory is not None and tasks:
+            # never start workers that the memory budget cannot keep busy.
+            smallest = max(1, min(task.memory for task in tasks))
+            num_workers = min(num_workers, max(1, self.max_memory // smallest))
+        return max(1, num_workers)
+
+    def summary(self, tasks:List[ComposeTask]=None) -> str:
+        budget = "unlimited" if self.max_memory is None else format_memory_size(self.max_memory)
+        num_workers = self.get_num_workers(tasks)
+        executor = self.executor if num_workers > 1 or self.task_timeout is not None else InlineExecutor.name
+        if tasks is None:
+            return f"up to {num_workers} {executor} worker(s), {ThreadBudget(num_workers).summary()}, memory budget {budget}"
+        peak = max((task.memory for task in tasks), default=0)
+        return f"{num_workers} {executor} worker(s), {ThreadBudget(num_workers).summary()}, memory budget {budget}, largest task ~{format_memory_size(peak)}"
+
+    def _fits(self, memory:int) -> bool:
+        if not self._running:
+            # always admit one task, even if it exceeds the budget on its own.
+            return True
+        if len(self._running) >= self._num_workers:
+            return False
+        return self.max_memory is None or self._running_memory + memory <= self.max_memory
+
+    def _admit(self, task:ComposeTask):
+        self._running.add(task)
+        self._running_memory += task.memory
+
+    def _release(self, task:ComposeTask):
+        self._running.discard(task)
+        self._running_memory -= task.memory
+
+    def _fail(self, task:ComposeTask, error:BaseException):
+        # retries keep their admission; called with the condition held.
+        if task.attempts <= self.retries:
+            logger.warning(f"Task {task.name} failed ({type(error).__name__}: {error}), retrying...")
+            self._retry.append(task)
+        else:
+            logger.error(f"Task {task.name} failed: {type(error).__name__}: {error}")
+            self._failures.append(ComposeFailure(task, error))
+            self._release(task)
+
+    def _on_success(self, task:ComposeTask, attempt_id:object):
+        with self._condition:
+            if task.attempt_id is not attempt_id:
+                # a result from an attempt that already timed out.
+                return
+            task.attempt_id = None
+        if task.on_complete is not None:
+            try:
+                task.on_complete()
+            except Exception as e:
+                with self._condition:
+                    self._failures.append(ComposeFailure(task, e))
+                    self._release(task)
+                    self._condition.notify_all()
+                return
+        with self._condition:
+            self._release(task)
+            self._condition.notify_all()
+
+    def _on_error(self, task:ComposeTask, attempt_id:object, error:BaseException):
+        with self._condition:
+            if task.attempt_id is not attempt_id:
+                return
+            task.attempt_id = None
+            self._fail(task, error)
+            self._condition.notify_all()
+
+    def _expire_stragglers(self):
+        # called with the condition held.
+        if self.task_timeout is None:
+            return
+        now = time.monotonic()
+        for task in list(self._running):
+            if task.attempt_id is None or task.started_at is None:
+                continue
+            if now - task.started_at > self.task_timeout:
+                self._timed_out = True
+                # abandon the running attempt; its result is ignored if it ever arrives.
+                task.attempt_id = None
+                self._fail(task, TimeoutError(f"timed out after {self.task_timeout}s"))
+
+    def _submit(self, executor:ComposeExecutor, fn:Callable, task:ComposeTask):
+        with self._condition:
+            task.attempts += 1
+            task.attempt_id = attempt_id = object()
+            task.started_at = None
+        executor.submit(
+            fn, task.args,
+            callback=lambda _: self._on_success(task, attempt_id),
+            error_callback=lambda error: self._on_error(task, attempt_id, error),
+            timeout=self.task_timeout,
+            on_start=lambda: self._on_start(task, attempt_id),
+        )
+
+    def _on_start(self, task:ComposeTask, attempt_id:object):
+        with self._condition:
+            if task.attempt_id is attempt_id:
+                task.started_at = time.monotonic()
+
+    def _prepare(self, task:ComposeTask):
+        task.attempts = 0
+        task.attempt_id = None
+        if task.name is None:
+            task.name = str(self._num_read)
+        self._num_read += 1
+        if self.max_memory is not None and task.memory > self.max_memory:
+            logger.warning(f"Task {task.name} needs ~{format_memory_size(task.memory)}, more than the memory budget; it will run alone.")
+
+    def _read_ahead(self, pending:Deque[ComposeTask]) -> bool:
+        # whether to read the next task of the stream; called with the condition held. a task is read whenever
+        # one could be submitted, and a few more are kept pending, so workers do not wait for the stream.
+        return self._stream is not None and len(pending) < self._num_workers
+
+    def _next_task(self, pending:Deque[ComposeTask]) -> Optional[ComposeTask]:
+        # waits for the next task that may be submitted; None when all tasks are done.
+        while True:
+            with self._condition:
+                while True:
+                    self._expire_stragglers()
+                    if self._retry:
+                        return self._retry.popleft()
+                    if pending and self._fits(pending[0].memory):
+                        task = pending.popleft()
+                        self._admit(task)
+                        return task
+                    if self._read_ahead(pending):
+                        break
+                    if not pending and not self._running:
+                        return None
+                    self._condition.wait(timeout=self.task_timeout and min(1, self.task_timeout))
+            # the stream is read without the condition, so results keep being handled meanwhile.
+            task = next(self._stream, None)
+            if task is None:
+                self._stream = None
+                continue
+            self._prepare(task)
+            with self._condition:
+                pending.append(task)
+
+    def run(self, fn:Callable, tasks:Iterable[ComposeTask], allow_multiprocessing:bool=True) -> List[ComposeFailure]:
+        self._stream = None
+        self._num_read = 0
+        if not isinstance(tasks, list):
+            # workers are sized by the first tasks; a stream that ends within them runs like a list.
+            stream = iter(tasks)
+            tasks = list(itertools.islice(stream, self.jobs))
+            if len(tasks) == self.jobs:
+                self._stream = stream
+        if not tasks:
+            return []
+
+        self._num_workers = self.get_num_workers(tasks)
+        self._running = set()
+        self._running_memory = 0
+        self._retry = deque()
+        self._failures = list()
+        self._timed_out = False
+        for task in tasks:
+            self._prepare(task)
+
+        pending = deque(tasks)
+        executor = self.create_executor(self._num_workers, allow_multiprocessing=allow_multiprocessing)
+        try:
+            while (task := self._next_task(pending)) is not None:
+                self._submit(executor, fn, task)
+            if self._timed_out:
+                # abandoned workers may never return.
+                executor.terminate()
+            else:
+                executor.close()
+        except KeyboardInterrupt:
+            logger.info("Received KeyboardInterrupt, terminating workers...")
+            executor.terminate()
+            raise
+        except BaseException:
+            executor.terminate()
+            raise
+        finally:
+            self._stream = None
+        return self._failures
+
+    def create_executor(self, num_workers:int, allow_multiprocessing:bool=True) -> ComposeExecutor:
+        if not allow_multiprocessing or (num_workers == 1 and self.task_timeout is None):
+            # a single worker gains nothing from a pool, unless it must enforce deadlines.
+            return InlineExecutor(1)
+        return get_executor_class(self.executor)(num_workers, thread_budget=ThreadBudget(num_workers), start_method=self.start_method)
@@ -0,0 +1,384 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from kksubs.data.subtitle.style import Style
+from kksubs.data.subtitle.subtitle import Subtitle, SubtitleGroup
+
+logger = logging.getLogger(__name__)
+
+# migrations[i] upgrades a database from schema version i to i+1.
+MIGRATIONS:List[List[str]] = [
+    [
+        """CREATE TABLE outputs (
+            project TEXT NOT NULL,
+            draft TEXT NOT NULL,
+            image_id TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            image_modified_time REAL,
+            PRIMARY KEY (project, draft, image_id)
+        )""",
+    ],
+    [
+        # files each output was rendered from; outputs recorded before version 2 with such files are rendered again.
+        """CREATE TABLE dependencies (
+            project TEXT NOT NULL,
+            draft TEXT NOT NULL,
+            image_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            path TEXT NOT NULL,
+            fingerprint TEXT,
+            PRIMARY KEY (project, draft, image_id, kind, path)
+        )""",
+    ],
+    [
+        # parsed draft blocks (see ParseCache); style fingerprints are JSON, results are encoded with common.data.codec.
+        """CREATE TABLE parsed_blocks (
+            block_key TEXT PRIMARY KEY,
+            style_fingerprints TEXT NOT NULL,
+            result BLOB NOT NULL
+        )""",
+    ],
+    [
+        # least recently used drafts and parsed blocks are collected when the store outgrows its size cap.
+        """CREATE TABLE drafts (
+            project TEXT NOT NULL,
+            draft TEXT NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (project, draft)
+        )""",
+        "INSERT INTO drafts (project, draft, last_used) SELECT DISTINCT project, draft, 0 FROM outputs",
+        "ALTER TABLE parsed_blocks ADD COLUMN last_used REAL NOT NULL DEFAULT 0",
+        "CREATE INDEX parsed_blocks_by_last_used ON parsed_blocks (last_used)",
+        # counters of reused and recomputed outputs and blocks, for hit rates.
+        """CREATE TABLE statistics (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )""",
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+DEFAULT_MAX_SIZE = 256 * 1024**2
+
+# (data, path) attributes of the files a style reads.
+STYLE_PATH_ATTRIBUTES = [('text_data', 'font'), ('asset_data', 'path'), ('background', 'path'), ('mask', 'path')]
+
+def get_relative_path(path:str, project_directory:str) -> str:
+    # paths inside the project are recorded relative to it (with forward slashes), so records are portable.
+    if path is None or project_directory is None:
+        return path
+    try:
+        relative_path = os.path.relpath(path, project_directory)
+    except ValueError:
+        # on another drive.
+        return path
+    if relative_path.startswith(os.pardir):
+        return path
+    return relative_path.replace(os.sep, '/')
+
+@lru_cache(maxsize=256)
+def _get_relative_style(style:Style, project_directory:str) -> Style:
+    # the style with the paths of its files relative to the project; the style itself if none is in the project.
+    # styles are interned, so each one is made relative once.
+    relative_style:Style = None
+    for data_attribute, path_attribute in STYLE_PATH_ATTRIBUTES:
+        data = getattr(style, data_attribute)
+        path = getattr(data, path_attribute) if data is not None else None
+        if not isinstance(path, str) or get_relative_path(path, project_directory) == path:
+            continue
+        if relative_style is None:
+            relative_style = style.copy_on_write()
+        data = data.copy_on_write()
+        setattr(data, path_attribute, get_relative_path(path, project_directory))
+        setattr(relative_style, data_attribute, data)
+    if style.styles:
+        styles = [_get_relative_style(sub_style, project_directory) if sub_style is not None else None for sub_style in style.styles]
+        if any(relative is not sub_style for relative, sub_style in zip(styles, style.styles)):
+            if relative_style is None:
+                relative_style = style.copy_on_write()
+            relative_style.styles = styles
+    return relative_style.freeze() if relative_style is not None else style
+
+def fingerprint_subtitle_group(subtitle_group:SubtitleGroup, project_directory:str=None) -> str:
+    # hash of everything that determines the output image, except timestamps.
+    # paths inside the project are hashed relative to it, so fingerprints do not depend on where the project is.
+    return SubtitleGroup(
+        image_id=subtitle_group.image_id,
+        input_image_path=get_relative_path(subtitle_group.input_image_path, project_directory),
+        output_image_path=get_relative_path(subtitle_group.output_image_path, project_directory),
+        subtitles=[
+            Subtitle(
+                subtitle.content,
+                style=_get_relative_style(subtitle.style, project_directory) if subtitle.style is not None and project_directory is not None else subtitle.style,
+                style_ids=subtitle.style_ids,
+            ) for subtitle in subtitle_group.subtitles
+        ] if subtitle_group.subtitles is not None else None,
+        image_fingerprint=subtitle_group.image_fingerprint,
+    ).fingerprint()
+
+class Dependency:
+    # an input of an output besides its capture: a file read when rendering (font, asset, background or mask)
+    # with its content hash, or a style from styles.yml (path is the style ID) with its style fingerprint.
+    # the fingerprint is None while the file or style is missing.
+
+    def __init__(self, kind:str, path:str, fingerprint:str=None):
+        self.kind = kind
+        self.path = path
+        self.fingerprint = fingerprint
+
+    def __eq__(self, other:object) -> bool:
+        if not isinstance(other, Dependency):
+            return False
+        return self.__dict__ == other.__dict__
+
+    def __repr__(self) -> str:
+        return str(self.__dict__)
+
+class OutputRecord:
+    # what an output image was last rendered from.
+
+    def __init__(self, image_id:str, fingerprint:str, image_modified_time:float=None, dependencies:List[Dependency]=None):
+        if dependencies is None:
+            dependencies = list()
+        self.image_id = image_id
+        self.fingerprint = fingerprint
+        self.image_modified_time = image_modified_time
+        # sorted by kind and path.
+        self.dependencies = sorted(dependencies, key=lambda dependency:(dependency.kind, dependency.path))
+
+    def get_changed_dependencies(self, previous:"OutputRecord") -> List[Dependency]:
+        previous_dependencies = {(dependency.kind, dependency.path):dependency for dependency in previous.dependencies}
+        return [dependency for dependency in self.dependencies if previous_dependencies.get((dependency.kind, dependency.path)) != dependency]
+
+    @classmethod
+    def from_subtitle_group(
+            cls, subtitle_group:SubtitleGroup, dependencies:List[Dependency]=None, project_directory:str=None,
+    ) -> "OutputRecord":
+        return OutputRecord(
+            subtitle_group.image_id, fingerprint_subtitle_group(subtitle_group, project_directory), subtitle_group.image_modified_time,
+            dependencies=dependencies,
+        )
+
+    def __eq__(self, other:object) -> bool:
+        if not isinstance(other, OutputRecord):
+            return False
+        return self.__dict__ == other.__dict__
+
+    def __repr__(self) -> str:
+        return str(self.__dict__)
+
+class UnsupportedSchemaError(ValueError):
+    # the database was written by a newer version.
+    pass
+
+class StateStore:
+    # records of rendered outputs by project and draft, in a SQLite database.
+    # each output is updated on its own as soon as it is written, and lookups go through the primary key.
+    # `project` is a namespace given by the caller (see SubtitleProjectService.get_state_namespace).
+
+    def __init__(self, path:str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # callbacks record outputs from the pool's result thread.
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self.migrate()
+
+    def get_version(self) -> int:
+        return self._connection.execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate(self):
+        with self._lock:
+            version = self.get_version()
+            if version > SCHEMA_VERSION:
+                raise UnsupportedSchemaError(f"State store {self.path} has schema version {version}, newer than supported version {SCHEMA_VERSION}.")
+            while version < SCHEMA_VERSION:
+                with self._connection:
+                    for statement in MIGRATIONS[version]:
+                        self._connection.execute(statement)
+                    version += 1
+                    self._connection.execute(f"PRAGMA user_version = {version}")
+                logger.info(f"Migrated state store {self.path} to schema version {version}.")
+
+    def _touch_draft(self, project:str, draft:str):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO drafts (project, draft, last_used) VALUES (?, ?, ?)", (project, draft, time.time()),
+        )
+
+    def read(self, project:str, draft:str) -> Dict[str, OutputRecord]:
+        with self._lock:
+            with self._connection:
+                self._touch_draft(project, draft)
+            rows = self._connection.execute(
+                "SELECT image_id, fingerprint, image_modified_time FROM outputs WHERE project = ? AND draft = ?",
+                (project, draft),
+            ).fetchall()
+            dependency_rows = self._connection.execute(
+                "SELECT image_id, kind, path, fingerprint FROM dependencies WHERE project = ? AND draft = ?",
+                (project, draft),
+            ).fetchall()
+        dependencies:Dict[str, List[Dependency]] = dict()
+        for image_id, *dependency in dependency_rows:
+            dependencies.setdefault(image_id, list()).append(Dependency(*dependency))
+        return {row[0]:OutputRecord(*row, dependencies=dependencies.get(row[0])) for row in rows}
+
+    def get(self, project:str, draft:str, image_id:str) -> OutputRecord:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT image_id, fingerprint, image_modified_time FROM outputs WHERE project = ? AND draft = ? AND image_id = ?",
+                (project, draft, image_id),
+            ).fetchone()
+            if row is None:
+                return None
+            dependency_rows = self._connection.execute(
+                "SELECT kind, path, fingerprint FROM dependencies WHERE project = ? AND draft = ? AND image_id = ?",
+                (project, draft, image_id),
+            ).fetchall()
+        return OutputRecord(*row, dependencies=[Dependency(*dependency) for dependency in dependency_rows])
+
+    def update(self, project:str, draft:str, records:Iterable[OutputRecord]):
+        # call only after the output images of the records are saved.
+        records = list(records)
+        with self._lock, self._connection:
+            self._touch_draft(project, draft)
+            self._delete_dependencies(project, draft, [record.image_id for record in records])
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO outputs (project, draft, image_id, fingerprint, image_modified_time) VALUES (?, ?, ?, ?, ?)",
+                [(project, draft, record.image_id, record.fingerprint, record.image_modified_time) for record in records],
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO dependencies (project, draft, image_id, kind, path, fingerprint) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (project, draft, record.image_id, dependency.kind, dependency.path, dependency.fingerprint) 
+                    for record in records for dependency in record.dependencies
+                ],
+            )
+
+    def _delete_dependencies(self, project:str, draft:str, image_ids:List[str]):
+        self._connection.executemany(
+            "DELETE FROM dependencies WHERE project = ? AND draft = ? AND image_id = ?",
+            [(project, draft, image_id) for image_id in image_ids],
+        )
+
+    def remove(self, project:str, draft:str, image_ids:Iterable[str]=None):
+        # removes the given outputs, or all outputs of the draft.
+        with self._lock, self._connection:
+            if image_ids is None:
+                self._connection.execute("DELETE FROM outputs WHERE project = ? AND draft = ?", (project, draft))
+                self._connection.execute("DELETE FROM dependencies WHERE project = ? AND draft = ?", (project, draft))
+                self._connection.execute("DELETE FROM drafts WHERE project = ? AND draft = ?", (project, draft))
+                return
+            image_ids = list(image_ids)
+            self._connection.executemany(
+                "DELETE FROM outputs WHERE project = ? AND draft = ? AND image_id = ?",
+                [(project, draft, image_id) for image_id in image_ids],
+            )
+            self._delete_dependencies(project, draft, image_ids)
+
+    def get_parsed_block(self, block_key:str) -> Optional[Tuple[Dict[str, Optional[str]], bytes]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT style_fingerprints, result FROM parsed_blocks WHERE block_key = ?", (block_key,),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put_parsed_blocks(self, entries:Dict[str, Tuple[Dict[str, Optional[str]], bytes]]):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO parsed_blocks (block_key, style_fingerprints, result, last_used) VALUES (?, ?, ?, ?)",
+                [
+                    (block_key, json.dumps(style_fingerprints), result, now) 
+                    for block_key, (style_fingerprints, result) in entries.items()
+                ],
+            )
+
+    def touch_parsed_blocks(self, block_keys:Iterable[str]):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "UPDATE parsed_blocks SET last_used = ? WHERE block_key = ?", [(now, block_key) for block_key in block_keys],
+            )
+
+    def add_statistics(self, counts:Dict[str, int]):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO statistics (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+                list(counts.items()),
+            )
+
+    def get_statistics(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._connection.execute("SELECT name, value FROM statistics").fetchall())
+
+    def _get_size(self) -> int:
+        # bytes in use; pages freed by deletions are not counted.
+        page_count = self._connection.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = self._connection.execute("PRAGMA freelist_count").fetchone()[0]
+        page_size = self._connection.execute("PRAGMA page_size").fetchone()[0]
+        return (page_count - freelist_count) * page_size
+
+    def get_size(self) -> int:
+        with self._lock:
+            return self._get_size()
+
+    def collect_garbage(self, max_size:int=None) -> int:
+        # evicts the least recently used drafts (with their outputs) and parsed blocks until the store fits in max_size bytes.
+        # returns the number of drafts and blocks evicted; an evicted draft is rendered again in full, unless its manifest matches.
+        if max_size is None:
+            max_size = DEFAULT_MAX_SIZE
+        evicted = 0
+        with self._lock:
+            while (size := self._get_size()) > max_size:
+                num_entries = self._connection.execute(
+                    "SELECT (SELECT COUNT(*) FROM drafts) + (SELECT COUNT(*) FROM parsed_blocks)"
+                ).fetchone()[0]
+                # evicts the share of entries the excess is of the size, as if entries were of equal size, then checks again.
+                batch_size = max(1, num_entries * (size - max_size) // size)
+                rows = self._connection.execute(
+                    "SELECT project, draft, last_used FROM drafts UNION ALL SELECT NULL, block_key, last_used FROM parsed_blocks "
+                    "ORDER BY last_used LIMIT ?", (batch_size,),
+                ).fetchall()
+                if not rows:
+                    break
+                with self._connection:
+                    for project, key, _ in rows:
+                        if project is None:
+                            self._connection.execute("DELETE FROM parsed_blocks WHERE block_key = ?", (key,))
+                            continue
+                        for table in ['outputs', 'dependencies', 'drafts']:
+                            self._connection.execute(f"DELETE FROM {table} WHERE project = ? AND draft = ?", (project, key))
+                evicted += len(rows)
+            if evicted:
+                self._connection.execute("VACUUM")
+                logger.info(f"Evicted {evicted} least recently used draft(s) and block(s) from state store {self.path}.")
+        return evicted
+
+    def summary(self) -> str:
+        statistics = self.get_statistics()
+        with self._lock:
+            num_drafts = self._connection.execute("SELECT COUNT(*) FROM drafts").fetchone()[0]
+            num_blocks = self._connection.execute("SELECT COUNT(*) FROM parsed_blocks").fetchone()[0]
+        def hit_rate(hits:str, misses:str) -> str:
+            total = statistics.get(hits, 0) + statistics.get(misses, 0)
+            return "n/a" if total == 0 else f"{statistics.get(hits, 0) / total:.0%}"
+        return (
+            f"{self.get_size() / 1024**2:.1f}MB, {num_drafts} draft(s), {num_blocks} parsed block(s); "
+            f"outputs reused {hit_rate('outputs_reused', 'outputs_rendered')}, blocks reused {hit_rate('blocks_reused', 'blocks_parsed')}"
+        )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -2,8 +2,9 @@ import os
 import logging
 import shutil
 import traceback
+from functools import cache, partial
 from PIL import Image
-from typing import Dict, List
+from typing import Callable, Dict, Iterator, List, Set, Tuple
 import yaml
 import multiprocessing
 import time
@@ -15,9 +16,17 @@ from kksubs.data.subtitle.style import Style
 from kksubs.data.subtitle.subtitle import SubtitleGroup
 from common.exceptions import *
 
-from kksubs.service.extraction.subtitle import extract_subtitle_groups
-from kksubs.service.extraction.style import extract_styles
-from kksubs.service.subtitle import add_subtitles_to_image
+from kksubs.service.extraction.subtitle import iter_subtitle_groups
+from kksubs.service.extraction.parse_cache import ParseCache
+from kksubs.service.extraction.style import StyleRegistry, extract_styles, get_style_fingerprints
+from kksubs.service.extraction.style_cache import StyleCache
+from kksubs.service.extraction.style_table import intern_style
+from kksubs.service.extraction.tokenizer import get_shown_block_lines, read_draft_lines, read_image_blocks, tokenize_lines
+from kksubs.service.fingerprint import FingerprintCache, validate_change_detection
+from kksubs.service.manifest import MANIFEST_FILENAME, ManifestEntry, OutputManifest
+from kksubs.service.scheduler import ComposeScheduler, ComposeTask, estimate_task_memory
+from kksubs.service.state_store import DEFAULT_MAX_SIZE, Dependency, OutputRecord, StateStore, UnsupportedSchemaError, get_relative_path
+from kksubs.service.subtitle import add_subtitles_to_image, get_file_dependencies
 from kksubs.utils.renamer import rename_images, update_images_in_textpath
 
 logger = logging.getLogger(__name__)
@@ -26,7 +35,7 @@ def add_subtitle_group_process(
         i,
         subtitle_group:SubtitleGroup,
         project_directory:str,
-        num_of_images:int
+        num_of_images:int=None
 ):
     image_path = subtitle_group.input_image_path
     image = Image.open(image_path)
@@ -40,8 +49,13 @@ def add_subtitle_group_process(
     
     save_path = subtitle_group.output_image_path
     os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    subtitled_image.save(save_path)
-    logger.info(f"Added subtitles to image {i+1}/{num_of_images}.")
+    # write then rename, so an interrupted save never leaves a partial output behind.
+    temp_path = save_path + ".tmp"
+    image_format = Image.registered_extensions().get(os.path.splitext(save_path)[1].lower())
+    subtitled_image.save(temp_path, format=image_format)
+    os.replace(temp_path, save_path)
+    # the number of images is not known while a draft is streamed.
+    logger.info(f"Added subtitles to image {i+1}/{num_of_images}." if num_of_images is not None else f"Added subtitles to image {i+1}.")
 
 def add_subtitle_process(
         i, 
@@ -75,10 +89,13 @@ class SubtitleProjectService:
             self, workspace_directory:str=None,
             metadata_directory:str=None,
             state_directory:str=None,
+            state_store_path:str=None,
             images_dir:str=None,
             drafts_dir:str=None,
             outputs_dir:str=None,
             styles_path:str=None,
+            project_id:str=None,
+            state_max_size:int=None,
     ):
         if workspace_directory is None:
             raise NotImplementedError("Workspace directory must be implemented.")
@@ -91,7 +108,12 @@ class SubtitleProjectService:
             metadata_directory = os.path.join(os.path.expanduser("~"), ".kksubs")
 
         if state_directory is None:
+            # legacy pickled draft states, imported into the state store.
             state_directory = os.path.join(metadata_directory, 'subtitle_journal')
+        if state_store_path is None:
+            state_store_path = os.path.join(metadata_directory, 'state.db')
+        if state_max_size is None:
+            state_max_size = DEFAULT_MAX_SIZE
         if images_dir is None:
             images_dir = os.path.realpath(os.path.join(workspace_directory, "images"))
         if drafts_dir is None:
@@ -104,10 +126,17 @@ class SubtitleProjectService:
         self.workspace_dir = workspace_directory
         self.metadata_directory = metadata_directory
         self.state_directory = state_directory
+        self.state_store_path = state_store_path
+        self.state_max_size = state_max_size
+        self._state_store:StateStore = None
+        self._parse_cache:ParseCache = None
+        self._style_cache:StyleCache = None
         self.images_dir = images_dir
         self.drafts_dir = drafts_dir
         self.outputs_dir = outputs_dir
         self.styles_path = styles_path
+        # identifies the project checked out in the workspace (e.g. by koi), which may hold different projects over time.
+        self.project_id = project_id
 
         # if create:
         #     self.create()
@@ -238,28 +267,115 @@ class SubtitleProjectService:
         #     text_path = os.path.join(self.drafts_dir, text_id)
         #     update_images_in_textpath(text_path, image_paths, new_image_paths=new_image_paths)
 
-    def read_previous_state(self, state_path:str) -> Dict[str, SubtitleGroup]:
-        with open(state_path, "rb") as reader:
-            logger.info(f"Reading previous state from {state_path}")
+    def get_fingerprint_cache_path(self) -> str:
+        # shared by all projects; entries are keyed by real path.
+        return os.path.join(self.metadata_directory, 'fingerprints')
+
+    def get_state_namespace(self) -> str:
+        # state store records are kept apart by workspace and project.
+        if self.project_id is None:
+            return self.workspace_dir
+        return f"{self.workspace_dir}::{self.project_id}"
+
+    def get_state_store(self) -> StateStore:
+        # opened once and kept for the watcher's lifetime.
+        if self._state_store is None:
             try:
+                self._state_store = StateStore(self.state_store_path)
+            except UnsupportedSchemaError as e:
+                # left as it is for the newer version; records are kept in memory instead, so outputs are
+                # rendered again unless their manifests match.
+                logger.warning(f"{e} Keeping records in memory for this session.")
+                self._state_store = StateStore(":memory:")
+        return self._state_store
+
+    def get_parse_cache(self) -> ParseCache:
+        # kept in memory across watch cycles, and in the state store across runs.
+        if self._parse_cache is None:
+            self._parse_cache = ParseCache(self.get_state_store())
+        return self._parse_cache
+
+    def get_style_cache(self) -> StyleCache:
+        # kept in memory across watch cycles, and in the metadata directory across runs.
+        if self._style_cache is None:
+            self._style_cache = StyleCache(os.path.join(self.metadata_directory, 'styles'))
+        return self._style_cache
+
+    def get_styles(self) -> StyleRegistry:
+        # resolved styles of styles.yml, compiled again only when it changes.
+        if not os.path.exists(self.styles_path):
+            logger.info("No styles configured: will use default styles or ones found in draft.")
+            return extract_styles(list())
+        with open(self.styles_path, "rb") as reader:
+            styles_contents = reader.read()
+        return self.get_style_cache().get(styles_contents)
+
+    def import_legacy_state(self, draft_name:str):
+        # moves a pickled draft state (Dict[str, SubtitleGroup]) written by earlier versions into the state store.
+        state_path = self.get_state_path(draft_name)
+        if not os.path.isfile(state_path):
+            return
+        logger.info(f"Importing previous state from {state_path}")
+        try:
+            with open(state_path, "rb") as reader:
                 previous_draft_state:Dict[str, SubtitleGroup] = pickle.load(reader)
-                return previous_draft_state
-            except AttributeError:
-                logger.error(f"""
-An attribute error occurred while reading previous state path.
-This usually indicates that the state path is written by an outdated program.
-The program will now delete the previous state and try again...
-
-Original error message: {traceback.format_exc()} 
-                """)
-                previous_draft_state = dict()
-                os.remove(state_path)
-                raise RetryWatcherPrompt
-            
-    def save_current_state(self, state_path, current_state:Dict[str, SubtitleGroup]):
-        with open(state_path, "wb") as writer:
-            logger.info(f"Saving current subtitle state to {state_path}")
-            pickle.dump(current_state, writer)
+            records = [
+                OutputRecord.from_subtitle_group(subtitle_group, project_directory=self.workspace_dir) 
+                for subtitle_group in previous_draft_state.values()
+            ]
+            self.get_state_store().update(self.get_state_namespace(), draft_name, records)
+        except Exception:
+            # unreadable states only cost a full render.
+            logger.warning(f"Discarding unreadable previous state {state_path}: {traceback.format_exc()}")
+        os.remove(state_path)
+
+    def get_relative_path(self, path:str) -> str:
+        return get_relative_path(path, self.workspace_dir)
+
+    def get_output_records(
+            self, subtitle_group_by_image_id:Dict[str, SubtitleGroup], fingerprint_cache:FingerprintCache=None,
+            style_fingerprints:Dict[str, str]=None, dependencies_by_style:Dict[Style, List[Tuple[str, str]]]=None,
+            fingerprints:Dict[str, str]=None,
+    ) -> Dict[str, OutputRecord]:
+        # records of what each output would be rendered from now, including the files its styles read
+        # and the styles.yml styles its subtitles use.
+        # `dependencies_by_style` and `fingerprints` may be shared by calls for outputs read one at a time.
+        if style_fingerprints is None:
+            style_fingerprints = dict()
+        if fingerprint_cache is None:
+            fingerprint_cache = FingerprintCache()
+        if dependencies_by_style is None:
+            dependencies_by_style = dict()
+        if fingerprints is None:
+            fingerprints = dict()
+        def get_fingerprint(path:str) -> str:
+            if path not in fingerprints:
+                fingerprints[path] = fingerprint_cache.get(path) if os.path.isfile(path) else None
+            return fingerprints[path]
+
+        # subtitles mostly share a few interned styles, so the files of each style are found once.
+        def get_style_dependencies(style:Style) -> List[Tuple[str, str]]:
+            if style not in dependencies_by_style:
+                dependencies_by_style[style] = get_file_dependencies(style, self.workspace_dir)
+            return dependencies_by_style[style]
+
+        records:Dict[str, OutputRecord] = dict()
+        for image_id, subtitle_group in subtitle_group_by_image_id.items():
+            dependencies = {
+                (kind, path) for subtitle in subtitle_group.subtitles or [] 
+                for kind, path in get_style_dependencies(subtitle.style)
+            }
+            style_ids = {style_id for subtitle in subtitle_group.subtitles or [] for style_id in subtitle.style_ids or []}
+            records[image_id] = OutputRecord.from_subtitle_group(subtitle_group, dependencies=[
+                Dependency(kind, self.get_relative_path(path), get_fingerprint(path)) for kind, path in dependencies
+            ] + [
+                Dependency('style', style_id, style_fingerprints.get(style_id)) for style_id in style_ids
+            ], project_directory=self.workspace_dir)
+        return records
+
+    def read_previous_state(self, draft_name:str) -> Dict[str, OutputRecord]:
+        self.import_legacy_state(draft_name)
+        return self.get_state_store().read(self.get_state_namespace(), draft_name)
             
     # def read_previous_state_v2(self, state_path_v2:str) -> Dict[str, SubtitleGroup]:
     #     # extract subtitle groups from yaml file.
@@ -275,86 +391,64 @@ Original error message: {traceback.format_exc()}
     #         data = {key:value.serialize() for key, value in current_state.items()}
     #         yaml.safe_dump(data, yaml_writer)
 
-    def incremental_update(self, draft_name:str, subtitle_group_by_image_id:Dict[str, SubtitleGroup]) -> Dict[str, SubtitleGroup]:
-        # filter subgroup dict by incremental update
-        draft_output_dir = os.path.join(self.outputs_dir, draft_name)
-        draft_id = os.path.splitext(draft_name)[0]
-        # print(draft_output_dir)
-
-        filtered_subtitle_group_by_image_id:Dict[str, SubtitleGroup] = dict()
-        state_path = self.get_state_path(draft_name)
-        # state_path_v2 = self.get_state_path_v2(draft_name)
-
-        if not os.path.exists(self.metadata_directory):
-            logger.info(f"Creating additional data directory.")
-            os.mkdir(self.metadata_directory)
-        if not os.path.exists(self.state_directory):
-            logger.info(f"Creating states directory.")
-            os.mkdir(self.state_directory)
-
-        if not os.path.exists(state_path):
-            logger.info("No previous state for this draft is found.")
-            previous_draft_state:Dict[str, SubtitleGroup] = dict()
-        else:
-            previous_draft_state = self.read_previous_state(state_path)
+    def is_output_outdated(
+            self, subtitle_group:SubtitleGroup, current_record:OutputRecord, previous_record:OutputRecord=None,
+            change_detection:str=None, image_fingerprint:str=None, read_manifest:Callable[[], Dict[str, ManifestEntry]]=None,
+    ) -> bool:
+        # whether an incremental update must subtitle the image (again), decided for each output as it is read.
+        if change_detection is None:
+            change_detection = 'mtime'
+        image_id = subtitle_group.image_id
 
-        # if not os.path.exists(state_path_v2):
-        #     logger.info('No previous state v2 for this draft is found.')
-        #     previous_draft_state:Dict[str, SubtitleGroup] = dict()
-        # else:
-        #     previous_draft_state = self.read_previous_state_v2(state_path_v2)
-
-        # check image deltas
-        # for indeterminate sets, check for two things:
+        # missing outputs are always subtitled. otherwise, check for two things:
         # 1) if curr subtitle group != previous subtitle group.
-        # 2) if image is updated i.e. image.mtime > previous.mtime.
-
-        curr_image_ids = set(subtitle_group_by_image_id.keys())
-        prev_image_ids = set(previous_draft_state.keys())
-        out_image_ids = set(map(os.path.basename, self.get_output_paths(draft_id)))
-
-        d1 = curr_image_ids.intersection(prev_image_ids).intersection(out_image_ids) # indeterminate (1, 2)
-        
-        d2 = curr_image_ids.intersection(prev_image_ids).difference(out_image_ids) # add subtitle.
-        d3 = curr_image_ids.intersection(out_image_ids).difference(prev_image_ids) # indeterminate (1)
-        d4 = prev_image_ids.intersection(out_image_ids).difference(curr_image_ids) # delete output image.
-
-        d5 = curr_image_ids.difference(prev_image_ids).difference(out_image_ids) # add subtitle.
-        d6 = prev_image_ids.difference(curr_image_ids).difference(out_image_ids) # do nothing.
-        d7 = out_image_ids.difference(curr_image_ids).difference(prev_image_ids) # delete output image.
-
-        # print(d1, d2, d3, d4, d5, d6, d7)
-
-        for image_id in d1:
-            subtitle_group = subtitle_group_by_image_id[image_id]
-            previous_subtitle_group = previous_draft_state[image_id]
-            if subtitle_group != previous_subtitle_group:
-                filtered_subtitle_group_by_image_id[image_id] = subtitle_group_by_image_id[image_id]
+        # 2) if image is updated i.e. image.mtime > output.mtime.
+        # groups are compared through the fingerprints of their records.
+        # with fingerprint change detection, the groups carry image hashes and are compared without timestamps,
+        # so copied or touched images are not subtitled again unless their content changed.
+        if not os.path.isfile(subtitle_group.output_image_path):
+            return True
+
+        if previous_record is not None:
+            changed_dependencies = current_record.get_changed_dependencies(previous_record)
+            if changed_dependencies:
+                # a font, asset, background, mask or style used by this output changed.
+                logger.info(f"Dependencies of {image_id} changed: {[f'{dependency.kind} {dependency.path}' for dependency in changed_dependencies]}")
+                return True
+            if change_detection == 'fingerprint':
+                # records written without image hashes never match.
+                return current_record.fingerprint != previous_record.fingerprint
+            if current_record != previous_record:
+                return True
+        else:
+            # outputs without local state, e.g. after a checkout or on another machine, are trusted
+            # while the manifest synced with them matches what they would be rendered from now.
+            manifest = read_manifest() if read_manifest is not None else dict()
+            if image_id in manifest:
+                return not manifest[image_id].matches(current_record, image_fingerprint)
+            if change_detection == 'fingerprint':
+                # nothing records what the output was made from.
+                return True
+
+        image_mtime = subtitle_group.image_modified_time
+        output_mtime = os.path.getmtime(subtitle_group.output_image_path)
+        return image_mtime > output_mtime
+
+    def correct_fonts(self, subtitle_group:SubtitleGroup):
+        # fonts that are not found are looked up in the project.
+        for subtitle in subtitle_group.subtitles:
+            try:
+                font = subtitle.style.text_data.font
+                if font != "default" and not os.path.exists(font):
+                    # the style is shared with other subtitles.
+                    style = subtitle.style.mutable()
+                    style.text_data = style.text_data.mutable()
+                    style.text_data.font = os.path.join(
+                        self.workspace_dir, font
+                    )
+                    subtitle.style = intern_style(style)
+            except AttributeError(f'Font does not exist for a subtitle for {subtitle_group.image_id}.'): # font does not exist.
                 continue
-            image_mtime = subtitle_group.image_modified_time
-            output_mtime = os.path.getmtime(subtitle_group.output_image_path)
-            if image_mtime > output_mtime:
-                filtered_subtitle_group_by_image_id[image_id] = subtitle_group_by_image_id[image_id]
-
-        for image_id in d3:
-            subtitle_group = subtitle_group_by_image_id[image_id]
-            image_mtime = subtitle_group.image_modified_time
-            output_mtime = os.path.getmtime(subtitle_group.output_image_path)
-            if image_mtime > output_mtime:
-                filtered_subtitle_group_by_image_id[image_id] = subtitle_group_by_image_id[image_id]
-
-        for image_id in d4.union(d7):
-            output_image_path = os.path.join(draft_output_dir, image_id)
-            if os.path.exists(output_image_path):
-                os.remove(output_image_path)
-
-        for image_id in d2.union(d5):
-            filtered_subtitle_group_by_image_id[image_id] = subtitle_group_by_image_id[image_id]
-
-        self.save_current_state(state_path, subtitle_group_by_image_id)
-        # self.save_current_state_v2(state_path_v2, subtitle_group_by_image_id)
-
-        return filtered_subtitle_group_by_image_id
 
     def add_subtitles_to_draft(
             self, 
@@ -364,8 +458,13 @@ Original error message: {traceback.format_exc()}
             styles, 
             update_drafts:bool, prefix,
             allow_incremental_updating:bool, 
-            allow_multiprocessing:bool
+            allow_multiprocessing:bool,
+            scheduler:ComposeScheduler=None,
+            change_detection:str=None,
     ):
+        if scheduler is None:
+            scheduler = ComposeScheduler()
+
         # get draft by draft id
         draft_id = os.path.splitext(draft)[0]
         draft_path = os.path.join(self.drafts_dir, draft)
@@ -376,8 +475,6 @@ Original error message: {traceback.format_exc()}
 
         if not os.path.exists(draft_path):
             raise FileNotFoundError(draft_path)
-        with open(draft_path, "r", encoding="utf-8") as reader:
-            draft_body = reader.read()
 
         # extract draft data
         draft_name = os.path.splitext(draft)[0]
@@ -387,31 +484,6 @@ Original error message: {traceback.format_exc()}
             logger.info(f"Output directory for draft {draft_name} not found, making one.")
             os.makedirs(draft_output_dir, exist_ok=True)
 
-        # extract styles and subtitles.
-        # subtitles_by_image_id:Dict[str, List[Subtitle]] = extract_subtitles(draft_body, styles)
-        subtitle_groups_by_image_id_dict:Dict[str, List[SubtitleGroup]] = extract_subtitle_groups(draft_id, draft_body, styles, self.images_dir, self.outputs_dir, prefix=prefix)
-
-        for image_path in list(subtitle_groups_by_image_id_dict):
-            # validate image paths for each subtitle group.
-            input_image_path = os.path.join(self.images_dir, image_path)
-            if not os.path.exists(input_image_path):
-                logger.warning(f"Image ID {image_path} does not exist but is being referenced. These subtitles will be ignored.")
-                del subtitle_groups_by_image_id_dict[image_path]
-                continue
-
-            subtitle_groups_by_image_id = subtitle_groups_by_image_id_dict.get(image_path)
-            # validate fonts
-            for group in subtitle_groups_by_image_id:
-                for subtitle in group.subtitles:
-                    try:
-                        font = subtitle.style.text_data.font
-                        if font != "default" and not os.path.exists(font):
-                            subtitle.style.text_data.font = os.path.join(
-                                self.workspace_dir, font
-                            )
-                    except AttributeError(f'Font does not exist for a subtitle for {image_path}.'): # font does not exist.
-                        continue
-
         # apply subtitles to image with filter.
         if image_filters is None:
             filtered_image_paths = image_paths
@@ -419,66 +491,167 @@ Original error message: {traceback.format_exc()}
             filtered_image_paths = list(map(lambda j:image_paths[j], filter(lambda i:i < len(image_paths), image_filters)))
         logger.debug(f"Got filtered image paths (basename): {list(map(os.path.basename, filtered_image_paths))}")
 
-        # flattening
-        subtitle_group_by_image_id:Dict[str, SubtitleGroup] = {
-            _subtitle_group.image_id:_subtitle_group 
-            for _image_id in subtitle_groups_by_image_id_dict 
-            for _subtitle_group in subtitle_groups_by_image_id_dict[_image_id]
-        }
-        
-        # remove images from output
-        output_images_to_delete = list(set(os.listdir(draft_output_dir)).difference(subtitle_group_by_image_id.keys()))
-        if output_images_to_delete:
-            for image in output_images_to_delete:
-                os.remove(os.path.join(draft_output_dir, image))
-            logger.info(f'Removed images {output_images_to_delete}')
+        # with incremental updating, blocks are only parsed again when their text or styles changed.
+        style_fingerprints = get_style_fingerprints(styles) if allow_incremental_updating else None
+        parse_cache = self.get_parse_cache() if allow_incremental_updating else None
+        parse_hits, parse_misses = (parse_cache.hits, parse_cache.misses) if parse_cache is not None else (0, 0)
 
         # incremental updating (subtitle group)
-        filtered_subtitle_groups_by_image_id = subtitle_group_by_image_id
+        manifest = OutputManifest(draft_output_dir)
+        state_store = self.get_state_store() if allow_incremental_updating else None
         if allow_incremental_updating:
-            filtered_subtitle_groups_by_image_id = self.incremental_update(draft_name, subtitle_group_by_image_id)
-
-        # logger.debug(f"Obtained subtitles: {subtitles_by_image_id}")
-        logger.debug(f'Obtained subtitle groups: {subtitle_groups_by_image_id_dict}')
-
-        subtitle_groups:List[SubtitleGroup] = list()
-        for image_id in filtered_subtitle_groups_by_image_id:
-            subtitle_groups.append(subtitle_group_by_image_id[image_id])
+            if not os.path.exists(self.metadata_directory):
+                logger.info(f"Creating additional data directory.")
+                os.mkdir(self.metadata_directory)
+            previous_draft_state:Dict[str, OutputRecord] = self.read_previous_state(draft_name)
+            if not previous_draft_state:
+                logger.info("No previous state for this draft is found.")
+            # the manifest is only read for outputs without local state.
+            read_manifest = cache(manifest.read)
+            fingerprint_cache = FingerprintCache(self.get_fingerprint_cache_path())
+        else:
+            # outputs are rendered without records, so a previous manifest no longer describes them.
+            manifest.remove()
+
+        # the draft is parsed block by block while its images are subtitled, so subtitling starts with the first
+        # blocks, and only the records of outputs are kept rather than every subtitle group.
+        # the draft is read and tokenized once, so blocks that a later block of their image replaces are skipped
+        # by the same lines that are parsed, even if the draft is saved meanwhile.
+        tokens = list(tokenize_lines(read_draft_lines(draft_path)))
+        shown_block_lines = get_shown_block_lines(tokens)
+        image_blocks = (
+            image_block for image_block in read_image_blocks(tokens)
+            if shown_block_lines.get(image_block.image_id) == image_block.line_number
+        )
+
+        output_image_ids:Set[str] = set()
+        subtitled_image_ids:List[str] = list()
+        current_draft_state:Dict[str, OutputRecord] = dict()
+        manifest_entries:Dict[str, ManifestEntry] = dict()
+        # shared by the records of every output.
+        dependencies_by_style:Dict[Style, List[Tuple[str, str]]] = dict()
+        fingerprints:Dict[str, str] = dict()
+
+        def read_tasks() -> Iterator[ComposeTask]:
+            for image_id, subtitle_groups in iter_subtitle_groups(
+                draft_id, image_blocks, styles, self.images_dir, self.outputs_dir, prefix=prefix,
+                parse_cache=parse_cache, style_fingerprints=style_fingerprints,
+            ):
+                if subtitle_groups is None:
+                    continue
+                # validate image paths for each subtitle group.
+                input_image_path = os.path.join(self.images_dir, image_id)
+                if not os.path.exists(input_image_path):
+                    logger.warning(f"Image ID {image_id} does not exist but is being referenced. These subtitles will be ignored.")
+                    continue
+
+                for subtitle_group in subtitle_groups:
+                    output_image_id = subtitle_group.image_id
+                    if output_image_id in output_image_ids:
+                        logger.warning(f"Output {output_image_id} of image ID {image_id} is already subtitled for another image. These subtitles will be ignored.")
+                        continue
+                    output_image_ids.add(output_image_id)
+                    self.correct_fonts(subtitle_group)
+
+                    if allow_incremental_updating:
+                        # captures are hashed in both modes for the manifest; modification times do not survive a sync.
+                        image_fingerprint = fingerprint_cache.get(subtitle_group.input_image_path)
+                        if change_detection == 'fingerprint':
+                            subtitle_group.image_fingerprint = image_fingerprint
+                        # fonts, assets, backgrounds and masks are fingerprinted in both modes.
+                        current_record = current_draft_state[output_image_id] = self.get_output_records(
+                            {output_image_id:subtitle_group}, fingerprint_cache=fingerprint_cache, 
+                            style_fingerprints=style_fingerprints, dependencies_by_style=dependencies_by_style, 
+                            fingerprints=fingerprints,
+                        )[output_image_id]
+                        manifest_entries[output_image_id] = ManifestEntry(current_record, image_fingerprint)
+                        if not self.is_output_outdated(
+                            subtitle_group, current_record, previous_draft_state.get(output_image_id), 
+                            change_detection=change_detection, image_fingerprint=image_fingerprint, read_manifest=read_manifest,
+                        ):
+                            continue
+
+                    # record each output in the state store once it is written.
+                    subtitled_image_ids.append(output_image_id)
+                    yield ComposeTask(
+                        (len(subtitled_image_ids) - 1, subtitle_group, self.workspace_dir, None), 
+                        memory=estimate_task_memory(subtitle_group),
+                        on_complete=partial(
+                            state_store.update, self.get_state_namespace(), draft_name, [current_draft_state[output_image_id]],
+                        ) if state_store is not None else None,
+                        name=output_image_id,
+                    )
+
+            logger.info(f"Read draft {draft}: subtitling {len(subtitled_image_ids)} images: {subtitled_image_ids}")
+            print(f"Read draft {draft}: subtitling {len(subtitled_image_ids)} images: {subtitled_image_ids}")
+            if not allow_incremental_updating:
+                return
+            fingerprint_cache.save()
+            logger.info(f"Fingerprinted images and dependencies ({fingerprint_cache.misses} file(s) hashed).")
+
+            # only outputs that are already up to date are recorded now. the others keep their previous record 
+            # until their image is written, so an interrupted run resumes where it stopped.
+            subtitled = set(subtitled_image_ids)
+            state_store.remove(self.get_state_namespace(), draft_name, set(previous_draft_state).difference(output_image_ids))
+            state_store.update(self.get_state_namespace(), draft_name, [
+                current_record for image_id, current_record in current_draft_state.items()
+                if image_id not in subtitled and previous_draft_state.get(image_id) != current_record
+            ])
+            # outputs still being rendered are left out until they are written.
+            manifest.write({
+                image_id:entry for image_id, entry in manifest_entries.items() if image_id not in subtitled
+            })
+            state_store.add_statistics({
+                'outputs_reused': len(output_image_ids) - len(subtitled),
+                'outputs_rendered': len(subtitled),
+                'blocks_reused': parse_cache.hits - parse_hits,
+                'blocks_parsed': parse_cache.misses - parse_misses,
+            })
 
-        num_of_images = len(subtitle_groups)
-        output_image_paths = list(map(os.path.basename, map(lambda group:group.output_image_path, subtitle_groups)))
-        logger.info(f"Will begin subtitling {num_of_images} images: {list(map(os.path.basename, output_image_paths))}")
-        print(f"Will begin subtitling {num_of_images} images: {list(map(os.path.basename, output_image_paths))}")
+        if allow_multiprocessing:
+            logger.info(f"Scheduling with {scheduler.summary()}.")
+            print(f"Scheduling with {scheduler.summary()}.")
 
         start_time = time.time()
-        # Note: Windows uses spawn while Linux uses fork.
-        if allow_multiprocessing:
-            pool = multiprocessing.Pool()
-            try:
-                pool.starmap(add_subtitle_group_process, [(i, subtitle_group, self.workspace_dir, num_of_images) for i, subtitle_group in enumerate(subtitle_groups)])
-                pool.close()
-                pool.join()
-            except KeyboardInterrupt:
-                logger.info("Received KeyboardInterrupt, terminating worker processes...")
-                pool.terminate()
-                pool.join()
-                raise
-        else:
-            for i, subtitle_group in enumerate(subtitle_groups):
-                add_subtitle_group_process(i, subtitle_group, self.workspace_dir, num_of_images)
+        # Note: Windows uses spawn while Linux uses fork; see ComposeScheduler.start_method.
+        failures = scheduler.run(add_subtitle_group_process, read_tasks(), allow_multiprocessing=allow_multiprocessing)
         end_time = time.time()
-        logger.info(f'Finished subtitling {num_of_images} images for draft {draft} ({end_time - start_time}s).')
-        print(f'Finished subtitling {num_of_images} images for draft {draft} ({end_time - start_time}s).')
+        if allow_incremental_updating:
+            failed_image_ids = {failure.task.name for failure in failures}
+            manifest.write({image_id:entry for image_id, entry in manifest_entries.items() if image_id not in failed_image_ids})
+
+        # remove images from output; only now, as images are written next to their outputs before they replace them.
+        output_images_to_delete = list(set(os.listdir(draft_output_dir)).difference(output_image_ids).difference([MANIFEST_FILENAME]))
+        if output_images_to_delete:
+            for image in output_images_to_delete:
+                os.remove(os.path.join(draft_output_dir, image))
+            logger.info(f'Removed images {output_images_to_delete}')
+
+        num_of_images = len(subtitled_image_ids)
+        logger.info(f'Finished subtitling {num_of_images - len(failures)} images for draft {draft} ({end_time - start_time}s).')
+        print(f'Finished subtitling {num_of_images - len(failures)} images for draft {draft} ({end_time - start_time}s).')
+        if failures:
+            # failed images are not journaled, so the next incremental update retries them.
+            report = "\n".join(f"  {failure}" for failure in failures)
+            logger.error(f"Failed to subtitle {len(failures)} image(s) for draft {draft}:\n{report}")
+            print(f"Failed to subtitle {len(failures)} image(s) for draft {draft}:\n{report}")
         return
 
-    def add_subtitles(self, drafts:Dict[str, List[int]]=None, prefix:str=None, allow_multiprocessing=True, allow_incremental_updating=None, update_drafts=True):
+    def add_subtitles(
+            self, drafts:Dict[str, List[int]]=None, prefix:str=None, 
+            allow_multiprocessing=True, allow_incremental_updating=None, update_drafts=True,
+            scheduler:ComposeScheduler=None, change_detection:str=None,
+    ):
         if allow_multiprocessing is None:
             allow_multiprocessing = True
         if allow_incremental_updating is None:
-            # incremental updating saves/pickles your previous subtitle into a .kksubs directory, 
+            # incremental updating records your previous subtitles in a state store in the .kksubs directory, 
             # so that future calls only look for changes in the input data,
             # this will speed up the subtitling process by only subtitling images that are actually updated.
             allow_incremental_updating = False
+        if change_detection is None:
+            change_detection = 'mtime'
+        validate_change_detection(change_detection)
 
         if prefix is None:
             prefix = ""
@@ -493,6 +666,10 @@ Original error message: {traceback.format_exc()}
         if allow_incremental_updating:
             logger.info("Incremental updating is enabled.")
 
+        if scheduler is None:
+            # limits concurrency by worker count and memory budget.
+            scheduler = ComposeScheduler()
+
         if not os.path.exists(self.outputs_dir):
             logger.info(f"Output directory for project {self.workspace_dir} not found, making one.")
             os.makedirs(self.outputs_dir, exist_ok=True)
@@ -502,21 +679,19 @@ Original error message: {traceback.format_exc()}
         logger.debug(f"Got images (basename): {list(map(os.path.basename, image_paths))}")
 
         # extract subtitle styles (if any)
-        if not os.path.exists(self.styles_path):
-            logger.info("No styles configured: will use default styles or ones found in draft.")
-            styles_contents = list()
-        else:
-            with open(self.styles_path, "r", encoding="utf-8") as yaml_reader:
-                styles_contents = yaml.safe_load(yaml_reader)
-
-        styles:Dict[str, Style] = extract_styles(styles_contents)
+        styles = self.get_styles()
         logger.debug(f"Obtained styles: {styles}")
 
         for draft in drafts:
             self.add_subtitles_to_draft(
-                draft, drafts, image_paths, styles, update_drafts, prefix, allow_incremental_updating, allow_multiprocessing
+                draft, drafts, image_paths, styles, update_drafts, prefix, allow_incremental_updating, allow_multiprocessing,
+                scheduler=scheduler, change_detection=change_detection,
             )
 
+        if allow_incremental_updating:
+            # the drafts just composed are the most recently used, so they are kept.
+            self.get_state_store().collect_garbage(self.state_max_size)
+
         return 0
     
     # Delete folders in output directory.
@@ -553,8 +728,11 @@ Original error message: {traceback.format_exc()}
                 shutil.rmtree(draft_output_dir)
 
             # search for metadata related to the draft.
+            if os.path.exists(self.state_store_path):
+                logger.info("Deleting previous draft states from the state store.")
+                self.get_state_store().remove(self.get_state_namespace(), draft_name)
             draft_state = self.get_state_path(draft_name)
-            if os.path.exists(draft_state):
+            if os.path.isfile(draft_state):
                 logger.info("Deleting previous draft states from .kksubs file.")
                 os.remove(draft_state)
         return 0
@@ -1,9 +1,11 @@
+from functools import lru_cache
 import os
-from typing import List
+from typing import List, Tuple
 from PIL import Image, ImageFont, ImageFilter, ImageEnhance
 import importlib.resources
 
 from kksubs.data.subtitle.style_attributes import *
+from kksubs.data.subtitle.style import Style
 from kksubs.data.subtitle.subtitle import Subtitle
 # from kksubs.data.subtitle.subtitle import OutlineData, Subtitle
 from kksubs.service.processor.motion_blur import apply_motion_blur
@@ -34,6 +36,7 @@ def get_pil_coordinates(image:Image.Image, anchor, grid4, grid10, nudge):
 
     return tb_anchor_x, tb_anchor_y
 
+@lru_cache(maxsize=None)
 def _get_default_font():
     """Get the default font, trying bundled font first, then system default."""
     try:
@@ -46,6 +49,44 @@ def _get_default_font():
         # If importlib.resources fails, return None for system default
         return None
 
+def resolve_project_path(path:str, project_directory:str) -> str:
+    # paths are tried as given, then relative to the project.
+    if not os.path.exists(path):
+        return os.path.join(project_directory, path)
+    return path
+
+def get_file_dependencies(style:Style, project_directory:str) -> List[Tuple[str, str]]:
+    # files read when rendering a subtitle with this style, as (kind, path), resolved as in add_subtitle_to_image.
+    dependencies = list()
+    if style is None:
+        return dependencies
+    if style.text_data is not None and style.text_data.font not in {None, "default"}:
+        dependencies.append(('font', style.text_data.font))
+    if style.asset_data is not None and style.asset_data.path is not None:
+        dependencies.append(('asset', style.asset_data.path))
+    if style.background is not None and style.background.path is not None:
+        dependencies.append(('background', resolve_project_path(style.background.path, project_directory)))
+    if style.mask is not None and style.mask.path is not None:
+        dependencies.append(('mask', resolve_project_path(style.mask.path, project_directory)))
+    for sub_style in style.styles or []:
+        dependencies.extend(get_file_dependencies(sub_style, project_directory))
+    return dependencies
+
+@lru_cache(maxsize=64)
+def _load_font(font_path:str, font_size:int, modified_time_ns:int, file_size:int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(font_path, font_size)
+
+def get_font(font_path:str, font_size:int) -> ImageFont.FreeTypeFont:
+    # font files are parsed once per process (or once in the forkserver) and reused across subtitles,
+    # until the file changes; the process (or its cache) may outlive many watch cycles.
+    try:
+        stat = os.stat(font_path)
+        modified_time_ns, file_size = stat.st_mtime_ns, stat.st_size
+    except OSError:
+        # e.g. a font name that FreeType looks up by itself.
+        modified_time_ns, file_size = None, None
+    return _load_font(font_path, font_size, modified_time_ns, file_size)
+
 def add_subtitle_to_image(image:Image.Image, subtitle:Subtitle, project_directory:str) -> Image.Image:
 
     # expand subtitle.
@@ -126,8 +167,7 @@ def add_subtitle_to_image(image:Image.Image, subtitle:Subtitle, project_director
     if background is not None:
         bg_path = background.path
         if bg_path is not None:
-            if not os.path.exists(bg_path):
-                bg_path = os.path.join(project_directory, bg_path)
+            bg_path = resolve_project_path(bg_path, project_directory)
             if not os.path.exists(bg_path):
                 logger.warning(f"Background image file {bg_path} cannot be found, skipping background.")
             else:
@@ -147,7 +187,7 @@ def add_subtitle_to_image(image:Image.Image, subtitle:Subtitle, project_director
     font = None
     if font_style is not None:
         try:
-            font = ImageFont.truetype(font_style, font_size)
+            font = get_font(font_style, font_size)
         except (OSError, AttributeError, TypeError) as e:
             logger.warning(f"Failed to create font object from {font_style}: {e}. Skipping text rendering.")
             font = None
@@ -167,8 +207,7 @@ def add_subtitle_to_image(image:Image.Image, subtitle:Subtitle, project_director
     if mask is not None:
         mask_path = mask.path
         if mask_path is not None:
-            if not os.path.exists(mask_path):
-                mask_path = os.path.join(project_directory, mask_path)
+            mask_path = resolve_project_path(mask_path, project_directory)
             if not os.path.exists(mask_path):
                 logger.warning(f"Mask file {mask_path} cannot be found, skipping mask effects.")
             else:
@@ -0,0 +1,69 @@
+from contextlib import contextmanager
+import logging
+import os
+
+import cv2
+
+try:
+    # optional: limits BLAS/OpenMP pools that are already loaded (e.g. in forked workers).
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+logger = logging.getLogger(__name__)
+
+# read by BLAS/OpenMP runtimes when they are first loaded.
+BLAS_THREAD_VARIABLES = [
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+]
+
+def apply_thread_limit(num_threads:int):
+    # limits OpenCV and BLAS threads in the current process.
+    cv2.setNumThreads(num_threads)
+    if threadpool_limits is not None:
+        return threadpool_limits(limits=num_threads)
+    return None
+
+class ThreadBudget:
+    # splits the cores between pool workers so that each worker's OpenCV/BLAS
+    # threads do not oversubscribe the machine (workers x threads <= cores).
+
+    def __init__(self, num_workers:int, cpu_count:int=None):
+        if cpu_count is None:
+            cpu_count = os.cpu_count() or 1
+        self.num_workers = num_workers
+        self.cpu_count = cpu_count
+        self.threads_per_worker = max(1, cpu_count // max(1, num_workers))
+
+    @contextmanager
+    def environment(self):
+        # BLAS thread variables for processes started within this context.
+        previous = {variable:os.environ.get(variable) for variable in BLAS_THREAD_VARIABLES}
+        os.environ.update({variable:str(self.threads_per_worker) for variable in BLAS_THREAD_VARIABLES})
+        try:
+            yield
+        finally:
+            for variable, value in previous.items():
+                if value is None:
+                    os.environ.pop(variable, None)
+                else:
+                    os.environ[variable] = value
+
+    @contextmanager
+    def in_process(self):
+        # limits OpenCV threads of this process, for workers that share it.
+        previous = cv2.getNumThreads()
+        limiter = apply_thread_limit(self.threads_per_worker)
+        try:
+            yield
+        finally:
+            cv2.setNumThreads(previous)
+            if limiter is not None:
+                limiter.restore_original_limits()
+
+    def summary(self) -> str:
+        return f"{self.threads_per_worker} OpenCV/BLAS thread(s) per worker on {self.cpu_count} core(s)"
@@ -45,4 +45,20 @@ def to_xy_coords(value) -> Optional[tuple]:
 def to_string(value) -> Optional[str]:
     if value is None or isinstance(value, str):
         return value
-    raise TypeError(type(value))
\ No newline at end of file
+    raise TypeError(type(value))
+
+def to_memory_size(value) -> Optional[int]:
+    # converts a memory size (e.g. 512M, 4G) to bytes; bare numbers are megabytes.
+    if value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return int(value * 1024**2)
+    if isinstance(value, str):
+        units = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+        value = value.strip().upper()
+        if len(value) > 1 and value[-1] == "B" and value[-2] in units:
+            value = value[:-1]
+        if value and value[-1] in units:
+            return int(float(value[:-1]) * units[value[-1]])
+        return int(float(value) * 1024**2)
+    raise TypeError(type(value))
@@ -25,15 +25,19 @@ class SubtitleWatcher(FileChangeWatcher):
         self.allow_multiprocessing = None
         self.allow_incremental_updating = None
         self.update_drafts = True
+        self.scheduler = None
+        self.change_detection = None
 
     def time(self):
         return datetime.datetime.now().time().strftime('%H:%M:%S')
     
-    def load_watch_arguments(self, drafts=None, prefix=None, allow_multiprocessing=None, allow_incremental_updating=None):
+    def load_watch_arguments(self, drafts=None, prefix=None, allow_multiprocessing=None, allow_incremental_updating=None, scheduler=None, change_detection=None):
         self.drafts = drafts
         self.prefix = prefix
         self.allow_multiprocessing = allow_multiprocessing
         self.allow_incremental_updating = allow_incremental_updating
+        self.scheduler = scheduler
+        self.change_detection = change_detection
 
     def event_trigger_action(self):
         formatted_time = self.time()
@@ -43,7 +47,9 @@ class SubtitleWatcher(FileChangeWatcher):
             drafts=self.drafts, prefix=self.prefix,
             allow_multiprocessing=self.allow_multiprocessing,
             allow_incremental_updating=self.allow_incremental_updating,
-            update_drafts=True
+            update_drafts=True,
+            scheduler=self.scheduler,
+            change_detection=self.change_detection,
             )
     
     def event_idle_action(self):
@@ -0,0 +1,12 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def home_directory(tmp_path_factory):
+    # the state store, caches and application config default to ~/.kksubs; tests never touch the real one.
+    # patched apart from the test's own monkeypatch, which a test may undo.
+    home = tmp_path_factory.mktemp('home')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv('HOME', str(home))
+        monkeypatch.setenv('USERPROFILE', str(home))
+        yield home
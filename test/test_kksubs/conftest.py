@@ -0,0 +1,28 @@
+import os
+import tempfile
+
+import pytest
+from PIL import Image
+
+from kksubs.service.sub_project import SubtitleProjectService
+
+
+@pytest.fixture
+def service():
+    with tempfile.TemporaryDirectory() as test_dir:
+        workspace = os.path.join(test_dir, 'workspace')
+        os.makedirs(workspace)
+        service = SubtitleProjectService(workspace_directory=workspace, metadata_directory=os.path.join(test_dir, 'metadata'))
+        service.create()
+        for i in range(4):
+            Image.new('RGB', (80, 60), (255, 255, 255)).save(os.path.join(service.images_dir, f'{i}.png'))
+        yield service
+
+
+@pytest.fixture
+def write_draft():
+    # writes a draft subtitling each of the service's images with the text.
+    def write_draft(service, text):
+        with open(os.path.join(service.drafts_dir, 'draft.txt'), 'w') as writer:
+            writer.write('\n'.join(f'image_id: {i}.png\ncontent: {text} {i}\n' for i in range(4)))
+    return write_draft
@@ -0,0 +1,34 @@
+import typing
+
+from kksubs.data.abstract import BaseData
+from kksubs.data.subtitle.style import Style
+from kksubs.data.subtitle.style_attributes import Asset, TextData
+from kksubs.service.extraction.attribute_paths import build_attribute_trie, get_style_attribute
+
+
+def test_style_attribute_paths():
+    for key in ["style_id", "text_data.color", "outline_data_1.size", "box_data.anchor", "asset.path", "asset_data.path", "mask.path"]:
+        assert get_style_attribute(key) is not None, key
+    # nested data is not a value, and methods, unknown keys and the attribute names of nested data are not attributes.
+    for key in ["text_data", "coalesce", "field_name", "text_data.coalesce", "text_data.outline_data.color", "Mr. Smith"]:
+        assert get_style_attribute(key) is None, key
+
+    style = Style()
+    get_style_attribute("asset.path").set_value(style, "asset.png")
+    get_style_attribute("text_data.color").set_value(style, "red")
+    assert style.asset_data.path == "asset.png"
+    assert style.text_data.color == "red"
+
+
+def test_optional_annotations_are_nested():
+    # as reported by get_type_hints on python 3.10 for arguments defaulting to None.
+    class OptionalStyle(BaseData):
+        field_name = "style"
+
+        def __init__(self, text_data:typing.Optional[TextData]=None, asset_data:typing.Union[Asset, None]=None):
+            pass
+
+    trie = build_attribute_trie(OptionalStyle)
+    for key in ["text_data.color", "asset.path", "asset_data.path"]:
+        assert trie.get(key) is not None, key
+    assert trie.get("text_data") is None
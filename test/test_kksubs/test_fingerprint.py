@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import time
+
+from PIL import Image
+
+from kksubs.service import sub_project
+from kksubs.service.fingerprint import FingerprintCache
+
+
+def test_fingerprint_cache():
+    with tempfile.TemporaryDirectory() as test_dir:
+        path = os.path.join(test_dir, 'image.png')
+        with open(path, 'wb') as writer:
+            writer.write(b'pixels')
+        cache = FingerprintCache(os.path.join(test_dir, 'fingerprints'))
+        fingerprint = cache.get(path)
+        assert cache.get(path) == fingerprint
+        assert (cache.hits, cache.misses) == (1, 1)
+        cache.save()
+
+        # a copy is hashed again, but has the same fingerprint.
+        copy_path = os.path.join(test_dir, 'copy.png')
+        shutil.copy(path, copy_path)
+        os.replace(copy_path, path)
+        cache = FingerprintCache(cache.path)
+        assert cache.get(path) == fingerprint
+        assert cache.misses == 1
+
+        with open(path, 'wb') as writer:
+            writer.write(b'other pixels')
+        assert cache.get(path) != fingerprint
+
+        # files that no longer exist are dropped when saving.
+        os.remove(path)
+        cache.save()
+        assert len(FingerprintCache(cache.path)._entries) == 0
+
+
+def test_copied_images_are_not_subtitled_again(service, write_draft, monkeypatch):
+    rendered = []
+    monkeypatch.setattr(sub_project, 'add_subtitles_to_image', lambda image, subtitles, project_directory: rendered.append(subtitles[0].content[0]) or image)
+    compose = lambda: service.add_subtitles(allow_multiprocessing=False, allow_incremental_updating=True, update_drafts=False, change_detection='fingerprint')
+
+    write_draft(service, 'hello')
+    compose()
+    assert len(rendered) == 4
+
+    # copying the captures (as a sync does) bumps their modification times.
+    time.sleep(0.01)
+    for image_id in os.listdir(service.images_dir):
+        image_path = os.path.join(service.images_dir, image_id)
+        shutil.copy(image_path, image_path + '.copy')
+        os.replace(image_path + '.copy', image_path)
+    rendered.clear()
+    compose()
+    assert rendered == []
+
+    Image.new('RGB', (80, 60), (0, 0, 0)).save(os.path.join(service.images_dir, '1.png'))
+    compose()
+    assert rendered == ['hello 1']
@@ -6,7 +6,9 @@ from PIL import Image
 from kksubs.data.subtitle.subtitle import Subtitle
 from kksubs.data.subtitle.style import Style
 from kksubs.data.subtitle.style_attributes import TextData, BoxData
-from kksubs.service.subtitle import add_subtitle_to_image
+import shutil
+
+from kksubs.service.subtitle import _get_default_font, add_subtitle_to_image, get_font
 
 
 @pytest.fixture(autouse=True)
@@ -109,4 +111,15 @@ def test_default_font():
         # Should return an image of the same size
         assert result_image.size == test_image.size
     except Exception as e:
-        pytest.fail(f"Default font caused crash: {e}") 
\ No newline at end of file
+        pytest.fail(f"Default font caused crash: {e}") 
+
+def test_changed_font_is_reloaded(tmp_path):
+    """Test that cached fonts are loaded again after their file changes."""
+    font_path = str(tmp_path / "font.ttf")
+    shutil.copyfile(_get_default_font(), font_path)
+    font = get_font(font_path, 48)
+    assert get_font(font_path, 48) is font
+
+    stat = os.stat(font_path)
+    os.utime(font_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert get_font(font_path, 48) is not font
@@ -0,0 +1,49 @@
+import os
+import shutil
+
+from PIL import Image
+
+from kksubs.service import sub_project
+from kksubs.service.manifest import MANIFEST_FILENAME, OutputManifest
+from kksubs.service.sub_project import SubtitleProjectService
+
+
+def test_manifest_travels_with_the_project(service, monkeypatch):
+    rendered = []
+    monkeypatch.setattr(sub_project, 'add_subtitles_to_image', lambda image, subtitles, project_directory: rendered.append(subtitles[0].content[0]) or image)
+    compose = lambda service: service.add_subtitles(allow_multiprocessing=False, allow_incremental_updating=True, update_drafts=False)
+
+    background_path = os.path.join(service.workspace_dir, 'background.png')
+    Image.new('RGBA', (80, 60), (0, 0, 0, 0)).save(background_path)
+    with open(os.path.join(service.drafts_dir, 'draft.txt'), 'w') as writer:
+        writer.write('\n'.join(f'image_id: {i}.png\nbackground.path: background.png\ncontent: hello {i}\n' for i in range(4)))
+    compose(service)
+    assert len(rendered) == 4
+    draft_output_dir = os.path.join(service.outputs_dir, 'draft')
+    manifest = OutputManifest(draft_output_dir).read()
+    assert sorted(manifest) == [f'{i}.png' for i in range(4)]
+    assert [dependency.path for dependency in manifest['0.png'].record.dependencies] == ['background.png']
+
+    # the project is checked out elsewhere, without the local state store; the captures are newer than the outputs.
+    root = os.path.dirname(service.workspace_dir)
+    copy_dir = os.path.join(root, 'copy')
+    shutil.copytree(service.workspace_dir, copy_dir)
+    for image_id in os.listdir(os.path.join(copy_dir, 'images')):
+        os.utime(os.path.join(copy_dir, 'images', image_id), (2**31, 2**31))
+    copy = SubtitleProjectService(workspace_directory=copy_dir, metadata_directory=os.path.join(root, 'copy_metadata'))
+    rendered.clear()
+    compose(copy)
+    assert rendered == []
+    assert sorted(os.listdir(os.path.join(copy.outputs_dir, 'draft'))) == [f'{i}.png' for i in range(4)] + [MANIFEST_FILENAME]
+
+    # the manifest is only trusted while it matches.
+    shutil.copytree(service.workspace_dir, copy_dir, dirs_exist_ok=True)
+    shutil.rmtree(copy.metadata_directory)
+    Image.new('RGB', (80, 60), (0, 0, 0)).save(os.path.join(copy.images_dir, '1.png'))
+    copy = SubtitleProjectService(workspace_directory=copy_dir, metadata_directory=copy.metadata_directory)
+    compose(copy)
+    assert rendered == ['hello 1']
+
+    # outputs rendered without records are not described by the manifest.
+    service.add_subtitles(allow_multiprocessing=False, allow_incremental_updating=False, update_drafts=False)
+    assert not os.path.exists(os.path.join(draft_output_dir, MANIFEST_FILENAME))
@@ -0,0 +1,72 @@
+import os
+import tempfile
+
+from kksubs.service.extraction.parse_cache import ParseCache
+from kksubs.service.extraction.style import extract_styles
+from kksubs.service.extraction.subtitle import extract_subtitle_groups
+from kksubs.service.state_store import StateStore
+
+
+def make_draft(num_blocks, edited=None):
+    blocks = []
+    for i in range(num_blocks):
+        style = 'red' if i % 2 else 'blue'
+        text = 'edited' if i == edited else 'hello'
+        blocks.append(f'image_id: {i}.png\n{style}: {text} {i}\nsep:\ncontent: second {i}\n')
+    return '\n'.join(blocks)
+
+
+def test_parse_cache():
+    with tempfile.TemporaryDirectory() as test_dir:
+        for i in range(10):
+            open(os.path.join(test_dir, f'{i}.png'), 'w').close()
+        styles = extract_styles([{'style_id': 'red', 'text_data': {'color': 'red'}}, {'style_id': 'blue', 'text_data': {'color': 'blue'}}])
+        parse = lambda cache, draft, styles=styles: extract_subtitle_groups('draft', draft, styles, test_dir, test_dir, parse_cache=cache)
+
+        store = StateStore(os.path.join(test_dir, 'state.db'))
+        cache = ParseCache(store)
+        expected = extract_subtitle_groups('draft', make_draft(10), styles, test_dir, test_dir)
+        assert parse(cache, make_draft(10)) == expected
+        assert (cache.hits, cache.misses) == (0, 10)
+        assert parse(cache, make_draft(10)) == expected
+        assert cache.hits == 10
+
+        # only the edited block is parsed again.
+        edited = parse(cache, make_draft(10, edited=3))
+        assert cache.misses == 11
+        assert edited['3.png'][0].subtitles[0].content == ['edited 3']
+
+        # as are the blocks using a changed style, also in a new session.
+        styles = extract_styles([{'style_id': 'red', 'text_data': {'color': 'darkred'}}, {'style_id': 'blue', 'text_data': {'color': 'blue'}}])
+        cache = ParseCache(store)
+        parse(cache, make_draft(10), styles=styles)
+        assert (cache.hits, cache.misses) == (5, 5)
+
+        # cached results are copies.
+        parse(cache, make_draft(10), styles=styles)['0.png'][0].subtitles[0].content.append('changed')
+        assert parse(cache, make_draft(10), styles=styles)['0.png'][0].subtitles[0].content == ['hello 0']
+        store.close()
+
+
+def test_parse_cache_is_bounded():
+    with tempfile.TemporaryDirectory() as test_dir:
+        store = StateStore(os.path.join(test_dir, 'state.db'))
+        cache = ParseCache(store, max_entries=4)
+        for i in range(10):
+            cache.put(str(i), {}, [i])
+        assert list(cache._entries) == ['6', '7', '8', '9']
+        # evicted blocks are still found before and after they are saved.
+        assert cache.get('0', {}) == [0]
+        cache.flush()
+        assert cache.get('1', {}) == [1]
+        assert len(cache._entries) == 4
+        assert (cache.hits, cache.misses) == (2, 0)
+
+        # without a state store, evicted blocks are parsed again.
+        cache = ParseCache(max_entries=4)
+        for i in range(10):
+            cache.put(str(i), {}, [i])
+        cache.flush()
+        assert cache.get('0', {}) is None
+        assert cache.get('9', {}) == [9]
+        store.close()
@@ -0,0 +1,204 @@
+import os
+import tempfile
+import time
+
+import pytest
+from PIL import Image
+
+from kksubs.data.subtitle.style import Style
+from kksubs.data.subtitle.style_attributes import Gaussian, OutlineData
+from kksubs.data.subtitle.subtitle import Subtitle, SubtitleGroup
+from kksubs.service.executor import EXECUTORS, get_start_methods
+from kksubs.service.scheduler import BASE_BUFFERS, ComposeScheduler, ComposeTask, count_style_layers, estimate_task_memory
+from kksubs.service.thread_budget import BLAS_THREAD_VARIABLES, ThreadBudget
+from kksubs.utils.sanitizers import to_memory_size
+
+
+def test_to_memory_size():
+    assert to_memory_size(None) is None
+    assert to_memory_size("512M") == 512 * 1024**2
+    assert to_memory_size("4G") == 4 * 1024**3
+    assert to_memory_size("4gb") == 4 * 1024**3
+    assert to_memory_size("100") == 100 * 1024**2
+    assert to_memory_size(2) == 2 * 1024**2
+
+
+def test_count_style_layers():
+    assert count_style_layers(Style()) == 1
+    assert count_style_layers(Style(outline_data=OutlineData(blur=2))) == 3
+    assert count_style_layers(Style(gaussian=Gaussian(value=3), styles=[Style(), Style(outline_data=OutlineData())])) == 4
+
+
+def test_estimate_task_memory():
+    with tempfile.TemporaryDirectory() as test_dir:
+        image_path = os.path.join(test_dir, '0.png')
+        Image.new('RGB', (100, 50)).save(image_path)
+        subtitle_group = SubtitleGroup(input_image_path=image_path, subtitles=[Subtitle(style=Style()), Subtitle(style=Style(outline_data=OutlineData()))])
+        assert estimate_task_memory(subtitle_group) == 100 * 50 * 4 * (BASE_BUFFERS + 2)
+
+
+def test_invalid_scheduler_arguments():
+    with pytest.raises(ValueError):
+        ComposeScheduler(jobs=0)
+    with pytest.raises(ValueError):
+        ComposeScheduler(max_memory=0)
+    with pytest.raises(ValueError):
+        ComposeScheduler(retries=-1)
+    with pytest.raises(ValueError):
+        ComposeScheduler(task_timeout=0)
+
+
+def test_workers_limited_by_memory():
+    tasks = [ComposeTask((i,), memory=100) for i in range(8)]
+    assert ComposeScheduler(jobs=4).get_num_workers(tasks) == 4
+    assert ComposeScheduler(jobs=4, max_memory=250).get_num_workers(tasks) == 2
+    assert ComposeScheduler(jobs=4, max_memory=50).get_num_workers(tasks) == 1
+    assert ComposeScheduler(jobs=4).get_num_workers(tasks[:1]) == 1
+
+
+def test_admission_respects_memory_budget():
+    scheduler = ComposeScheduler(jobs=4, max_memory=250)
+    scheduler._num_workers = 4
+    tasks = [ComposeTask((i,), memory=100) for i in range(3)]
+    assert scheduler._fits(tasks[0].memory)
+    scheduler._admit(tasks[0])
+    scheduler._admit(tasks[1])
+    assert not scheduler._fits(tasks[2].memory)
+
+    scheduler._release(tasks[0])
+    assert scheduler._fits(tasks[2].memory)
+    assert scheduler._running_memory == 100
+
+    # a task larger than the budget runs alone.
+    scheduler._release(tasks[1])
+    assert scheduler._fits(1000)
+
+
+def write_marker(i, directory):
+    with open(os.path.join(directory, str(i)), 'w') as writer:
+        writer.write(str(i))
+
+
+def fail_on_two(i, directory):
+    if i == 2:
+        raise RuntimeError('task failed')
+    write_marker(i, directory)
+
+
+def fail_first_attempt(i, directory):
+    # fails until a previous attempt has left a marker.
+    marker_path = os.path.join(directory, f'{i}.attempt')
+    if not os.path.exists(marker_path):
+        open(marker_path, 'w').close()
+        raise RuntimeError('first attempt')
+    write_marker(i, directory)
+
+
+def hang_on_two(i, directory):
+    if i == 2:
+        time.sleep(30)
+    write_marker(i, directory)
+
+
+@pytest.mark.parametrize('executor', list(EXECUTORS))
+def test_executors_run_all_tasks(executor):
+    with tempfile.TemporaryDirectory() as test_dir:
+        tasks = [ComposeTask((i, test_dir), memory=100) for i in range(6)]
+        ComposeScheduler(jobs=3, max_memory=250, executor=executor).run(write_marker, tasks)
+        assert sorted(os.listdir(test_dir)) == list(map(str, range(6)))
+
+
+@pytest.mark.parametrize('executor', list(EXECUTORS))
+def test_streamed_tasks(executor):
+    with tempfile.TemporaryDirectory() as test_dir:
+        read = []
+        def read_tasks():
+            for i in range(8):
+                read.append(i)
+                # tasks are submitted while the stream is read, and it is never read far ahead of them.
+                assert len(read) - len(os.listdir(test_dir)) <= 2 * 2 + 1
+                yield ComposeTask((i, test_dir))
+        assert ComposeScheduler(jobs=2, executor=executor).run(fail_on_two, read_tasks())[0].task.name == '2'
+        assert sorted(os.listdir(test_dir)) == [str(i) for i in range(8) if i != 2]
+        # a short stream runs like a list.
+        assert ComposeScheduler(jobs=4, executor=executor).run(write_marker, iter([ComposeTask((2, test_dir))])) == []
+        assert ComposeScheduler(jobs=4, executor=executor).run(write_marker, iter([])) == []
+        assert '2' in os.listdir(test_dir)
+
+
+@pytest.mark.parametrize('executor', list(EXECUTORS))
+def test_executors_report_task_errors(executor):
+    with tempfile.TemporaryDirectory() as test_dir:
+        tasks = [ComposeTask((i, test_dir), name=f'image{i}') for i in range(4)]
+        failures = ComposeScheduler(jobs=2, executor=executor).run(fail_on_two, tasks)
+        # other tasks are unaffected by the failure.
+        assert sorted(os.listdir(test_dir)) == ['0', '1', '3']
+        assert [failure.task.name for failure in failures] == ['image2']
+        assert isinstance(failures[0].error, RuntimeError)
+
+
+@pytest.mark.parametrize('executor', list(EXECUTORS))
+def test_failed_tasks_are_retried(executor):
+    with tempfile.TemporaryDirectory() as test_dir:
+        tasks = [ComposeTask((i, test_dir)) for i in range(3)]
+        assert ComposeScheduler(jobs=2, executor=executor, retries=0).run(fail_first_attempt, tasks)
+        tasks = [ComposeTask((i, test_dir)) for i in range(3, 6)]
+        assert ComposeScheduler(jobs=2, executor=executor, retries=1).run(fail_first_attempt, tasks) == []
+        assert all(task.attempts == 2 for task in tasks)
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread'])
+def test_stragglers_time_out(executor):
+    with tempfile.TemporaryDirectory() as test_dir:
+        tasks = [ComposeTask((i, test_dir)) for i in range(4)]
+        start_time = time.monotonic()
+        failures = ComposeScheduler(jobs=2, executor=executor, task_timeout=1).run(hang_on_two, tasks)
+        assert time.monotonic() - start_time < 10
+        assert [failure.task.name for failure in failures] == ['2']
+        assert isinstance(failures[0].error, TimeoutError)
+        assert sorted(name for name in os.listdir(test_dir)) == ['0', '1', '3']
+
+
+def test_deadlines_start_with_tasks():
+    # abandoned threads keep running, so later tasks wait for a thread without timing out.
+    def hang_below_two(i, directory):
+        if i < 2:
+            time.sleep(2.5)
+        write_marker(i, directory)
+    with tempfile.TemporaryDirectory() as test_dir:
+        tasks = [ComposeTask((i, test_dir)) for i in range(5)]
+        failures = ComposeScheduler(jobs=2, executor='thread', task_timeout=1).run(hang_below_two, tasks)
+        assert sorted(failure.task.name for failure in failures) == ['0', '1']
+        assert {'2', '3', '4'}.issubset(os.listdir(test_dir))
+
+
+def test_unknown_executor():
+    with pytest.raises(ValueError):
+        ComposeScheduler(executor='gpu')
+    with pytest.raises(ValueError):
+        ComposeScheduler(start_method='thread')
+
+
+@pytest.mark.skipif('forkserver' not in get_start_methods(), reason='forkserver is not available')
+def test_forkserver_workers():
+    with tempfile.TemporaryDirectory() as test_dir:
+        scheduler = ComposeScheduler(jobs=2, start_method='forkserver')
+        # the second pool reuses the server started by the first.
+        for start in [0, 3]:
+            tasks = [ComposeTask((i, test_dir)) for i in range(start, start + 3)]
+            assert scheduler.run(write_marker, tasks) == []
+        assert sorted(os.listdir(test_dir)) == list(map(str, range(6)))
+
+
+def test_thread_budget():
+    assert ThreadBudget(4, cpu_count=8).threads_per_worker == 2
+    assert ThreadBudget(16, cpu_count=8).threads_per_worker == 1
+    assert ThreadBudget(1, cpu_count=8).threads_per_worker == 8
+
+
+def test_thread_budget_environment():
+    budget = ThreadBudget(4, cpu_count=8)
+    previous = os.environ.get('OMP_NUM_THREADS')
+    with budget.environment():
+        assert all(os.environ[variable] == '2' for variable in BLAS_THREAD_VARIABLES)
+    assert os.environ.get('OMP_NUM_THREADS') == previous
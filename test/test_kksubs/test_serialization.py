@@ -1,5 +1,12 @@
+import os
+import pickle
+import time
 from typing import Type
 
+import pytest
+import yaml
+
+from common.data import codec
 from common.data.representable import RepresentableData
 from kksubs.data.subtitle.style_attributes import *
 from kksubs.data.subtitle.style import *
@@ -33,4 +40,150 @@ def test_subtitle_serialization():
 
 
 def test_subtitle_group_serialization():
-    assert_representations_equal(SubtitleGroup(), SubtitleGroup)
\ No newline at end of file
+    assert_representations_equal(SubtitleGroup(), SubtitleGroup)
+
+def test_fingerprints():
+    style = Style(text_data=TextData(font='abc', size=12), background=Background(path='abcd'))
+    group = SubtitleGroup(image_id='0.png', subtitles=[Subtitle(content=['hello'], style=style)])
+    fingerprint = group.fingerprint()
+    assert Style.deserialize(style.serialize()).fingerprint() == style.fingerprint()
+    assert len({style, Style.deserialize(style.serialize())}) == 1
+    # cached fingerprints are private, so they are not part of the data.
+    assert '_fingerprint' not in group.serialize() and "'_fingerprint'" not in repr(group)
+
+    # changing nested data changes the fingerprint of everything containing it.
+    style.text_data.size = 13
+    assert group.fingerprint() != fingerprint
+    style.text_data.size = 12
+    assert group.fingerprint() == fingerprint
+    assert TextData(size=12) != TextData(size=12.5)
+
+def test_copy_on_write():
+    parent = Style(style_id='parent', text_data=TextData(size=12), outline_data=OutlineData(size=3)).freeze()
+    fingerprint = parent.fingerprint()
+
+    style = parent.copy_on_write()
+    assert style is not parent and style.outline_data is parent.outline_data
+    style.style_id = 'child'
+    style.coalesce(Style(text_data=TextData(color='red')))
+    style.correct_values()
+    assert style.text_data.color == (255, 0, 0) and style.outline_data.size == 3
+    assert style.outline_data is not parent.outline_data
+    assert parent.fingerprint() == fingerprint and parent.text_data.color is None and parent.style_id == 'parent'
+
+    # shared data is frozen, so changes to the style taking it do not reach the style it came from.
+    other = Style()
+    other.coalesce(parent)
+    assert other.outline_data is parent.outline_data
+    other.correct_values()
+    assert parent.fingerprint() == fingerprint
+
+def test_slotted_data():
+    assert Style._fields[:2] == ('style_id', 'text_data') and OutlineData1._fields == OutlineData._fields
+    style = Style(style_id='a', text_data=TextData(size=12), outline_data_1=OutlineData1(size=2))
+    assert not hasattr(style, '__dict__')
+    with pytest.raises(AttributeError):
+        style.asset = Asset()
+
+    # pickled as values, keeping whether data is frozen and its fingerprint.
+    group = SubtitleGroup(image_id='0.png', subtitles=[Subtitle(content=['hello'], style=style.copy_on_write())])
+    fingerprint = group.fingerprint()
+    unpickled = pickle.loads(pickle.dumps(group))
+    assert unpickled == group and unpickled.fingerprint() == fingerprint
+    assert unpickled.subtitles[0].style.text_data._frozen and not unpickled._frozen
+    unpickled.subtitles[0].content = ['changed']
+    assert unpickled.fingerprint() != fingerprint
+
+    # data pickled by versions without slots.
+    legacy = TextData.__new__(TextData)
+    legacy.__setstate__({'font': 'abc', 'size': 12, 'color': None, 'stroke_size': None, 'stroke_color': None, 'text': None, 'alpha': None})
+    assert legacy == TextData(font='abc', size=12)
+
+def new_data(data_class):
+    return data_class.__new__(data_class)
+
+class LegacyPickle:
+    # pickles as data of the class with the given state, as an earlier version with fewer fields would.
+    def __init__(self, data_class, state):
+        self.data_class = data_class
+        self.state = state
+
+    def __reduce__(self):
+        return new_data, (self.data_class,), self.state
+
+def test_legacy_pickles_without_new_fields():
+    subtitle = LegacyPickle(Subtitle, {'content': ['hello'], 'style': None})
+    group = pickle.loads(pickle.dumps(LegacyPickle(SubtitleGroup, {
+        'image_id': '0.png', 'input_image_path': 'in.png', 'image_modified_time': 1, 'output_image_path': 'out.png', 'subtitles': [subtitle],
+    })))
+    assert group.image_fingerprint is None and group.subtitles[0].style_ids is None
+    assert group.image_id == '0.png' and group.subtitles[0].content == ['hello']
+    assert group.fingerprint() == pickle.loads(pickle.dumps(group)).fingerprint()
+
+    # pickled as values, without the last field.
+    fingerprint = SubtitleGroup(image_id='0.png').fingerprint()
+    state = (None, False) + SubtitleGroup(image_id='1.png')._field_values(SubtitleGroup(image_id='1.png'))[:-1]
+    group = pickle.loads(pickle.dumps(LegacyPickle(SubtitleGroup, state)))
+    assert group.image_id == '1.png' and group.image_fingerprint is None
+    assert group.fingerprint() != fingerprint
+
+def test_codec():
+    shared = Style(style_id='a', text_data=TextData(size=12, stroke_color=(0, 0, 0))).freeze()
+    groups = [
+        SubtitleGroup(image_id=f'{i}.png', subtitles=[Subtitle(content=['hello', str(i)], style=shared, style_ids=['a'])])
+        for i in range(3)
+    ]
+    matrix = StyleMatrix([StyleRow([Style(style_id='b')], context=ContextLayer('-'))])
+    value = {'groups': groups, 'matrix': matrix, 'ids': {'a', 'b'}, 'pair': (1, None)}
+
+    decoded = codec.loads(codec.dumps(value))
+    assert decoded['groups'] == groups and decoded['matrix'] == matrix
+    assert decoded['ids'] == {'a', 'b'} and decoded['pair'] == (1, None)
+    # tuples stay tuples, and shared data stays shared and frozen, with its fingerprint.
+    decoded_style = decoded['groups'][0].subtitles[0].style
+    assert decoded_style.text_data.stroke_color == (0, 0, 0)
+    assert decoded_style is decoded['groups'][2].subtitles[0].style and decoded_style._frozen
+    assert decoded_style._fingerprint[2] == shared.fingerprint()
+    assert not decoded['groups'][0]._frozen
+
+    with pytest.raises(ValueError):
+        codec.decode((codec.CODEC_VERSION + 1, None))
+    with pytest.raises(TypeError):
+        codec.encode(object())
+
+def make_subtitle_groups(num_groups):
+    styles = [Style(style_id=str(i), text_data=TextData(size=i)).corrected().freeze() for i in range(10)]
+    return [
+        SubtitleGroup(image_id=f'{i}.png', subtitles=[Subtitle(content=['hello', str(i)], style=styles[i % 10], style_ids=[str(i % 10)])])
+        for i in range(num_groups)
+    ]
+
+def serialize_subtitle_group(group:SubtitleGroup):
+    return dict(group.serialize(), subtitles=[subtitle.serialize() for subtitle in group.subtitles])
+
+# (dump, load) of lists of subtitle groups through the codec, pickle and YAML.
+ROUND_TRIPS = {
+    'codec': (codec.dumps, codec.loads),
+    'pickle': (lambda value: pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), pickle.loads),
+    'yaml': (
+        lambda value: yaml.dump(list(map(serialize_subtitle_group, value)), Dumper=getattr(yaml, 'CDumper', yaml.Dumper)),
+        lambda data: list(map(SubtitleGroup.deserialize, yaml.load(data, Loader=getattr(yaml, 'CLoader', yaml.Loader)))),
+    ),
+}
+
+def test_round_trips():
+    groups = make_subtitle_groups(20)
+    for name, (dump, load) in ROUND_TRIPS.items():
+        assert load(dump(groups)) == groups, name
+
+@pytest.mark.skipif(not os.environ.get('KKSUBS_BENCHMARK'), reason='benchmarks run with KKSUBS_BENCHMARK=1')
+def test_codec_benchmark():
+    # timings of round trips of many subtitle groups (run with KKSUBS_BENCHMARK=1 and -s).
+    groups = make_subtitle_groups(1000)
+    for name, (dump, load) in ROUND_TRIPS.items():
+        # the first round trip also generates the codecs of the data classes.
+        load(dump(groups))
+        start = time.perf_counter()
+        data = dump(groups)
+        load(data)
+        print(f"{name}: {(time.perf_counter() - start) * 1000:.1f} ms, {len(data)} bytes")
@@ -0,0 +1,242 @@
+import os
+import pickle
+import sqlite3
+import tempfile
+
+import pytest
+from PIL import Image
+
+from kksubs.data.subtitle.style import Style
+from kksubs.data.subtitle.style_attributes import Background, Mask
+from kksubs.data.subtitle.subtitle import Subtitle, SubtitleGroup
+from kksubs.service import sub_project
+from kksubs.service.state_store import SCHEMA_VERSION, Dependency, OutputRecord, StateStore, UnsupportedSchemaError, fingerprint_subtitle_group
+from kksubs.service.sub_project import SubtitleProjectService
+
+
+def test_state_store():
+    with tempfile.TemporaryDirectory() as test_dir:
+        store = StateStore(os.path.join(test_dir, 'state.db'))
+        assert store.get_version() == SCHEMA_VERSION
+        record = OutputRecord.from_subtitle_group(SubtitleGroup(image_id='0.png', image_modified_time=1), dependencies=[
+            Dependency('mask', 'mask.png', 'abc'), Dependency('font', 'font.ttf'),
+        ])
+        store.update('project', 'draft', [record])
+        store.update('project', 'draft', [OutputRecord('1.png', 'abc'), OutputRecord('2.png', 'def')])
+        store.update('other', 'draft', [OutputRecord('0.png', 'abc')])
+        store.remove('project', 'draft', ['2.png'])
+
+        assert sorted(store.read('project', 'draft')) == ['0.png', '1.png']
+        assert store.read('project', 'draft')['0.png'] == record
+        assert store.get('project', 'draft', '1.png') == OutputRecord('1.png', 'abc')
+        assert store.get('project', 'draft', '0.png') == record
+        assert store.get('project', 'draft', '2.png') is None
+
+        # dependencies are replaced with the output.
+        store.update('project', 'draft', [OutputRecord('0.png', 'abc', dependencies=[Dependency('font', 'font.ttf', 'def')])])
+        assert [dependency.fingerprint for dependency in store.get('project', 'draft', '0.png').dependencies] == ['def']
+        store.remove('project', 'draft')
+        assert store.read('project', 'draft') == {}
+        assert list(store.read('other', 'draft')) == ['0.png']
+        store.close()
+
+
+def test_fingerprints_are_relative_to_the_project():
+    def get_subtitle_group(project_directory, mask_path):
+        style = Style(background=Background(path=os.path.join(project_directory, 'background.png')), mask=Mask(path=mask_path))
+        return SubtitleGroup(
+            image_id='0.png', input_image_path=os.path.join(project_directory, 'images', '0.png'), image_modified_time=1,
+            output_image_path=os.path.join(project_directory, 'output', '0.png'), subtitles=[Subtitle(['hello'], style=style)],
+        )
+    mask_path = os.path.abspath(os.path.join('elsewhere', 'mask.png'))
+    first = os.path.abspath('project')
+    second = os.path.abspath(os.path.join('moved', 'project'))
+
+    fingerprint = fingerprint_subtitle_group(get_subtitle_group(first, mask_path), first)
+    assert fingerprint == fingerprint_subtitle_group(get_subtitle_group(second, mask_path), second)
+    assert fingerprint != fingerprint_subtitle_group(get_subtitle_group(first, mask_path), None)
+    # paths outside the project are hashed as they are; a project named like a prefix of another is not inside it.
+    assert fingerprint != fingerprint_subtitle_group(get_subtitle_group(first, os.path.abspath(os.path.join('other', 'mask.png'))), first)
+    assert fingerprint != fingerprint_subtitle_group(get_subtitle_group(first + '2', mask_path), first)
+
+
+def test_garbage_collection():
+    with tempfile.TemporaryDirectory() as test_dir:
+        store = StateStore(os.path.join(test_dir, 'state.db'))
+        store.put_parsed_blocks({'block': ({}, b'x' * 1000)})
+        for draft in ['old', 'recent']:
+            store.update('project', draft, [OutputRecord(f'{i}.png', 'x' * 1000) for i in range(100)])
+        store.read('project', 'old')
+        size = store.get_size()
+        assert store.collect_garbage(size) == 0
+
+        # least recently used first: the block, then the draft written before the other was read.
+        assert store.collect_garbage(size - 100 * 1000) == 2
+        assert store.get_parsed_block('block') is None
+        assert store.read('project', 'recent') == {}
+        assert len(store.read('project', 'old')) == 100
+        assert store.get_size() < size
+        store.close()
+
+
+def test_state_is_namespaced_by_project(service, write_draft, monkeypatch):
+    rendered = []
+    monkeypatch.setattr(sub_project, 'add_subtitles_to_image', lambda image, subtitles, project_directory: rendered.append(subtitles[0].content[0]) or image)
+    compose = lambda: service.add_subtitles(allow_multiprocessing=False, allow_incremental_updating=True, update_drafts=False)
+
+    service.project_id = 'first'
+    write_draft(service, 'hello')
+    compose()
+    service.project_id = 'second'
+    write_draft(service, 'world')
+    compose()
+    assert len(rendered) == 8
+    assert sorted(service.get_state_store().read(service.get_state_namespace(), 'draft')) == [f'{i}.png' for i in range(4)]
+
+    statistics = service.get_state_store().get_statistics()
+    assert (statistics['outputs_reused'], statistics['outputs_rendered']) == (0, 8)
+    assert 'outputs reused 0%' in service.get_state_store().summary()
+
+
+def test_state_store_from_newer_version():
+    with tempfile.TemporaryDirectory() as test_dir:
+        path = os.path.join(test_dir, 'state.db')
+        with sqlite3.connect(path) as connection:
+            connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION + 1}')
+        connection.close()
+        with pytest.raises(UnsupportedSchemaError):
+            StateStore(path)
+
+        # compose keeps records in memory instead, and leaves the database to the newer version.
+        workspace = os.path.join(test_dir, 'workspace')
+        os.makedirs(workspace)
+        service = SubtitleProjectService(workspace_directory=workspace, state_store_path=path)
+        service.get_state_store().update('project', 'draft', [OutputRecord('0.png', 'abc')])
+        assert service.get_state_store().path == ':memory:'
+        with sqlite3.connect(path) as connection:
+            assert connection.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION + 1
+        connection.close()
+
+
+def test_interrupted_compose_resumes(service, write_draft, monkeypatch):
+    write_draft(service, 'hello')
+    service.add_subtitles(allow_multiprocessing=False, allow_incremental_updating=True, update_drafts=False)
+
+    rendered = []
+    add_subtitles_to_image = sub_project.add_subtitles_to_image
+    def crash_on_third_image(image, subtitles, project_directory):
+        if len(rendered) == 2:
+            raise KeyboardInterrupt
+        rendered.append(subtitles[0].content[0])
+        return add_subtitles_to_image(image, subtitles, project_directory)
+    monkeypatch.setattr(sub_project, 'add_subtitles_to_image', crash_on_third_image)
+
+    write_draft(service, 'world')
+    with pytest.raises(KeyboardInterrupt):
+        service.add_subtitles(allow_multiprocessing=False, allow_incremental_updating=True, update_drafts=False)
+    completed = list(rendered)
+    assert len(completed) == 2
+
+    rendered.clear()
+    monkeypatch.setattr(sub_project, 'add_subtitles_to_image', lambda image, subtitles, project_directory: rendered.append(subtitles[0].content[0]) or image)
+    service.add_subtitles(allow_multiprocessing=False, allow_incremental_updating=True, update_drafts=False)
+    assert sorted(rendered + completed) == [f'world {i}' for i in range(4)]
+
+    rendered.clear()
+    service.add_subtitles(allow_multiprocessing=False, allow_incremental_updating=True, update_drafts=False)
+    assert rendered == []
+
+
+def test_legacy_state_is_imported(service, write_draft, monkeypatch):
+    write_draft(service, 'hello')
+    service.add_subtitles(allow_multiprocessing=False, allow_incremental_updating=True, update_drafts=False)
+    # as written by earlier versions, before the state store.
+    service.get_state_store().remove(service.workspace_dir, 'draft')
+    os.makedirs(service.state_directory, exist_ok=True)
+    with open(service.get_state_path('draft'), 'wb') as writer:
+        pickle.dump({f'{i}.png':SubtitleGroup(image_id=f'{i}.png') for i in range(4)}, writer)
+
+    previous_state = service.read_previous_state('draft')
+    assert sorted(previous_state) == [f'{i}.png' for i in range(4)]
+    assert not os.path.exists(service.get_state_path('draft'))
+
+
+def test_changed_dependencies_invalidate_outputs(service, monkeypatch):
+    rendered = []
+    monkeypatch.setattr(sub_project, 'add_subtitles_to_image', lambda image, subtitles, project_directory: rendered.append(subtitles[0].content[0]) or image)
+    compose = lambda: service.add_subtitles(allow_multiprocessing=False, allow_incremental_updating=True, update_drafts=False)
+
+    background_path = os.path.join(service.workspace_dir, 'background.png')
+    Image.new('RGBA', (80, 60), (0, 0, 0, 0)).save(background_path)
+    with open(os.path.join(service.drafts_dir, 'draft.txt'), 'w') as writer:
+        writer.write('\n'.join(
+            f'image_id: {i}.png\n' + ('background.path: background.png\n' if i < 2 else '') + f'content: hello {i}\n' for i in range(4)
+        ))
+    compose()
+    assert len(rendered) == 4
+
+    rendered.clear()
+    compose()
+    assert rendered == []
+
+    Image.new('RGBA', (80, 60), (255, 0, 0, 128)).save(background_path)
+    compose()
+    assert sorted(rendered) == ['hello 0', 'hello 1']
+
+
+def write_styles(service, red_color):
+    with open(service.styles_path, 'w') as writer:
+        writer.write(
+            f'- style_id: red\n  text_data:\n    color: {red_color}\n    size: 40\n'
+            '- style_id: large(red)\n  text_data:\n    size: 90\n'
+            '- style_id: blue\n  text_data:\n    color: blue\n'
+            '- style_id: unused\n  text_data:\n    color: green\n'
+        )
+
+
+def test_changed_styles_invalidate_outputs(service, monkeypatch):
+    rendered = []
+    monkeypatch.setattr(sub_project, 'add_subtitles_to_image', lambda image, subtitles, project_directory: rendered.append(subtitles[0].content[0]) or image)
+    compose = lambda: service.add_subtitles(allow_multiprocessing=False, allow_incremental_updating=True, update_drafts=False)
+
+    write_styles(service, 'red')
+    with open(os.path.join(service.drafts_dir, 'draft.txt'), 'w') as writer:
+        writer.write('\n'.join(f'image_id: {i}.png\n{style}: hello {i}\n' for i, style in enumerate(['red', 'large', 'blue', 'content'])))
+    compose()
+    assert len(rendered) == 4
+
+    # a change to a parent style reaches the styles inheriting from it.
+    rendered.clear()
+    write_styles(service, 'darkred')
+    compose()
+    assert sorted(rendered) == ['hello 0', 'hello 1']
+
+    rendered.clear()
+    with open(service.styles_path, 'a') as writer:
+        writer.write('    size: 20\n')
+    compose()
+    assert rendered == []
+
+
+def test_drafts_are_streamed(service, monkeypatch):
+    rendered = []
+    monkeypatch.setattr(sub_project, 'add_subtitles_to_image', lambda image, subtitles, project_directory: rendered.append(subtitles[0].content[0]) or image)
+    output_dir = os.path.join(service.outputs_dir, 'draft')
+    os.makedirs(output_dir)
+    open(os.path.join(output_dir, 'stale.png'), 'w').close()
+
+    # later blocks of an image replace earlier ones, unless they are hidden.
+    with open(os.path.join(service.drafts_dir, 'draft.txt'), 'w') as writer:
+        writer.write(
+            'image_id: 0.png\ncontent: old\nimage_id: 1.png\ncontent: one\nimage_id: 0.png\ncontent: new\n'
+            'image_id: 1.png\nhide:\nimage_id: 2.png\ncontent: two\n'
+        )
+    # the draft is read once, so blocks are matched against the lines they were parsed from.
+    reads = []
+    read_draft_lines = sub_project.read_draft_lines
+    monkeypatch.setattr(sub_project, 'read_draft_lines', lambda draft_path: reads.append(draft_path) or read_draft_lines(draft_path))
+    service.add_subtitles(allow_multiprocessing=False, allow_incremental_updating=True, update_drafts=False)
+    assert len(reads) == 1
+    assert sorted(rendered) == ['new', 'one', 'two']
+    assert sorted(os.listdir(output_dir)) == ['0.png', '1.png', '2.png', sub_project.MANIFEST_FILENAME]
+    assert sorted(service.read_previous_state('draft')) == ['0.png', '1.png', '2.png']
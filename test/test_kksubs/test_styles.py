@@ -0,0 +1,72 @@
+import os
+
+from kksubs.data.subtitle.style_row_enum import STYLE_ROW_ENUM
+from kksubs.service.extraction import style_cache
+from kksubs.service.extraction.style import extract_styles, get_style_fingerprints
+from kksubs.service.extraction.style_cache import StyleCache
+
+
+def test_matrix_styles_are_built_on_demand():
+    styles = extract_styles([
+        {'style_id': 'red', 'text_data': {'color': 'red'}},
+        {'matrix': [
+            {'row': {'row_id': 'grid4_complete'}},
+            {'context': {'delimiter': ''}},
+            {'row': {'styles': [{'style_id': 'red', 'text_data': {'size': 10}}, {'style_id': 'blue', 'text_data': {'color': 'blue'}}]}},
+        ]},
+        {'style_id': 'blue(red03)'},
+    ])
+    assert len(styles) == 16 + 2 + 2 * 16
+    assert repr(styles).startswith('StyleRegistry(1 style(s), 1 matrix source(s), 1 looked up)')
+
+    # the matrix overrides the earlier red style, and the later blue style conflicts with the matrix.
+    assert styles['red'].text_data.size == 10 and styles['red'].text_data.color is None
+    assert styles['blue'].text_data.color == 'blue'
+    style = styles['red12']
+    assert style.style_id == 'red12' and style.box_data.grid4 == [1, 2] and style.text_data.size == 10
+    assert styles.get('red-12') is None and 'red44' not in styles
+    assert get_style_fingerprints(styles).get('red12') == style.fingerprint()
+    assert get_style_fingerprints(styles).get('red44') is None
+
+    # contexts do not change the built-in rows.
+    assert STYLE_ROW_ENUM.grid4_complete.value.context.delimiter == '-'
+
+
+def test_inheritance_is_order_independent(caplog):
+    styles = extract_styles([
+        {'style_id': 'title(big, red)', 'box_data': {'align_v': 'top'}},
+        {'style_id': 'big(base)', 'text_data': {'size': 90}},
+        {'style_id': 'red(base)', 'text_data': {'color': 'red', 'size': 10}},
+        {'style_id': 'base', 'outline_data': {'size': 3}},
+        {'style_id': 'a(b)'},
+        {'style_id': 'b(c, missing)'},
+        {'style_id': 'c(a)'},
+    ])
+    title = styles['title']
+    assert (title.text_data.size, title.text_data.color, title.box_data.align_v) == (90, 'red', 'top')
+    # resolved parents are shared by their descendants.
+    assert title.outline_data is styles['big'].outline_data is styles['base'].outline_data
+
+    assert 'Style inheritance cycle a -> b -> c -> a' in caplog.text
+    assert 'Style ID missing not found.' in caplog.text
+    assert set(styles) == {'title', 'big', 'red', 'base', 'a', 'b', 'c'}
+
+
+def test_compiled_styles_are_cached(tmp_path, monkeypatch):
+    contents = b"- style_id: red\n  text_data:\n    color: red\n- style_id: big(red)\n  text_data:\n    size: 90\n"
+    cache = StyleCache(str(tmp_path))
+    styles = cache.get(contents)
+    assert cache.get(contents) is styles and (cache.hits, cache.misses) == (1, 1)
+
+    # another run loads the compiled styles without parsing styles.yml.
+    monkeypatch.setattr(style_cache.yaml, 'safe_load', None)
+    cache = StyleCache(str(tmp_path))
+    loaded = cache.get(contents)
+    assert (cache.hits, cache.misses) == (1, 0)
+    assert get_style_fingerprints(loaded).get('big') == get_style_fingerprints(styles).get('big')
+    assert loaded['big'].text_data.color == 'red'
+
+    monkeypatch.undo()
+    changed = cache.get(contents.replace(b'90', b'80'))
+    assert cache.misses == 1 and changed['big'].text_data.size == 80
+    assert len(os.listdir(tmp_path)) == 2
@@ -0,0 +1,68 @@
+from kksubs.service.extraction.style import extract_styles
+from kksubs.service.extraction.subtitle import extract_subtitle_groups
+from kksubs.service.extraction.tokenizer import (
+    HIDE, IMAGE_ID, LINE, SEP, get_shown_block_lines, read_draft_lines, read_image_blocks, tokenize_draft, tokenize_lines,
+)
+
+
+def test_tokenize_draft():
+    draft = "# comment\nimage_id: 1.png\ncontent: hello\n  sep: again\nhide:\n\nimage_id: 2.png\nplain text"
+    tokens = list(tokenize_draft(draft))
+    assert [(token.kind, token.line_number) for token in tokens] == [
+        (IMAGE_ID, 2), (LINE, 3), (SEP, 4), (HIDE, 5), (LINE, 6), (IMAGE_ID, 7), (LINE, 8)
+    ]
+    assert (tokens[1].key, tokens[1].value) == ("content", " hello")
+    assert tokens[-1].key is None
+
+    blocks = list(read_image_blocks(tokens))
+    assert [block.image_id for block in blocks] == ["1.png", "2.png"]
+    assert blocks[0].hidden and not blocks[1].hidden
+    segments = blocks[0].get_segments()
+    assert [[token.text for token in segment] for segment in segments] == [["content: hello"], ["again", "hide:"]]
+
+
+def test_lines_outside_blocks_are_ignored():
+    blocks = list(read_image_blocks(tokenize_draft("stray line\nimage_id:\nignored\nimage_id: 1.png\n")))
+    assert [block.image_id for block in blocks] == ["1.png"]
+    assert not blocks[0].has_body
+
+
+def test_draft_lines(tmp_path):
+    draft_path = tmp_path / "draft.txt"
+    for draft in ["", "a", "a\n", "a\n\nb", "\n"]:
+        draft_path.write_text(draft, encoding="utf-8")
+        assert list(read_draft_lines(str(draft_path))) == draft.split("\n")
+
+    draft = "image_id: 1.png\nold\nimage_id: 2.png\nimage_id: 1.png\nnew\nimage_id: 2.png\nhide:\nimage_id: 3.png\nhide:"
+    assert get_shown_block_lines(tokenize_lines(draft.split("\n"))) == {"1.png": 4, "2.png": 3}
+
+
+def test_unknown_keys_are_text(tmp_path):
+    (tmp_path / "1.png").touch()
+    styles = extract_styles([])
+    groups = extract_subtitle_groups("draft", "image_id: 1.png\ncontent: Hello.\nMr. Smith: hi", styles, str(tmp_path), str(tmp_path))
+    assert groups["1.png"][0].subtitles[0].content == ["Hello.", "Mr. Smith: hi"]
+
+
+def test_styles_are_not_changed_by_drafts(tmp_path):
+    (tmp_path / "1.png").touch()
+    styles = extract_styles([{"style_id": "red", "text_data": {"color": "red"}}])
+    draft = "image_id: 1.png\nstyle_id: red\ntext_data.size: 20\ncontent: a\nred: b\ntext_data.color: blue\ncontent: c"
+    groups = extract_subtitle_groups("draft", draft, styles, str(tmp_path), str(tmp_path))
+    subtitles = groups["1.png"][0].subtitles
+    assert [subtitle.style.text_data.size for subtitle in subtitles] == [20, 60, 60]
+    assert styles["red"].text_data.size is None and styles["red"].text_data.color == "red"
+
+
+def test_identical_styles_are_shared(tmp_path):
+    (tmp_path / "1.png").touch()
+    (tmp_path / "2.png").touch()
+    styles = extract_styles([{"style_id": "red", "text_data": {"color": "red"}}])
+    draft = "image_id: 1.png\nred: a\ncontent: b\nred: c\nimage_id: 2.png\ncontent: d\nred: e"
+    groups = extract_subtitle_groups("draft", draft, styles, str(tmp_path), str(tmp_path))
+    first, plain, second = groups["1.png"][0].subtitles
+    assert first.style is second.style and first.style._frozen
+    assert plain.style is not first.style
+    # across images too.
+    assert [subtitle.style for subtitle in groups["2.png"][0].subtitles] == [plain.style, first.style]
+    assert groups["2.png"][0].subtitles[1].style is first.style